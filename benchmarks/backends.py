@@ -0,0 +1,181 @@
+# benchmarks/backends.py
+"""Throughput and accuracy of each enrichment backend against the PyTorch baseline.
+
+    python benchmarks/backends.py --images data/raw/media/blobs --limit 300
+    python benchmarks/backends.py --modes torch,openvino,openvino-int8 --min-recall 0.97
+
+Every mode runs the same images through enrich.py's decode, prefilter and
+batching path, so images/s is what a real run would see. Detections are
+compared with the torch results image by image: a box counts as kept when
+the baseline has a box of the same class overlapping it by ``--iou`` or
+more. Recall and precision are relative to torch, not to ground truth.
+The fastest mode within ``--min-recall`` and ``--min-precision`` is
+reported as the recommendation. Without ``--images``, synthetic noise
+images are used, which are fine for throughput but detect nothing.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic import write_images  # noqa: E402
+from src import enrich  # noqa: E402
+
+MODES = ("torch", "onnx", "onnx-int8", "openvino", "openvino-int8")
+
+
+def parse_mode(mode):
+    """'openvino-int8' -> ('openvino', True)."""
+    backend, _, precision = mode.partition("-")
+    if backend not in enrich.BACKENDS or precision not in ("", "int8"):
+        raise ValueError(f"unknown mode {mode!r}; expected one of {', '.join(MODES)}")
+    return backend, precision == "int8"
+
+
+def iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes."""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union else 0.0
+
+
+def match_boxes(baseline, candidate, threshold=0.5):
+    """Greedily pair candidate boxes with baseline boxes of the same class.
+
+    Boxes are (class_name, confidence, x1, y1, x2, y2). Returns a list of
+    (baseline box, candidate box, iou) pairs.
+    """
+    unmatched = list(baseline)
+    pairs = []
+    for box in sorted(candidate, key=lambda b: -b[1]):
+        scored = [(iou(box[2:], other[2:]), other) for other in unmatched if other[0] == box[0]]
+        best = max(scored, default=(0.0, None), key=lambda s: s[0])
+        if best[1] is not None and best[0] >= threshold:
+            unmatched.remove(best[1])
+            pairs.append((best[1], box, best[0]))
+    return pairs
+
+
+def accuracy_delta(baseline, candidate, threshold=0.5):
+    """Compare {image_hash: boxes} from a mode with the baseline's."""
+    pairs, baseline_boxes, candidate_boxes, changed = [], 0, 0, 0
+    for image_hash in baseline.keys() | candidate.keys():
+        expected, found = baseline.get(image_hash, []), candidate.get(image_hash, [])
+        matched = match_boxes(expected, found, threshold)
+        pairs.extend(matched)
+        baseline_boxes += len(expected)
+        candidate_boxes += len(found)
+        changed += not (len(matched) == len(expected) == len(found))
+    return {
+        "recall": round(len(pairs) / baseline_boxes, 4) if baseline_boxes else 1.0,
+        "precision": round(len(pairs) / candidate_boxes, 4) if candidate_boxes else 1.0,
+        "mean_iou": round(statistics.fmean(p[2] for p in pairs), 4) if pairs else None,
+        "confidence_delta": round(statistics.fmean(c[1] - b[1] for b, c, _ in pairs), 4) if pairs else None,
+        "images_changed": changed,
+    }
+
+
+def bench_mode(mode, messages, batch_size):
+    """Load (exporting on first use) and run one mode; returns (stats, {image_hash: boxes})."""
+    backend, int8 = parse_mode(mode)
+    started = time.perf_counter()
+    model = enrich.load_model(backend, int8)
+    load_seconds = time.perf_counter() - started
+
+    # Warm-up: the first call allocates buffers and, for OpenVINO, compiles the graph
+    enrich.run_enrichment(messages[:batch_size], model, batch_size)
+    started = time.perf_counter()
+    _, processed, fresh = enrich.run_enrichment(messages, model, batch_size)
+    seconds = time.perf_counter() - started
+    return {
+        "images": len(processed),
+        "inferred": len(fresh),
+        "seconds": round(seconds, 3),
+        "images_per_s": round(len(processed) / seconds, 1) if seconds else 0.0,
+        "load_seconds": round(load_seconds, 2),
+    }, fresh
+
+
+def recommend(results, min_recall, min_precision):
+    """The fastest mode whose detections stay within the accuracy bounds."""
+    acceptable = [
+        (stats["images_per_s"], mode) for mode, stats in results.items()
+        if stats.get("recall", 1.0) >= min_recall and stats.get("precision", 1.0) >= min_precision
+    ]
+    return max(acceptable)[1] if acceptable else None
+
+
+def image_messages(directory, limit):
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    return [{"message_id": i, "file_path": path, "channel": "bench"} for i, path in enumerate(sorted(paths)[:limit])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default="torch,onnx,openvino,openvino-int8",
+                        help=f"comma-separated subset of {','.join(MODES)}; torch always runs as the baseline")
+    parser.add_argument("--images", help="directory of real images (default: synthetic)")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=enrich.BATCH_SIZE)
+    parser.add_argument("--image-size", type=int, default=enrich.IMAGE_SIZE)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--min-precision", type=float, default=0.95)
+    parser.add_argument("--output", default="backend_results.json")
+    args = parser.parse_args()
+
+    modes = ["torch"] + [m for m in args.modes.split(",") if m != "torch"]
+    for mode in modes:
+        parse_mode(mode)
+    enrich.IMAGE_SIZE = args.image_size
+
+    if args.images:
+        messages = image_messages(args.images, args.limit)
+    else:
+        print("⚠️ No --images given: synthetic images measure speed only, accuracy needs real photos")
+        paths = write_images(tempfile.mkdtemp(prefix="backend-bench-"), args.limit)
+        messages = [{"message_id": i, "file_path": p, "channel": "bench"} for i, p in enumerate(paths)]
+
+    results, baseline = {}, None
+    for mode in modes:
+        print(f"⏱️ {mode} ...")
+        try:
+            stats, boxes = bench_mode(mode, messages, args.batch_size)
+        except Exception as e:  # e.g. openvino or onnxruntime not installed
+            if mode == "torch":
+                sys.exit(f"❌ The torch baseline failed: {e}")
+            print(f"❌ {mode} failed: {e}")
+            continue
+        if baseline is None:
+            baseline, torch_rate = boxes, stats["images_per_s"]
+        else:
+            stats.update(accuracy_delta(baseline, boxes, args.iou))
+        stats["speedup"] = round(stats["images_per_s"] / torch_rate, 2) if torch_rate else None
+        results[mode] = stats
+        print(json.dumps(stats, indent=2))
+
+    best = recommend(results, args.min_recall, args.min_precision)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"image_size": args.image_size, "images": len(messages), "results": results,
+                   "recommended": best}, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+    if best:
+        backend, int8 = parse_mode(best)
+        print(f"✅ Fastest acceptable mode: {best} (ENRICH_BACKEND={backend} ENRICH_INT8={str(int8).lower()})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+# benchmarks/run.py
+"""Throughput and latency benchmarks for the scrape, load, extract, enrich and API hot paths.
+
+    python benchmarks/run.py                        # scrape, extract, enrich, startup (no database needed)
+    python benchmarks/run.py --with-db              # also load and API, against the DB_* database
+    python benchmarks/run.py --compare baseline.json --tolerance 0.15
+
+Scrape runs against a mock Telegram client and enrich against a constant-time
+model stand-in (``--real-model`` loads YOLO), so both measure our pipeline
+rather than Telegram or the GPU. Load and API need Postgres: load.py relies
+on COPY and ON CONFLICT, so there is no SQLite stand-in. Load only writes
+``bench_*`` channels and removes them afterwards; the API benchmark reads
+whatever the pipeline has built. Results are written as JSON; ``--compare``
+exits non-zero when a throughput or latency figure regresses past the
+tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import startup  # noqa: E402
+from benchmarks.synthetic import (  # noqa: E402
+    ConstantTimeModel, MockTelegramClient, message_text, write_images, write_message_tree,
+)
+
+SCALES = {
+    "small": dict(channels=3, messages_per_channel=500, load_days=5, load_per_day=1000,
+                  images=64, api_requests=200, api_concurrency=16, extract_messages=100_000),
+    "medium": dict(channels=8, messages_per_channel=5000, load_days=20, load_per_day=2000,
+                   images=512, api_requests=2000, api_concurrency=32, extract_messages=1_000_000),
+}
+
+API_ENDPOINTS = {
+    "top_products": "/api/reports/top-products?limit=10",
+    "channel_activity": "/api/channels/{channel}/activity",
+    "activity_timeseries": "/api/channels/{channel}/activity/timeseries?granularity=week",
+    "channel_activity_report": "/api/reports/channel-activity?channels={channel}",
+    "search_messages": "/api/search/messages?query=paracetamol&limit=20",
+}
+
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds else 0.0
+
+
+# === Stages ===
+def bench_scrape(params, workdir, latency=0.0):
+    """Scrape synthetic channels from the mock client into ``workdir``."""
+    from src import scrape
+
+    client = MockTelegramClient(messages_per_channel=params["messages_per_channel"], latency=latency)
+    channels = [f"bench_{i}" for i in range(params["channels"])]
+    saved = scrape.client, scrape.initial_limit, os.getcwd()
+    scrape.client, scrape.initial_limit = client, params["messages_per_channel"]
+    os.chdir(workdir)
+    try:
+        started = time.perf_counter()
+        results = asyncio.run(scrape.scrape_channels(channels))
+        seconds = time.perf_counter() - started
+    finally:
+        scrape.client, scrape.initial_limit = saved[0], saved[1]
+        os.chdir(saved[2])
+    messages = sum(r["messages"] for r in results)
+    return {
+        "messages": messages,
+        "seconds": round(seconds, 3),
+        "messages_per_s": rate(messages, seconds),
+        "downloads": client.downloads,
+        "media_reused": sum(r["media_skipped"] for r in results),
+    }
+
+
+def bench_load(params, workdir):
+    """Bulk-load a synthetic JSONL tree into raw.telegram_messages, then clean it up."""
+    from src import load
+
+    raw_dir = os.path.join(workdir, "raw")
+    channels = [f"bench_{i}" for i in range(params["channels"])]
+    total = write_message_tree(raw_dir, channels, params["load_days"], params["load_per_day"])
+    conn = load.get_connection()
+    try:
+        started = time.perf_counter()
+        rows_read, rows_merged, files_loaded, _ = load.load_messages(conn, raw_dir=raw_dir)
+        seconds = time.perf_counter() - started
+
+        # A second run should only consult the manifest
+        started = time.perf_counter()
+        load.load_messages(conn, raw_dir=raw_dir)
+        rerun_seconds = time.perf_counter() - started
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM raw.telegram_messages WHERE channel = ANY(%s);", (channels,))
+            cursor.execute("DELETE FROM raw.loaded_files WHERE file_path LIKE %s;", (f"{raw_dir}%",))
+        conn.commit()
+        conn.close()
+    return {
+        "messages": total,
+        "rows_merged": rows_merged,
+        "files": files_loaded,
+        "seconds": round(seconds, 3),
+        "messages_per_s": rate(rows_read, seconds),
+        "rerun_seconds": round(rerun_seconds, 3),
+    }
+
+
+def bench_extract(params, seed=0):
+    """Dictionary matching and price parsing over synthetic messages; no database involved."""
+    from src import extract
+
+    rng = random.Random(seed)
+    texts = [f"{message_text(rng)} {rng.randint(10, 5000)} birr" for _ in range(params["extract_messages"])]
+    messages = [{"message_id": i, "channel": "bench", "date": None, "text": text} for i, text in enumerate(texts)]
+    index = extract.load_index()
+    started = time.perf_counter()
+    mentions = []
+    for i in range(0, len(messages), extract.BATCH_SIZE):
+        mentions.extend(extract.extract_mentions(messages[i:i + extract.BATCH_SIZE], index))
+    seconds = time.perf_counter() - started
+    return {
+        "messages": len(messages),
+        "mentions": len(mentions),
+        "seconds": round(seconds, 3),
+        "messages_per_s": rate(len(messages), seconds),
+        "chars_per_s": rate(sum(len(t) for t in texts), seconds),
+        "automaton": "pure-python" if isinstance(index.automaton, extract.Automaton) else "pyahocorasick",
+    }
+
+
+def bench_enrich(params, workdir, real_model=False, seconds_per_image=0.0, duplicate_ratio=0.25):
+    """Decode, batch and run the model over synthetic images; no database involved."""
+    from src import enrich
+
+    paths = write_images(os.path.join(workdir, "images"), params["images"], duplicate_ratio)
+    messages = [{"message_id": i, "file_path": path, "channel": "bench"} for i, path in enumerate(paths)]
+    model = enrich.load_model() if real_model else ConstantTimeModel(seconds_per_image)
+    started = time.perf_counter()
+    _, processed, fresh = enrich.run_enrichment(messages, model)
+    seconds = time.perf_counter() - started
+    return {
+        "images": len(processed),
+        "inferred": len(fresh),
+        "seconds": round(seconds, 3),
+        "images_per_s": rate(len(processed), seconds),
+        "model": enrich.MODEL_PATH if real_model else f"constant({seconds_per_image}s/image)",
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+async def _drive(client, path, requests, concurrency):
+    latencies, errors = [], 0
+    queue = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in queue:
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def _bench_api(params, channel, cache):
+    import httpx
+    from src.api import main
+    from src.api.database import dispose_async_engine
+
+    if not cache:
+        main.response_cache.ttl = 0  # every entry expires at once
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, template in API_ENDPOINTS.items():
+                path = template.format(channel=channel)
+                await client.get(path)  # warm-up: pool connection, cache entry
+                latencies, errors, seconds = await _drive(
+                    client, path, params["api_requests"], params["api_concurrency"]
+                )
+                results[name] = {
+                    "p50_ms": round(statistics.median(latencies) * 1000, 2),
+                    "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                    "rps": rate(len(latencies), seconds),
+                    "errors": errors,
+                }
+    finally:
+        await dispose_async_engine()
+    return results
+
+
+def bench_api(params, channel, cache=True):
+    """Latency and throughput per endpoint, in-process through the ASGI app."""
+    return asyncio.run(_bench_api(params, channel, cache))
+
+
+def bench_startup(runs=3):
+    return {name: startup.summarize([startup.measure(code) for _ in range(runs)])
+            for name, code in startup.TARGETS.items()}
+
+
+# === Results ===
+def metadata(args, params):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": args.scale,
+        "params": params,
+    }
+
+
+def flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def compare(results, baseline, tolerance):
+    """Return regressions: lower throughput (*_per_s, rps) or higher latency (*_ms, *seconds)."""
+    current = dict(flatten(results))
+    regressions = []
+    for key, before in flatten(baseline):
+        after = current.get(key)
+        if not isinstance(before, (int, float)) or not isinstance(after, (int, float)) or not before:
+            continue
+        if key.endswith(("_per_s", "rps")) and after < before * (1 - tolerance):
+            regressions.append(f"{key}: {before} -> {after}")
+        elif key.endswith(("_ms", "seconds", "median_s")) and after > before * (1 + tolerance):
+            regressions.append(f"{key}: {before} -> {after}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--stages", help="comma-separated subset of scrape,load,extract,enrich,api,startup")
+    parser.add_argument("--with-db", action="store_true", help="include the load and API stages")
+    parser.add_argument("--real-model", action="store_true", help="benchmark enrich with the YOLO model")
+    parser.add_argument("--model-seconds-per-image", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="seconds per mock API call")
+    parser.add_argument("--api-channel", default="tikvahpharma")
+    parser.add_argument("--api-no-cache", action="store_true")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="baseline results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    params = SCALES[args.scale]
+    stages = args.stages.split(",") if args.stages else (
+        ["scrape", "load", "extract", "enrich", "api", "startup"] if args.with_db
+        else ["scrape", "extract", "enrich", "startup"]
+    )
+    workdir = tempfile.mkdtemp(prefix="telegram-bench-")
+    results = {}
+    try:
+        for stage in stages:
+            print(f"⏱️ {stage} ...")
+            if stage == "scrape":
+                results[stage] = bench_scrape(params, workdir, args.telegram_latency)
+            elif stage == "load":
+                results[stage] = bench_load(params, workdir)
+            elif stage == "extract":
+                results[stage] = bench_extract(params)
+            elif stage == "enrich":
+                results[stage] = bench_enrich(params, workdir, args.real_model, args.model_seconds_per_image)
+            elif stage == "api":
+                results[stage] = bench_api(params, args.api_channel, cache=not args.api_no_cache)
+            elif stage == "startup":
+                results[stage] = bench_startup()
+            else:
+                parser.error(f"unknown stage {stage!r}")
+            print(json.dumps(results[stage], indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"meta": metadata(args, params), "results": results}, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"❌ Regression {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/startup.py
+"""Cold start times for the API and each pipeline stage.
+
+Every sample runs in a fresh interpreter, so nothing is already imported or
+cached. The interpreter's own start-up time is measured separately and
+reported alongside, so the numbers show what our code adds on top of it.
+
+    python benchmarks/startup.py [--runs 5] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# What "starting" means for each target: importing it, plus app startup for the API
+TARGETS = {
+    "api": (
+        "from fastapi.testclient import TestClient\n"
+        "import src.api.main as m\n"
+        "with TestClient(m.app): pass"
+    ),
+    "scrape": "import src.scrape",
+    "load": "import src.load",
+    "enrich": "import src.enrich",
+    "pipeline": "import pipeline",
+}
+
+_TIMER = (
+    "import time, sys\n"
+    "started = time.perf_counter()\n"
+    "{code}\n"
+    "sys.stdout.write(repr(time.perf_counter() - started))\n"
+)
+
+
+def clean_env():
+    # No database or Telegram settings: start-up must not need either
+    return {
+        key: value for key, value in os.environ.items()
+        if not key.startswith(("DB_", "TELEGRAM_"))
+    } | {"PYTHONPATH": REPO_ROOT}
+
+
+def measure(code, cwd=None, env=None):
+    """Seconds spent running ``code`` in a fresh interpreter, excluding interpreter start-up."""
+    result = subprocess.run(
+        [sys.executable, "-c", _TIMER.format(code=code)],
+        cwd=cwd or REPO_ROOT, env=env or clean_env(),
+        capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout)
+
+
+def measure_interpreter(runs):
+    """Wall time of starting and exiting a bare interpreter."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summarize(samples):
+    return {
+        "median_s": round(statistics.median(samples), 4),
+        "min_s": round(min(samples), 4),
+        "max_s": round(max(samples), 4),
+        "runs": len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("targets", nargs="*", default=list(TARGETS))
+    args = parser.parse_args()
+
+    results = {"python": summarize(measure_interpreter(args.runs))}
+    print(f"{'python':<10} {results['python']['median_s'] * 1000:8.1f} ms interpreter start-up (median of {args.runs})")
+    for name in args.targets:
+        results[name] = summarize([measure(TARGETS[name]) for _ in range(args.runs)])
+        print(f"{name:<10} {results[name]['median_s'] * 1000:8.1f} ms (median of {args.runs})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
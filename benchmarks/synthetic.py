@@ -0,0 +1,157 @@
+# benchmarks/synthetic.py
+"""Synthetic inputs for the benchmarks: message trees, images and a fake Telegram client."""
+
+import asyncio
+import io
+import json
+import os
+import random
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+WORDS = ("paracetamol amoxicillin vitamin syrup tablet cream price birr delivery "
+         "available order pharmacy mask sanitizer lotion capsule").split()
+
+
+def message_text(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25)))
+
+
+def jpeg_bytes(seed, size=(640, 640)):
+    """A noisy JPEG, so decoding costs about what a real photo does."""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def write_images(directory, count, duplicate_ratio=0.0, size=(640, 640), seed=0):
+    """Write ``count`` JPEGs; ``duplicate_ratio`` of them repeat earlier content. Returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    distinct = max(1, round(count * (1 - duplicate_ratio)))
+    blobs = {}
+    paths = []
+    for i in range(count):
+        content = i if i < distinct else rng.randrange(distinct)
+        if content not in blobs:
+            blobs[content] = jpeg_bytes(seed + content, size)
+        path = os.path.join(directory, f"img_{i}.jpg")
+        with open(path, "wb") as f:
+            f.write(blobs[content])
+        paths.append(path)
+    return paths
+
+
+def write_message_tree(root, channels, days, per_day, image_paths=(), seed=0):
+    """Write the scraper's layout, ``{root}/{date}/{channel}.jsonl``; returns the message count.
+
+    Every fifth message references one of ``image_paths``, like photo posts do.
+    """
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    total = 0
+    for day in range(days):
+        date = start + timedelta(days=day)
+        directory = os.path.join(root, date.strftime("%Y-%m-%d"))
+        os.makedirs(directory, exist_ok=True)
+        for channel in channels:
+            with open(os.path.join(directory, f"{channel}.jsonl"), "w", encoding="utf-8") as f:
+                for i in range(per_day):
+                    message_id = day * per_day + i + 1
+                    file_path = image_paths[message_id % len(image_paths)] if image_paths and i % 5 == 0 else None
+                    f.write(json.dumps({
+                        "id": message_id,
+                        "date": str(date + timedelta(seconds=i)),
+                        "text": message_text(rng),
+                        "channel": channel,
+                        "file_path": file_path,
+                    }) + "\n")
+                    total += 1
+    return total
+
+
+class MockTelegramClient:
+    """Serves synthetic channel history through the subset of TelegramClient the scraper uses.
+
+    ``latency`` seconds are awaited per API call to stand in for network
+    round trips; ``repost_ratio`` of photos reuse a small pool of photo ids,
+    like promotional images reposted across channels.
+    """
+
+    def __init__(self, messages_per_channel=1000, media_ratio=0.3, repost_ratio=0.5,
+                 latency=0.0, image_size=(320, 320), seed=0):
+        self.messages_per_channel = messages_per_channel
+        self.media_ratio = media_ratio
+        self.repost_ratio = repost_ratio
+        self.latency = latency
+        self.image_size = image_size
+        self.seed = seed
+        self.downloads = 0
+        self._images = {}
+
+    async def start(self, *args, **kwargs):
+        return self
+
+    async def disconnect(self):
+        pass
+
+    async def get_entity(self, channel):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(id=zlib.crc32(channel.encode()), username=channel)
+
+    def iter_messages(self, entity, limit=None, min_id=0, offset_id=0):
+        return self._iter_messages(entity, limit, min_id, offset_id)
+
+    async def _iter_messages(self, entity, limit, min_id, offset_id):
+        # Newest first, like Telegram
+        rng = random.Random(f"{self.seed}-{entity.username}")
+        top = offset_id - 1 if offset_id else self.messages_per_channel
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        sent = 0
+        for message_id in range(top, max(min_id, 0), -1):
+            if limit is not None and sent >= limit:
+                return
+            if sent % 100 == 0:
+                await asyncio.sleep(self.latency)  # one page of history per round trip
+            photo = None
+            if rng.random() < self.media_ratio:
+                reposted = rng.random() < self.repost_ratio
+                photo_id = f"repost-{rng.randrange(20)}" if reposted else f"{entity.username}-{message_id}"
+                photo = SimpleNamespace(id=photo_id)
+            sent += 1
+            yield SimpleNamespace(
+                id=message_id, date=start + timedelta(minutes=message_id), text=message_text(rng),
+                photo=photo, document=None,
+            )
+
+    async def download_media(self, message, file):
+        await asyncio.sleep(self.latency)
+        photo_id = message.photo.id
+        if photo_id not in self._images:
+            self._images[photo_id] = jpeg_bytes(zlib.crc32(photo_id.encode()), self.image_size)
+        with open(file, "wb") as f:
+            f.write(self._images[photo_id])
+        self.downloads += 1
+        return file
+
+
+class ConstantTimeModel:
+    """Stands in for YOLO: one box per image after ``seconds_per_image`` of simulated inference."""
+    names = {0: "pill"}
+
+    def __init__(self, seconds_per_image=0.0):
+        self.seconds_per_image = seconds_per_image
+
+    def __call__(self, images, verbose=False):
+        if self.seconds_per_image:
+            time.sleep(self.seconds_per_image * len(images))
+        box = SimpleNamespace(cls=[0], conf=[0.9], xyxy=[[1.0, 1.0, 3.0, 3.0]])
+        return [SimpleNamespace(boxes=[box], plot=lambda: np.zeros((4, 4, 3), dtype=np.uint8))
+                for _ in images]
@@ -0,0 +1,12 @@
+{% macro incremental_watermark(column, target_column=none) %}
+    {#- Lower bound for an incremental run: the newest value already in this model,
+        minus a lookback. loaded_at-style columns default to now(), the *start* of the
+        writing transaction, so a row committed while the previous run was reading can
+        carry a timestamp below that run's max. Re-reading the overlap is harmless:
+        every incremental model merges with delete+insert on its unique_key. -#}
+    (
+        select coalesce(max({{ target_column or column }}), '1900-01-01')
+            - interval '{{ var("incremental_lookback_minutes") }} minutes'
+        from {{ this }}
+    )
+{%- endmacro %}
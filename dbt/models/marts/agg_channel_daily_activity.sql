@@ -0,0 +1,90 @@
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_id', 'date_id'],
+    incremental_strategy='delete+insert',
+    indexes=[
+        {'columns': ['channel_id', 'activity_date'], 'unique': True},
+        {'columns': ['activity_date']}
+    ],
+    post_hook="delete from {{ this }} where message_count = 0"
+) }}
+
+-- One row per channel per day. Incremental runs only recompute the (channel, day)
+-- groups that received new or changed messages since the last run, including
+-- late-arriving history from scraper backfills, plus the groups a changed message
+-- moved out of (e.g. a re-scrape that corrected its date). A group left with no
+-- messages is replaced by a placeholder row, which the post-hook removes.
+
+{% if is_incremental() %}
+with changed as (
+    select channel_id, date_id
+    from {{ ref('fct_messages') }}
+    where loaded_at > {{ incremental_watermark('loaded_at', 'max_loaded_at') }}
+),
+
+-- A message that moved to another day is counted in its new group but still in its
+-- old one, so in the channels that changed, recount and compare every stored group
+recounted as (
+    select channel_id, date_id, count(*) as message_count
+    from {{ ref('fct_messages') }}
+    where channel_id in (select channel_id from changed)
+    group by channel_id, date_id
+),
+
+affected as (
+    select channel_id, date_id from changed
+    union
+    select a.channel_id, a.date_id
+    from {{ this }} a
+    left join recounted r
+        on r.channel_id = a.channel_id
+       and r.date_id = a.date_id
+    where a.channel_id in (select channel_id from changed)
+      and r.message_count is distinct from a.message_count
+),
+
+messages as (
+    select *
+    from {{ ref('fct_messages') }}
+    where (channel_id, date_id) in (select channel_id, date_id from affected)
+)
+{% else %}
+with messages as (
+    select * from {{ ref('fct_messages') }}
+)
+{% endif %}
+
+select
+    m.channel_id,
+    m.date_id,
+    d.full_date as activity_date,
+    count(*) as message_count,
+    count(*) filter (where m.has_image) as image_count,
+    min(m.message_date) as first_message_at,
+    max(m.message_date) as last_message_at,
+    max(m.loaded_at) as max_loaded_at
+from messages m
+join {{ ref('dim_dates') }} d on d.date_id = m.date_id
+group by m.channel_id, m.date_id, d.full_date
+
+{% if is_incremental() %}
+union all
+
+select
+    a.channel_id,
+    a.date_id,
+    a.activity_date,
+    0 as message_count,
+    0 as image_count,
+    null as first_message_at,
+    null as last_message_at,
+    null as max_loaded_at
+from {{ this }} a
+where (a.channel_id, a.date_id) in (select channel_id, date_id from affected)
+  and not exists (
+      select 1
+      from messages m
+      where m.channel_id = a.channel_id
+        and m.date_id = a.date_id
+  )
+{% endif %}
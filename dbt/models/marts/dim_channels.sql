@@ -0,0 +1,15 @@
+{{ config(
+    materialized='incremental',
+    unique_key='channel_id',
+    incremental_strategy='delete+insert'
+) }}
+
+select
+    channel as channel_id,
+    channel_name,
+    max(loaded_at) as last_loaded_at
+from {{ ref('stg_telegram_messages') }}
+{% if is_incremental() %}
+where loaded_at > {{ incremental_watermark('loaded_at', 'last_loaded_at') }}
+{% endif %}
+group by channel, channel_name
@@ -0,0 +1,22 @@
+-- Calendar spanning the message history; built from the indexed min/max
+-- message_date, so its cost grows with days covered rather than messages.
+
+with bounds as (
+    select
+        cast(min(message_date) as date) as first_date,
+        cast(max(message_date) as date) as last_date
+    from {{ ref('stg_telegram_messages') }}
+),
+
+calendar as (
+    select cast(day as date) as full_date
+    from bounds, generate_series(bounds.first_date, bounds.last_date, interval '1 day') as day
+)
+
+select
+    cast(to_char(full_date, 'YYYYMMDD') as integer) as date_id,
+    full_date,
+    cast(extract(year from full_date) as integer) as year,
+    cast(extract(month from full_date) as integer) as month,
+    cast(extract(day from full_date) as integer) as day
+from calendar
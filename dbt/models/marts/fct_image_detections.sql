@@ -0,0 +1,39 @@
+{{ config(
+    materialized='incremental',
+    unique_key=['message_id', 'channel'],
+    incremental_strategy='delete+insert',
+    indexes=[
+        {'columns': ['detection_confidence']},
+        {'columns': ['channel', 'detection_confidence']},
+        {'columns': ['message_id', 'channel']},
+        {'columns': ['channel', 'message_id']},
+        {'columns': ['enriched_at']}
+    ],
+    post_hook="delete from {{ this }} where detected_class is null"
+) }}
+
+-- Driven by raw.enriched_images, so detections that arrive after the messages
+-- (enrichment runs after dbt) are merged on the next run. Re-enriched images
+-- replace all of their previous detections; an image that now has none keeps a
+-- placeholder row through the delete+insert, which the post-hook removes.
+
+with enriched as (
+    select * from {{ source('raw', 'enriched_images') }}
+    {% if is_incremental() %}
+    where enriched_at > {{ incremental_watermark('enriched_at') }}
+    {% endif %}
+)
+
+select
+    e.message_id,
+    e.channel,
+    lower(e.channel) as channel_name,
+    d.class as detected_class,
+    d.confidence as detection_confidence,
+    e.image_hash,
+    e.model_version,
+    e.enriched_at
+from enriched e
+left join {{ source('raw', 'image_detections') }} d
+    on d.message_id = e.message_id
+   and d.channel = e.channel
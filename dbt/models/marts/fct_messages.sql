@@ -0,0 +1,26 @@
+{{ config(
+    materialized='incremental',
+    unique_key=['message_id', 'channel_id'],
+    incremental_strategy='delete+insert',
+    indexes=[
+        {'columns': ['message_id', 'channel_id'], 'unique': True},
+        {'columns': ['channel_id', 'message_date']},
+        {'columns': ['channel_id', 'message_id']},
+        {'columns': ['date_id']},
+        {'columns': ['loaded_at']}
+    ]
+) }}
+
+select
+    message_id,
+    message_date,
+    channel as channel_id,
+    cast(to_char(message_date, 'YYYYMMDD') as integer) as date_id,
+    file_path is not null as has_image,
+    message_text,
+    file_path,
+    loaded_at
+from {{ ref('stg_telegram_messages') }}
+{% if is_incremental() %}
+where loaded_at > {{ incremental_watermark('loaded_at') }}
+{% endif %}
@@ -0,0 +1,42 @@
+{{ config(
+    materialized='incremental',
+    unique_key=['message_id', 'channel'],
+    incremental_strategy='delete+insert',
+    indexes=[
+        {'columns': ['product']},
+        {'columns': ['message_date']},
+        {'columns': ['channel', 'message_id']},
+        {'columns': ['extracted_at']}
+    ],
+    post_hook="delete from {{ this }} where product is null"
+) }}
+
+-- One row per message and product named in its text, from src/extract.py.
+-- Driven by raw.extracted_messages like fct_image_detections is by
+-- raw.enriched_images: a re-extracted message replaces all of its previous
+-- mentions, and one that now names none keeps a placeholder row through the
+-- delete+insert, which the post-hook removes.
+
+with extracted as (
+    select * from {{ source('raw', 'extracted_messages') }}
+    {% if is_incremental() %}
+    where extracted_at > {{ incremental_watermark('extracted_at') }}
+    {% endif %}
+)
+
+select
+    e.message_id,
+    e.channel,
+    lower(e.channel) as channel_name,
+    p.message_date,
+    p.product,
+    p.category,
+    p.matched_text,
+    p.price,
+    p.currency,
+    e.dictionary_version,
+    e.extracted_at
+from extracted e
+left join {{ source('raw', 'message_products') }} p
+    on p.message_id = e.message_id
+   and p.channel = e.channel
@@ -0,0 +1,54 @@
+{{ config(
+    materialized='incremental',
+    unique_key=['message_id', 'channel'],
+    incremental_strategy='delete+insert',
+    indexes=[
+        {'columns': ['search_vector'], 'type': 'gin'},
+        {'columns': ['message_text gin_trgm_ops'], 'type': 'gin'},
+        {'columns': ['channel', 'message_id'], 'unique': True},
+        {'columns': ['message_date']},
+        {'columns': ['loaded_at']}
+    ]
+) }}
+
+-- 'simple' text search config: no stemming or stop words, so Amharic (Ge'ez script),
+-- English and mixed drug names are all indexed as plain lower-cased tokens.
+-- The trigram index covers substrings inside unsegmented or misspelled names.
+-- Incremental runs only pick up raw rows inserted or changed since the last run
+-- (with a short overlap, see the incremental_watermark macro).
+
+with source as (
+    select * from {{ source('raw', 'telegram_messages') }}
+    {% if is_incremental() %}
+    where loaded_at > {{ incremental_watermark('loaded_at') }}
+    {% endif %}
+),
+
+-- The raw unique key includes the partitioning date, so a message whose date changed
+-- could be stored twice; keep the version loaded last.
+latest as (
+    select *
+    from (
+        select
+            *,
+            row_number() over (
+                partition by message_id, channel
+                order by loaded_at desc, date desc
+            ) as version_rank
+        from source
+    ) ranked
+    where version_rank = 1
+)
+
+select
+    message_id,
+    date as message_date,
+    nullif(trim(text), '') as message_text,
+    channel,
+    lower(channel) as channel_name,
+    file_path,
+    loaded_at,
+    to_tsvector('simple', coalesce(text, '')) as search_vector
+from latest
+where message_id is not null
+  and date is not null
@@ -0,0 +1,26 @@
+-- The incrementally maintained rollup must equal a full recount of fct_messages,
+-- including after messages move to another day. Returns the groups that differ.
+
+with recounted as (
+    select
+        channel_id,
+        date_id,
+        count(*) as message_count,
+        count(*) filter (where has_image) as image_count,
+        min(message_date) as first_message_at,
+        max(message_date) as last_message_at
+    from {{ ref('fct_messages') }}
+    group by channel_id, date_id
+)
+
+select
+    coalesce(a.channel_id, r.channel_id) as channel_id,
+    coalesce(a.date_id, r.date_id) as date_id,
+    a.message_count as rollup_count,
+    r.message_count as recounted_count
+from {{ ref('agg_channel_daily_activity') }} a
+full outer join recounted r
+    on r.channel_id = a.channel_id
+   and r.date_id = a.date_id
+where (a.message_count, a.image_count, a.first_message_at, a.last_message_at)
+    is distinct from (r.message_count, r.image_count, r.first_message_at, r.last_message_at)
@@ -1,48 +1,130 @@
-from dagster import job, op, Out, In
-import subprocess
+from dagster import job, op, DynamicOut, DynamicOutput, multiprocess_executor
+import hashlib
 import os
-from datetime import datetime
+import re
+import time
+import requests
+from src import archive, enrich_queue, extract, load, metrics, scrape
+from src.load import get_connection
+
+# Channels run as parallel branches of the job; this caps how many ops run at once
+PIPELINE_MAX_CONCURRENT = int(os.getenv("PIPELINE_MAX_CONCURRENT", "4"))
+
+# API endpoints to re-request after a run so dashboards hit a warm cache
+API_URL = os.getenv("API_URL")
+API_WARM_PATHS = [p for p in os.getenv("API_WARM_PATHS", "/api/reports/top-products?limit=10").split(",") if p]
+API_CACHE_GENERATION_CHECK_SECONDS = float(os.getenv("API_CACHE_GENERATION_CHECK_SECONDS", "5"))
+
+def refresh_api_cache(context, stage):
+    # Recording the run bumps the generation the API cache checks, invalidating every worker
+    conn = get_connection()
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS raw.pipeline_runs (
+                    id SERIAL PRIMARY KEY,
+                    stage TEXT,
+                    finished_at TIMESTAMP DEFAULT now()
+                );
+            """)
+            cursor.execute("INSERT INTO raw.pipeline_runs (stage) VALUES (%s);", (stage,))
+    finally:
+        conn.close()
+    context.log.info(f"API cache invalidated after {stage}")
+
+    if not API_URL:
+        return
+    # Give workers time to notice the new generation before warming
+    time.sleep(API_CACHE_GENERATION_CHECK_SECONDS)
+    for path in API_WARM_PATHS:
+        try:
+            requests.get(f"{API_URL.rstrip('/')}{path}", timeout=30).raise_for_status()
+        except requests.RequestException as e:
+            context.log.warning(f"Cache warm-up failed for {path}: {e}")
+
+def mapping_key(channel):
+    # Dagster mapping keys only allow letters, digits and underscores; the hash of the
+    # original name keeps channels such as "a.b" and "a_b" apart
+    digest = hashlib.sha1(channel.encode("utf-8")).hexdigest()[:8]
+    return f"{re.sub(r'[^A-Za-z0-9_]', '_', channel)}_{digest}"
+
+@op(out=DynamicOut(str))
+def channel_partitions(context):
+    # One branch per channel, so scrape -> load for different channels run in parallel
+    for channel in scrape.channels:
+        yield DynamicOutput(channel, mapping_key=mapping_key(channel))
+
+@op
+def scrape_telegram_data(context, channel):
+    scrape.configure_logging()
+    stats = scrape.run_scrape([channel], session=scrape.session_for(channel))
+    context.log.info(f"Scraped {channel}: {stats[0]['messages']} messages, {stats[0]['media']} media")
+    return channel
 
 @op
-def scrape_telegram_data(context):
-    # Execute src/scrape.py to scrape Telegram data
-    result = subprocess.run(["python", "src/scrape.py"], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"Scraping failed: {result.stderr}")
-    context.log.info("Telegram data scraped successfully")
-    return {"timestamp": datetime.now().isoformat()}
+def load_raw_to_postgres(context, channel):
+    stats = load.run_load([channel])
+    context.log.info(f"Loaded {channel}: {stats['rows_merged']} rows from {stats['files_loaded']} files")
+    return channel
 
 @op
-def load_raw_to_postgres(context, upstream_output):
-    # Execute src/load.py to load raw data into PostgreSQL
-    result = subprocess.run(["python", "src/load.py"], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"Loading failed: {result.stderr}")
-    context.log.info("Raw data loaded to PostgreSQL")
-    return {"loaded_at": upstream_output["timestamp"]}
+def extract_product_mentions(context, channel):
+    # Text extraction is cheap enough to finish before dbt, so the mart includes this run's messages
+    stats = extract.run_extraction([channel])
+    context.log.info(f"Extracted {channel}: {stats['mentions']} product mentions in {stats['messages']} messages, "
+                     f"{stats['priced']} with a price")
+    return channel
 
 @op
-def run_dbt_transformations(context, upstream_output):
-    # Run dbt transformations
-    os.environ["DBT_PROFILES_DIR"] = "./dbt"
-    result = subprocess.run(["dbt", "run", "--profiles-dir", "dbt"], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"dbt run failed: {result.stderr}")
+def run_dbt_transformations(context, channels):
+    # dbt's programmatic runner keeps the transform in this process instead of spawning the CLI
+    from dbt.cli.main import dbtRunner
+    with metrics.stage("dbt"):
+        result = dbtRunner().invoke(["run", "--project-dir", "dbt", "--profiles-dir", "dbt"])
+        if not result.success:
+            raise Exception(f"dbt run failed: {result.exception}")
     context.log.info("dbt transformations completed")
-    return {"transformed_at": upstream_output["loaded_at"]}
+    refresh_api_cache(context, "dbt")
+    return channels
+
+@op(out=DynamicOut(str))
+def enrichment_partitions(context, channels):
+    for channel in channels:
+        yield DynamicOutput(channel, mapping_key=mapping_key(channel))
+
+@op
+def run_yolo_enrichment(context, channel):
+    # Queues the channel's images and drains them; workers started elsewhere
+    # (python src/enrich_queue.py --forever) share the work through the same queue
+    stats = enrich_queue.run_worker([channel])
+    context.log.info(f"Enriched {channel}: {stats['done']} images, {stats['retried']} to retry, "
+                     f"{stats['dead']} dead-lettered")
+    return channel
 
 @op
-def run_yolo_enrichment(context, upstream_output):
-    # Execute src/enrich.py for YOLO enrichment
-    result = subprocess.run(["python", "src/enrich.py"], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"YOLO enrichment failed: {result.stderr}")
-    context.log.info("YOLO enrichment completed")
-    return {"enriched_at": upstream_output["transformed_at"]}
-
-@job
+def publish_enrichment(context, channels):
+    context.log.info(f"YOLO enrichment completed for {len(channels)} channels")
+    refresh_api_cache(context, "enrich")
+    return channels
+
+@op
+def archive_cold_partitions(context, channels):
+    # Runs after dbt and enrichment have read this run's rows, so only settled months move
+    archived = archive.archive_cold_partitions()
+    context.log.info(f"Archived {archived['raw.telegram_messages']} messages, "
+                     f"{archived['raw.image_detections']} detections and "
+                     f"{archived['raw.message_products']} product mentions to {archive.ARCHIVE_ROOT}")
+
+# Ops run in worker processes forked from a server that has already imported the
+# pipeline modules, so no op pays Python start-up and import time of its own
+@job(executor_def=multiprocess_executor.configured({
+    "max_concurrent": PIPELINE_MAX_CONCURRENT,
+    "start_method": {"forkserver": {
+        "preload_modules": ["src.scrape", "src.load", "src.extract", "src.enrich", "src.enrich_queue"],
+    }},
+}))
 def telegram_pipeline():
-    scrape_output = scrape_telegram_data()
-    load_output = load_raw_to_postgres(scrape_output)
-    transform_output = run_dbt_transformations(load_output)
-    run_yolo_enrichment(transform_output)
\ No newline at end of file
+    loaded = channel_partitions().map(scrape_telegram_data).map(load_raw_to_postgres).map(extract_product_mentions)
+    transformed = run_dbt_transformations(loaded.collect())
+    enriched = enrichment_partitions(transformed).map(run_yolo_enrichment)
+    archive_cold_partitions(publish_enrichment(enriched.collect()))
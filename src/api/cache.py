@@ -0,0 +1,144 @@
+# src/api/cache.py
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import urlencode
+
+from fastapi.encoders import jsonable_encoder
+
+API_CACHE_BACKEND = os.getenv("API_CACHE_BACKEND", "memory")  # memory | redis
+API_CACHE_REDIS_URL = os.getenv("API_CACHE_REDIS_URL", "redis://localhost:6379/0")
+API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", "3600"))
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "10000"))
+# How often each worker checks whether a pipeline run has finished since its last check
+API_CACHE_GENERATION_CHECK_SECONDS = float(os.getenv("API_CACHE_GENERATION_CHECK_SECONDS", "5"))
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int = API_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: int):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def clear(self):
+        self._entries.clear()
+
+
+class RedisBackend:
+    """Shared backend so every API worker sees the same entries; needs the optional `redis` package."""
+
+    def __init__(self, url: str = API_CACHE_REDIS_URL, prefix: str = "telegram-api:"):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str):
+        raw = await self._redis.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value, ttl: int):
+        await self._redis.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+    async def clear(self):
+        async for key in self._redis.scan_iter(match=f"{self.prefix}*"):
+            await self._redis.delete(key)
+
+
+class ResponseCache:
+    """Caches JSON-ready endpoint responses keyed by endpoint and parameters.
+
+    Entries are dropped when ``generation_loader`` reports a new pipeline
+    generation, so marts rebuilt by the pipeline are never served stale for
+    longer than the check interval.
+    """
+
+    def __init__(self, backend, ttl: int = API_CACHE_TTL,
+                 generation_check_seconds: float = API_CACHE_GENERATION_CHECK_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.generation_check_seconds = generation_check_seconds
+        self.generation_loader: Optional[Callable[[], Awaitable[int]]] = None
+        self.generation = None
+        self._checked_at = float("-inf")
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(endpoint: str, **params) -> str:
+        return f"{endpoint}?{urlencode(sorted(params.items()))}"
+
+    async def sync_generation(self):
+        if self.generation_loader is None:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.generation_check_seconds:
+            return
+        self._checked_at = now
+        generation = await self.generation_loader()
+        if generation != self.generation:
+            if self.generation is not None:
+                await self.backend.clear()
+            self.generation = generation
+
+    async def get_or_load(self, endpoint: str, loader: Callable[[], Awaitable[Any]], **params):
+        """Return the cached response, or await ``loader()`` once for all concurrent callers."""
+        await self.sync_generation()
+        key = self.key(endpoint, **params)
+        value = await self.backend.get(key)
+        if value is not None:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = jsonable_encoder(await loader())
+            await self.backend.set(key, value, self.ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no other caller was waiting on it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def invalidate(self):
+        await self.backend.clear()
+
+
+def create_backend(name: str = API_CACHE_BACKEND):
+    if name == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+
+response_cache = ResponseCache(create_backend())
@@ -1,23 +1,107 @@
+import base64
+import json
+import os
+import re
+import time
+from datetime import date
+from typing import Optional
+
 from sqlalchemy import text
-from sqlalchemy.orm import Session
-from .schemas import Message, Detection, ChannelActivity
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.metrics import DB_QUERY_SECONDS, timed_query
+from .schemas import (
+    Message, Detection, ProductMentions, ChannelActivity, ActivityPoint, ChannelActivitySeries
+)
 
-def search_messages(db: Session, query_str: str) -> list[Message]:
-    sql = text("""
+# Deepest a search can page: only this many of the most recent matches are ranked
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "1000"))
+
+
+def _prefix_tsquery(query_str: str) -> Optional[str]:
+    """Build a 'simple' config tsquery matching every word as a prefix, e.g. 'parac:* & 500:*'."""
+    tokens = re.findall(r"\w+", query_str.lower())
+    return " & ".join(f"{token}:*" for token in tokens) or None
+
+
+def encode_cursor(score: float, message_id: int, channel: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, message_id, channel]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[float, int, str]:
+    try:
+        score, message_id, channel = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(message_id), str(channel)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+@timed_query
+async def search_messages(
+    db: AsyncSession, query_str: str, limit: int = 20, cursor: Optional[str] = None
+) -> tuple[list[Message], Optional[str]]:
+    """Ranked search over the tsvector and trigram indexes on stg_telegram_messages.
+
+    Results are ordered by (score, message_id, channel) descending and paged
+    with an opaque keyset cursor; returns (messages, next_cursor).
+
+    Only the SEARCH_MAX_RESULTS most recent matches are ranked, so a broad
+    query such as a common drug name costs that many rows per page instead of
+    its whole match set, and later pages cost no more than the first. The
+    tradeoff is recall: older matches beyond that depth are never returned,
+    however well they would rank.
+    """
+    escaped = query_str.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    params = {"terms": _prefix_tsquery(query_str), "q": query_str, "pattern": f"%{escaped}%",
+              "depth": SEARCH_MAX_RESULTS, "limit": limit + 1}
+    after = ""
+    if cursor:
+        params["after_score"], params["after_id"], params["after_channel"] = decode_cursor(cursor)
+        after = "WHERE (score, message_id, channel) < (:after_score, :after_id, :after_channel)"
+    sql = text(f"""
+        WITH candidates AS (
+            -- Capped before ranking; the date order keeps the candidate set stable across pages
+            SELECT message_id, message_text, message_date, file_path, channel, search_vector
+            FROM dbt_telegram_staging.stg_telegram_messages
+            WHERE search_vector @@ to_tsquery('simple', :terms)
+               OR message_text ILIKE :pattern
+            ORDER BY message_date DESC, message_id DESC, channel DESC
+            LIMIT :depth
+        ), matches AS (
+            SELECT
+                message_id,
+                message_text,
+                message_date,
+                file_path,
+                channel,
+                GREATEST(
+                    COALESCE(ts_rank_cd(search_vector, to_tsquery('simple', :terms)), 0),
+                    word_similarity(:q, message_text)
+                )::float8 AS score
+            FROM candidates
+        )
         SELECT
             message_id,
             message_text AS text,
-            message_date AS date,
+            message_date::date AS date,
             file_path,
-            channel
-        FROM dbt_telegram_staging.stg_telegram_messages
-        WHERE message_text ILIKE :q
-        LIMIT 20
+            channel,
+            score
+        FROM matches
+        {after}
+        ORDER BY score DESC, message_id DESC, channel DESC
+        LIMIT :limit
     """)
-    rows = db.execute(sql, {"q": f"%{query_str}%"}).mappings().all()
-    return [Message(**row) for row in rows]
+    rows = (await db.execute(sql, params)).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last["score"], last["message_id"], last["channel"])
+    return [Message(**row) for row in rows], next_cursor
 
-def get_top_detections(db: Session, limit: int) -> list[Detection]:
+@timed_query
+async def get_top_detections(db: AsyncSession, limit: int) -> list[Detection]:
     sql = text("""
         SELECT
             message_id,
@@ -28,22 +112,66 @@ def get_top_detections(db: Session, limit: int) -> list[Detection]:
         ORDER BY detection_confidence DESC
         LIMIT :limit
     """)
-    rows = db.execute(sql, {"limit": limit}).mappings().all()
+    rows = (await db.execute(sql, {"limit": limit})).mappings().all()
     return [Detection(**row) for row in rows]
 
 
-def get_channel_activity(db: Session, channel: str) -> ChannelActivity:
+@timed_query
+async def get_top_mentioned_products(
+    db: AsyncSession,
+    limit: int,
+    channel: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> list[ProductMentions]:
+    """Products named in the most messages, with their ETB price range, from fct_product_mentions."""
+    conditions = []
+    params = {"limit": limit}
+    if channel:
+        conditions.append("channel = :channel")
+        params["channel"] = channel
+    if start_date:
+        conditions.append("message_date >= :start_date")
+        params["start_date"] = start_date
+    if end_date:
+        conditions.append("message_date < CAST(:end_date AS date) + 1")
+        params["end_date"] = end_date
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = text(f"""
+        SELECT
+            product,
+            MIN(category) AS category,
+            COUNT(*) AS mention_count,
+            COUNT(DISTINCT channel) AS channel_count,
+            COUNT(price) AS priced_count,
+            CAST(percentile_cont(0.5) WITHIN GROUP (ORDER BY price) FILTER (WHERE currency = 'ETB') AS float8)
+                AS median_price_etb,
+            CAST(MIN(price) FILTER (WHERE currency = 'ETB') AS float8) AS min_price_etb,
+            CAST(MAX(price) FILTER (WHERE currency = 'ETB') AS float8) AS max_price_etb
+        FROM dbt_telegram_marts.fct_product_mentions
+        {where}
+        GROUP BY product
+        ORDER BY mention_count DESC, product
+        LIMIT :limit
+    """)
+    rows = (await db.execute(sql, params)).mappings().all()
+    return [ProductMentions(**row) for row in rows]
+
+
+@timed_query
+async def get_channel_activity(db: AsyncSession, channel: str) -> ChannelActivity:
+    # Served from the per-day rollup: one indexed range per channel instead of scanning fct_messages
     sql = text("""
         SELECT
             channel_id AS channel,
-            COUNT(*) AS total_messages,
-            MIN(message_date) AS first_post_date,
-            MAX(message_date) AS last_post_date
-        FROM dbt_telegram_marts.fct_messages
+            CAST(SUM(message_count) AS bigint) AS total_messages,
+            MIN(first_message_at) AS first_post_date,
+            MAX(last_message_at) AS last_post_date
+        FROM dbt_telegram_marts.agg_channel_daily_activity
         WHERE channel_id = :channel
         GROUP BY channel_id
     """)
-    row = db.execute(sql, {"channel": channel}).mappings().first()
+    row = (await db.execute(sql, {"channel": channel})).mappings().first()
     if not row:
         return ChannelActivity(
             channel=channel,
@@ -51,4 +179,236 @@ def get_channel_activity(db: Session, channel: str) -> ChannelActivity:
             first_post_date=None,
             last_post_date=None
         )
-    return ChannelActivity(**row)
+    return ChannelActivity(
+        channel=row["channel"],
+        total_messages=row["total_messages"],
+        first_post_date=row["first_post_date"].date(),
+        last_post_date=row["last_post_date"].date()
+    )
+
+
+PERIOD_EXPRESSIONS = {
+    "day": "activity_date",
+    "week": "CAST(date_trunc('week', activity_date) AS date)",
+    "month": "CAST(date_trunc('month', activity_date) AS date)",
+}
+
+
+@timed_query
+async def get_activity_series(
+    db: AsyncSession,
+    channels: Optional[list[str]] = None,
+    granularity: str = "day",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> list[ChannelActivitySeries]:
+    """Activity time series for many channels (all when ``channels`` is empty) in one rollup query."""
+    conditions = []
+    params = {}
+    if channels:
+        conditions.append("channel_id = ANY(:channels)")
+        params["channels"] = list(channels)
+    if start_date:
+        conditions.append("activity_date >= :start_date")
+        params["start_date"] = start_date
+    if end_date:
+        conditions.append("activity_date <= :end_date")
+        params["end_date"] = end_date
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    period = PERIOD_EXPRESSIONS[granularity]
+    sql = text(f"""
+        SELECT
+            channel_id AS channel,
+            {period} AS period_start,
+            CAST(SUM(message_count) AS bigint) AS message_count,
+            CAST(SUM(image_count) AS bigint) AS image_count
+        FROM dbt_telegram_marts.agg_channel_daily_activity
+        {where}
+        GROUP BY channel_id, period_start
+        ORDER BY channel_id, period_start
+    """)
+    rows = (await db.execute(sql, params)).mappings().all()
+
+    series: dict[str, ChannelActivitySeries] = {}
+    for row in rows:
+        entry = series.get(row["channel"])
+        if entry is None:
+            entry = series[row["channel"]] = ChannelActivitySeries(
+                channel=row["channel"], total_messages=0, image_messages=0, points=[]
+            )
+        entry.total_messages += row["message_count"]
+        entry.image_messages += row["image_count"]
+        entry.points.append(ActivityPoint(
+            period_start=row["period_start"],
+            message_count=row["message_count"],
+            image_count=row["image_count"]
+        ))
+    return list(series.values())
+
+
+@timed_query
+async def get_message_detections(db: AsyncSession, channel: str, message_id: int):
+    """Return the message's image path and stored detection boxes, or (None, []) if unknown."""
+    file_path = (await db.execute(text("""
+        SELECT file_path
+        FROM raw.telegram_messages
+        WHERE channel = :channel AND message_id = :message_id
+    """), {"channel": channel, "message_id": message_id})).scalar()
+    if not file_path:
+        return None, []
+    rows = (await db.execute(text("""
+        SELECT
+            class AS class_name,
+            confidence,
+            x1, y1, x2, y2
+        FROM raw.image_detections
+        WHERE channel = :channel AND message_id = :message_id
+        ORDER BY confidence DESC
+    """), {"channel": channel, "message_id": message_id})).mappings().all()
+    return file_path, [dict(row) for row in rows]
+
+
+@timed_query
+async def get_pipeline_generation(db: AsyncSession) -> int:
+    """Id of the latest finished pipeline stage; changes whenever the marts are rebuilt."""
+    try:
+        return (await db.execute(text("SELECT COALESCE(MAX(id), 0) FROM raw.pipeline_runs"))).scalar()
+    except DBAPIError:
+        # Table not created yet: no pipeline run has finished
+        return 0
+
+
+# === Bulk export ===
+EXPORT_DETECTION_COLUMNS = [
+    "message_id", "channel", "message_date", "detected_class", "detection_confidence",
+    "image_hash", "model_version", "enriched_at",
+]
+EXPORT_MESSAGE_COLUMNS = ["message_id", "channel", "message_date", "message_text", "has_image", "file_path"]
+
+
+def _export_filters(channel_column, date_column, channel, start_date, end_date):
+    conditions, params = [], {}
+    if channel:
+        conditions.append(f"{channel_column} = :channel")
+        params["channel"] = channel
+    if start_date:
+        conditions.append(f"{date_column} >= CAST(:start_date AS date)")
+        params["start_date"] = start_date
+    if end_date:
+        conditions.append(f"{date_column} < CAST(:end_date AS date) + 1")
+        params["end_date"] = end_date
+    return conditions, params
+
+
+def _where(conditions):
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+async def _iter_pages(db: AsyncSession, build_sql, params: dict, page_size: int, after, name: str):
+    """Yield pages of row dicts from a keyset-paged query until it runs dry.
+
+    ``build_sql(has_after)`` returns one page ordered by (channel, message_id).
+    Each page is a short indexed query streamed from a server-side cursor, so
+    no statement outlives the statement timeout and at most one page is held.
+    """
+    while True:
+        page_params = dict(params, page_size=page_size)
+        if after is not None:
+            page_params["after_channel"], page_params["after_id"] = after
+        started = time.perf_counter()
+        result = await db.stream(build_sql(after is not None), page_params)
+        rows = [dict(row) async for row in result.mappings()]
+        DB_QUERY_SECONDS.labels(function=name).observe(time.perf_counter() - started)
+        if not rows:
+            return
+        yield rows
+        after = (rows[-1]["channel"], rows[-1]["message_id"])
+
+
+def export_detections(
+    db: AsyncSession,
+    channel: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    detected_class: Optional[str] = None,
+    after: Optional[tuple[str, int]] = None,
+    page_size: int = 5000,
+):
+    """Pages of fct_image_detections rows, ``page_size`` messages at a time.
+
+    Pages end on message boundaries, so every detection of a message is in
+    the same page and the (channel, message_id) keyset never splits one.
+    """
+    conditions, params = _export_filters("d.channel", "m.message_date", channel, start_date, end_date)
+    class_condition = []
+    if detected_class:
+        class_condition = ["d.detected_class = :detected_class"]
+        params["detected_class"] = detected_class
+
+    def build(has_after):
+        keyset = ["(d.channel, d.message_id) > (:after_channel, :after_id)"] if has_after else []
+        return text(f"""
+            WITH page AS (
+                SELECT DISTINCT d.channel, d.message_id
+                FROM dbt_telegram_marts.fct_image_detections d
+                LEFT JOIN dbt_telegram_marts.fct_messages m
+                    ON m.message_id = d.message_id AND m.channel_id = d.channel
+                {_where(conditions + class_condition + keyset)}
+                ORDER BY d.channel, d.message_id
+                LIMIT :page_size
+            )
+            SELECT
+                d.message_id,
+                d.channel,
+                m.message_date,
+                d.detected_class,
+                d.detection_confidence,
+                d.image_hash,
+                d.model_version,
+                d.enriched_at
+            FROM page p
+            JOIN dbt_telegram_marts.fct_image_detections d
+                ON d.channel = p.channel AND d.message_id = p.message_id
+            LEFT JOIN dbt_telegram_marts.fct_messages m
+                ON m.message_id = d.message_id AND m.channel_id = d.channel
+            {_where(class_condition)}
+            ORDER BY d.channel, d.message_id, d.detection_confidence DESC
+        """)
+    return _iter_pages(db, build, params, page_size, after, "export_detections")
+
+
+def export_messages(
+    db: AsyncSession,
+    channel: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    detected_class: Optional[str] = None,
+    after: Optional[tuple[str, int]] = None,
+    page_size: int = 5000,
+):
+    """Pages of fct_messages rows; ``detected_class`` keeps messages with such a detection."""
+    conditions, params = _export_filters("m.channel_id", "m.message_date", channel, start_date, end_date)
+    if detected_class:
+        conditions.append("""EXISTS (
+            SELECT 1 FROM dbt_telegram_marts.fct_image_detections d
+            WHERE d.message_id = m.message_id AND d.channel = m.channel_id
+              AND d.detected_class = :detected_class
+        )""")
+        params["detected_class"] = detected_class
+
+    def build(has_after):
+        keyset = ["(m.channel_id, m.message_id) > (:after_channel, :after_id)"] if has_after else []
+        return text(f"""
+            SELECT
+                m.message_id,
+                m.channel_id AS channel,
+                m.message_date,
+                m.message_text,
+                m.has_image,
+                m.file_path
+            FROM dbt_telegram_marts.fct_messages m
+            {_where(conditions + keyset)}
+            ORDER BY m.channel_id, m.message_id
+            LIMIT :page_size
+        """)
+    return _iter_pages(db, build, params, page_size, after, "export_messages")
@@ -1,6 +1,8 @@
 # src/api/database.py
 
+from functools import lru_cache
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
@@ -15,12 +17,76 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+# Connection pool tuning (per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Server-side cap on any single API query, in milliseconds (0 disables it)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+
 # ✅ URL-encode the password to safely include special characters like @, $, etc.
-encoded_password = urllib.parse.quote_plus(DB_PASSWORD)
+encoded_password = urllib.parse.quote_plus(DB_PASSWORD or "")
 
-# Build the SQLAlchemy connection URL
+# Build the SQLAlchemy connection URLs
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{encoded_password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{encoded_password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+pool_settings = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+
+# Engines are built on first use, so importing this module never touches the database
+
+@lru_cache(maxsize=None)
+def get_async_engine():
+    """Async engine used by the API."""
+    return create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=False,
+        connect_args={"server_settings": {
+            "statement_timeout": str(DB_STATEMENT_TIMEOUT_MS),
+            "application_name": "telegram-api",
+        }},
+        **pool_settings,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_sessionmaker():
+    return async_sessionmaker(get_async_engine(), class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+@lru_cache(maxsize=None)
+def get_engine():
+    """Sync engine for scripts and tests."""
+    return create_engine(DATABASE_URL, echo=False, future=True, **pool_settings)
+
+
+@lru_cache(maxsize=None)
+def get_sessionmaker():
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+async def dispose_async_engine():
+    # Only dispose an engine that was actually created
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+
 
-# Create engine and session
-engine = create_engine(DATABASE_URL, echo=False, future=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def __getattr__(name):
+    # Keep the old module-level names working, built lazily on first access
+    factories = {
+        "async_engine": get_async_engine,
+        "AsyncSessionLocal": get_async_sessionmaker,
+        "engine": get_engine,
+        "SessionLocal": get_sessionmaker,
+    }
+    if name in factories:
+        return factories[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,87 @@
+# src/api/export.py
+
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Callable
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import get_async_sessionmaker
+
+# Rows are read from Postgres this many at a time and sent in chunks of about this size
+API_EXPORT_PAGE_SIZE = int(os.getenv("API_EXPORT_PAGE_SIZE", "5000"))
+API_EXPORT_CHUNK_BYTES = int(os.getenv("API_EXPORT_CHUNK_BYTES", str(64 * 1024)))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+Pages = AsyncIterator[list[dict]]
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _csv_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+async def ndjson_chunks(pages: Pages, chunk_bytes: int = API_EXPORT_CHUNK_BYTES):
+    """One JSON object per line, batched into chunks of roughly ``chunk_bytes``."""
+    buffer, size = [], 0
+    async for rows in pages:
+        for row in rows:
+            line = json.dumps(row, default=_json_default, ensure_ascii=False) + "\n"
+            buffer.append(line)
+            size += len(line)
+            if size >= chunk_bytes:
+                yield "".join(buffer).encode("utf-8")
+                buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+async def csv_chunks(pages: Pages, columns: list[str], chunk_bytes: int = API_EXPORT_CHUNK_BYTES):
+    """A header row, then one CSV row per record, batched into chunks of roughly ``chunk_bytes``."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for rows in pages:
+        for row in rows:
+            writer.writerow([_csv_value(row[column]) for column in columns])
+            if buffer.tell() >= chunk_bytes:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def _session_pages(open_pages: Callable[[AsyncSession], Pages]) -> Pages:
+    # The stream outlives the request handler, so it holds its own session for as long as it runs
+    async with get_async_sessionmaker()() as db:
+        async for rows in open_pages(db):
+            yield rows
+
+
+def export_response(open_pages: Callable[[AsyncSession], Pages], fmt: str, columns: list[str],
+                    name: str) -> StreamingResponse:
+    """Stream ``open_pages(db)`` as NDJSON or CSV; memory stays at about one page."""
+    pages = _session_pages(open_pages)
+    body = csv_chunks(pages, columns) if fmt == "csv" else ndjson_chunks(pages)
+    extension = "csv" if fmt == "csv" else "ndjson"
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
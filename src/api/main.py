@@ -1,34 +1,185 @@
 # src/api/main.py
 
-from fastapi import FastAPI, Depends, Query
-from sqlalchemy.orm import Session
-from .database import SessionLocal
+import os
+from datetime import date
+from typing import Literal, Optional
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from src import archive, metrics
+from .database import dispose_async_engine, get_async_sessionmaker
 from . import crud, schemas
+from .cache import response_cache
+from .export import API_EXPORT_PAGE_SIZE, export_response
+from .render import render_annotated
 
 app = FastAPI(title="Ethiopian Medical Telegram API")
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+@app.on_event("shutdown")
+async def dispose_engine():
+    await dispose_async_engine()
+
+# Dependency to get DB session (pooled async connection, returned after the request)
+async def get_db():
+    async with get_async_sessionmaker()() as db:
         yield db
-    finally:
-        db.close()
+
+async def load_pipeline_generation():
+    async with get_async_sessionmaker()() as db:
+        return await crud.get_pipeline_generation(db)
+
+# Cached responses are dropped whenever the pipeline records a new run
+response_cache.generation_loader = load_pipeline_generation
 
 # === Endpoints ===
 
 @app.get("/api/reports/top-products", response_model=list[schemas.Detection])
-def get_top_detections(limit: int = Query(10, ge=1), db: Session = Depends(get_db)):
-    return crud.get_top_detections(db, limit)
+async def get_top_detections(limit: int = Query(10, ge=1), db: AsyncSession = Depends(get_db)):
+    return await response_cache.get_or_load(
+        "top-products", lambda: crud.get_top_detections(db, limit), limit=limit
+    )
+
+@app.get("/api/reports/top-mentioned-products", response_model=list[schemas.ProductMentions])
+async def get_top_mentioned_products(
+    limit: int = Query(10, ge=1, le=100),
+    channel: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    # Products and drugs named in message text, as opposed to the YOLO classes of top-products
+    return await response_cache.get_or_load(
+        "top-mentioned-products",
+        lambda: crud.get_top_mentioned_products(db, limit, channel, start_date, end_date),
+        limit=limit, channel=channel, start_date=start_date, end_date=end_date
+    )
 
 @app.get("/api/channels/{channel_name}/activity", response_model=schemas.ChannelActivity)
-def get_channel_activity(channel_name: str, db: Session = Depends(get_db)):
-    return crud.get_channel_activity(db, channel_name)
+async def get_channel_activity(channel_name: str, db: AsyncSession = Depends(get_db)):
+    return await response_cache.get_or_load(
+        "channel-activity", lambda: crud.get_channel_activity(db, channel_name), channel=channel_name
+    )
+
+@app.get("/api/channels/{channel_name}/activity/timeseries", response_model=list[schemas.ActivityPoint])
+async def get_channel_activity_timeseries(
+    channel_name: str,
+    granularity: Literal["day", "week", "month"] = "day",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    async def load():
+        series = await crud.get_activity_series(db, [channel_name], granularity, start_date, end_date)
+        return series[0].points if series else []
+    return await response_cache.get_or_load(
+        "channel-activity-timeseries", load,
+        channel=channel_name, granularity=granularity, start_date=start_date, end_date=end_date
+    )
+
+@app.get("/api/reports/channel-activity", response_model=list[schemas.ChannelActivitySeries])
+async def compare_channel_activity(
+    channels: Optional[list[str]] = Query(None, description="Channels to compare; all channels when omitted"),
+    granularity: Literal["day", "week", "month"] = "week",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    channel_list = sorted(set(channels or []))
+    return await response_cache.get_or_load(
+        "channel-activity-compare",
+        lambda: crud.get_activity_series(db, channel_list, granularity, start_date, end_date),
+        channels=",".join(channel_list), granularity=granularity, start_date=start_date, end_date=end_date
+    )
 
 @app.get("/api/search/messages", response_model=list[schemas.Message])
-def search_messages(query: str = Query(..., min_length=1), db: Session = Depends(get_db)):
-    return crud.search_messages(db, query)
+async def search_messages(
+    response: Response,
+    query: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        messages, next_cursor = await crud.search_messages(db, query, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return messages
+
+@app.get("/api/channels/{channel_name}/messages/{message_id}/annotated-image", response_class=FileResponse)
+async def get_annotated_image(channel_name: str, message_id: int, db: AsyncSession = Depends(get_db)):
+    # Rendered lazily from stored detections and cached on disk; drawing runs off the event loop
+    file_path, detections = await crud.get_message_detections(db, channel_name, message_id)
+    if not file_path or not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    path = await run_in_threadpool(render_annotated, channel_name, message_id, file_path, detections)
+    return FileResponse(path, media_type="image/jpeg")
+
+def resume_key(after_channel: Optional[str], after_message_id: Optional[int]):
+    if (after_channel is None) != (after_message_id is None):
+        raise HTTPException(status_code=400, detail="after_channel and after_message_id go together")
+    return None if after_channel is None else (after_channel, after_message_id)
+
+@app.get("/api/export/detections")
+async def export_detections(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    channel: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    detected_class: Optional[str] = None,
+    after_channel: Optional[str] = Query(None, description="Resume after this message's key"),
+    after_message_id: Optional[int] = None,
+):
+    # Streams every matching row of fct_image_detections in (channel, message_id) order
+    after = resume_key(after_channel, after_message_id)
+    return export_response(
+        lambda db: crud.export_detections(
+            db, channel, start_date, end_date, detected_class, after, API_EXPORT_PAGE_SIZE
+        ),
+        fmt, crud.EXPORT_DETECTION_COLUMNS, "image_detections"
+    )
+
+@app.get("/api/export/messages")
+async def export_messages(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    channel: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    detected_class: Optional[str] = Query(None, description="Only messages with a detection of this class"),
+    after_channel: Optional[str] = Query(None, description="Resume after this message's key"),
+    after_message_id: Optional[int] = None,
+):
+    # Streams every matching row of fct_messages in (channel, message_id) order
+    after = resume_key(after_channel, after_message_id)
+    return export_response(
+        lambda db: crud.export_messages(
+            db, channel, start_date, end_date, detected_class, after, API_EXPORT_PAGE_SIZE
+        ),
+        fmt, crud.EXPORT_MESSAGE_COLUMNS, "messages"
+    )
+
+@app.get("/api/archive/messages", response_model=list[schemas.Message])
+async def get_archived_messages(
+    channel: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    # Months moved out of Postgres by src/archive.py, read from Parquet through DuckDB
+    try:
+        return await run_in_threadpool(archive.query_messages, channel, start_date, end_date, limit)
+    except ImportError:
+        raise HTTPException(status_code=503, detail="The archive needs duckdb installed")
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    # Prometheus scrape target; each worker process reports its own series
+    body, content_type = metrics.exposition()
+    return Response(body, media_type=content_type)
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "🩺 Telegram Medical API is live!"}
\ No newline at end of file
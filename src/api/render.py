@@ -0,0 +1,102 @@
+# src/api/render.py
+
+import hashlib
+import os
+import threading
+
+from PIL import Image, ImageDraw
+
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "data/yolo_outputs/rendered")
+RENDER_CACHE_MAX_MB = int(os.getenv("RENDER_CACHE_MAX_MB", "512"))
+
+
+class RenderCache:
+    """Bounded on-disk cache of rendered JPEGs, evicting least recently used files."""
+
+    def __init__(self, root: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None  # computed on first write
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.jpg")
+
+    def get(self, key: str):
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, image: Image.Image) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path_for(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format="JPEG", quality=85)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += os.path.getsize(path)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def _entries(self):
+        with os.scandir(self.root) as it:
+            return [e for e in it if e.is_file() and e.name.endswith(".jpg")]
+
+    def _scan_size(self) -> int:
+        return sum(e.stat().st_size for e in self._entries())
+
+    def _evict(self):
+        # Drop oldest files until 90% of the budget, leaving headroom for the next writes
+        entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in entries)
+        target = self.max_bytes * 0.9
+        for entry in entries:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except FileNotFoundError:
+                continue
+        self._total_bytes = total
+
+
+def cache_key(channel: str, message_id: int, detections: list[dict]) -> str:
+    """Key on the detections themselves, so new enrichment results invalidate old renders."""
+    digest = hashlib.sha256(repr([
+        (d["class_name"], d["confidence"], d["x1"], d["y1"], d["x2"], d["y2"]) for d in detections
+    ]).encode()).hexdigest()[:16]
+    return f"{channel}_{message_id}_{digest}"
+
+
+def draw_detections(image_path: str, detections: list[dict]) -> Image.Image:
+    with Image.open(image_path) as img:
+        image = img.convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for d in detections:
+        if d["x1"] is None:
+            continue
+        box = (d["x1"], d["y1"], d["x2"], d["y2"])
+        draw.rectangle(box, outline=(255, 56, 56), width=2)
+        draw.text((d["x1"] + 2, d["y1"] + 2), f"{d['class_name']} {d['confidence']:.2f}", fill=(255, 56, 56))
+    return image
+
+
+render_cache = RenderCache()
+
+
+def render_annotated(channel: str, message_id: int, image_path: str, detections: list[dict]) -> str:
+    """Return the path of the annotated image, rendering it only on a cache miss."""
+    key = cache_key(channel, message_id, detections)
+    path = render_cache.get(key)
+    if path is None:
+        path = render_cache.put(key, draw_detections(image_path, detections))
+    return path
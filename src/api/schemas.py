@@ -24,12 +24,44 @@ class Detection(BaseModel):
         orm_mode = True
 
 
+class ProductMentions(BaseModel):
+    product: str
+    category: Optional[str]
+    mention_count: int
+    channel_count: int
+    priced_count: int
+    median_price_etb: Optional[float]
+    min_price_etb: Optional[float]
+    max_price_etb: Optional[float]
+
+    class Config:
+        orm_mode = True
+
+
 class ChannelActivity(BaseModel):
     channel: str
     total_messages: int
-    first_post_date: date
-    last_post_date: date
+    first_post_date: Optional[date]
+    last_post_date: Optional[date]
+
+    class Config:
+        orm_mode = True
+
+
+class ActivityPoint(BaseModel):
+    period_start: date
+    message_count: int
+    image_count: int
+
+    class Config:
+        orm_mode = True
+
+
+class ChannelActivitySeries(BaseModel):
+    channel: str
+    total_messages: int
+    image_messages: int
+    points: list[ActivityPoint]
 
     class Config:
         orm_mode = True
-        
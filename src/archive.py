@@ -0,0 +1,305 @@
+# src/archive.py
+"""Move cold monthly partitions of the raw tables to Parquet and query them with DuckDB.
+
+    python src/archive.py                      # archive months older than ARCHIVE_HOT_MONTHS
+    python src/archive.py --restore 2023-04    # bring a month back into Postgres
+    python src/archive.py --list
+
+Postgres keeps the last ``ARCHIVE_HOT_MONTHS`` months (the current one
+included) of every table in ``TABLES``. Older monthly
+partitions are written to ``{ARCHIVE_ROOT}/{table}/month=YYYY-MM/data.parquet``
+and dropped, and raw.archived_partitions records what went where. Rows that
+arrive later for an archived month land in a new partition and are merged
+into the file on the next run, replacing older rows of the same message.
+
+The dbt marts are incremental and keep archived history; before a
+``--full-refresh``, restore the months it should cover.
+"""
+
+import argparse
+import os
+import tempfile
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+try:
+    from src import load, partitions
+except ImportError:  # run as a script, e.g. python src/archive.py
+    import load
+    import partitions
+
+# === Settings ===
+load_dotenv()
+ARCHIVE_ROOT = os.getenv("ARCHIVE_ROOT", "data/archive")
+HOT_MONTHS = int(os.getenv("ARCHIVE_HOT_MONTHS", "12"))
+COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+
+# Archived table -> DuckDB column types, in table column order. Rows of one
+# message are replaced as a whole when a month is archived again.
+TABLES = {
+    "raw.telegram_messages": {
+        "id": "INTEGER", "message_id": "INTEGER", "date": "TIMESTAMP", "text": "VARCHAR",
+        "channel": "VARCHAR", "file_path": "VARCHAR", "loaded_at": "TIMESTAMP", "media_hash": "VARCHAR",
+    },
+    "raw.image_detections": {
+        "message_id": "BIGINT", "channel": "VARCHAR", "message_date": "TIMESTAMP", "class": "VARCHAR",
+        "confidence": "DOUBLE", "image_hash": "VARCHAR", "model_version": "VARCHAR",
+        "x1": "DOUBLE", "y1": "DOUBLE", "x2": "DOUBLE", "y2": "DOUBLE",
+    },
+    "raw.message_products": {
+        "message_id": "BIGINT", "channel": "VARCHAR", "message_date": "TIMESTAMP", "product": "VARCHAR",
+        "category": "VARCHAR", "matched_text": "VARCHAR", "price": "DECIMAL(14, 2)", "currency": "VARCHAR",
+    },
+}
+KEY = ("message_id", "channel")
+# DuckDB view over each table's archive
+VIEWS = {
+    "raw.telegram_messages": "archived_messages",
+    "raw.image_detections": "archived_detections",
+    "raw.message_products": "archived_product_mentions",
+}
+
+
+def duckdb_module():
+    # Optional dependency, only needed once something is archived or queried
+    import duckdb
+    return duckdb
+
+
+def archive_path(table, month, root=ARCHIVE_ROOT):
+    return os.path.join(root, table.split(".")[1], f"month={month:%Y-%m}", "data.parquet")
+
+
+def cutoff_month(today=None, hot_months=HOT_MONTHS):
+    """First month that stays in Postgres."""
+    return partitions.add_months(partitions.month_of(today or datetime.now()), 1 - hot_months)
+
+
+def ensure_manifest(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS raw.archived_partitions (
+            table_name TEXT,
+            month DATE,
+            path TEXT,
+            row_count BIGINT,
+            archived_at TIMESTAMP DEFAULT now(),
+            PRIMARY KEY (table_name, month)
+        );
+    """)
+
+
+def read_csv_sql(table, path):
+    columns = ", ".join(f"'{name}': '{kind}'" for name, kind in TABLES[table].items())
+    # COPY writes NULL as an empty field and an empty string as "", so quoted empties stay strings
+    return (f"read_csv('{path}', columns = {{{columns}}}, header = false, quote = '\"', escape = '\"', "
+            f"allow_quoted_nulls = false)")
+
+
+def write_parquet(table, csv_path, path):
+    """Merge the rows in ``csv_path`` into the Parquet file at ``path``; returns its row count."""
+    duckdb = duckdb_module()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    con = duckdb.connect()
+    try:
+        con.execute(f"CREATE TABLE fresh AS SELECT * FROM {read_csv_sql(table, csv_path)}")
+        if os.path.exists(path):
+            # Rows archived earlier survive unless the partition holds a newer copy of their message
+            con.execute(f"""
+                INSERT INTO fresh
+                SELECT old.* FROM read_parquet('{path}', hive_partitioning = false) old
+                ANTI JOIN fresh USING ({', '.join(KEY)})
+            """)
+        con.execute(f"""
+            COPY (SELECT * FROM fresh ORDER BY channel, message_id)
+            TO '{tmp}' (FORMAT parquet, COMPRESSION {COMPRESSION})
+        """)
+        expected = con.execute("SELECT count(*) FROM fresh").fetchone()[0]
+        written = con.execute(f"SELECT count(*) FROM read_parquet('{tmp}')").fetchone()[0]
+    finally:
+        con.close()
+    if written != expected:
+        os.remove(tmp)
+        raise RuntimeError(f"{tmp} holds {written} rows, expected {expected}")
+    os.replace(tmp, path)
+    return written
+
+
+def archive_partition(conn, table, partition, month, root=ARCHIVE_ROOT):
+    """Write one monthly partition to Parquet and drop it; returns the rows archived."""
+    path = archive_path(table, month, root)
+    with conn.cursor() as cursor:
+        # Writers wait until the partition is gone; readers carry on meanwhile
+        cursor.execute(f"LOCK TABLE {partition} IN EXCLUSIVE MODE")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile("w+b", suffix=".csv", dir=os.path.dirname(path)) as f:
+            cursor.copy_expert(f"COPY {partition} ({', '.join(TABLES[table])}) TO STDOUT WITH (FORMAT csv)", f)
+            f.flush()
+            rows = cursor.rowcount
+            total = write_parquet(table, f.name, path)
+        cursor.execute(f"DROP TABLE {partition}")
+        cursor.execute("""
+            INSERT INTO raw.archived_partitions (table_name, month, path, row_count)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (table_name, month) DO UPDATE
+            SET path = EXCLUDED.path, row_count = EXCLUDED.row_count, archived_at = now();
+        """, (table, month, path, total))
+    # The file is already in place; if this commit fails, the next run merges the same rows again
+    conn.commit()
+    return rows
+
+
+def archive_cold_partitions(hot_months=HOT_MONTHS, root=ARCHIVE_ROOT, today=None):
+    """Archive every monthly partition older than the last ``hot_months`` months.
+
+    Returns {table: rows archived}.
+    """
+    cutoff = cutoff_month(today, hot_months)
+    archived = {}
+    conn = load.get_connection()
+    try:
+        with conn.cursor() as cursor:
+            ensure_manifest(cursor)
+        conn.commit()
+        for table in TABLES:
+            with conn.cursor() as cursor:
+                cold = [p for p in partitions.list_partitions(cursor, table) if p[1] < cutoff]
+            archived[table] = 0
+            for partition, month in cold:
+                rows = archive_partition(conn, table, partition, month, root)
+                archived[table] += rows
+                print(f"🧊 Archived {rows} rows of {partition} to {archive_path(table, month, root)}")
+    finally:
+        conn.close()
+    return archived
+
+
+def restore_month(month, root=ARCHIVE_ROOT):
+    """Copy an archived month back into Postgres; returns {table: rows restored}.
+
+    Rows of messages that already have rows in Postgres are skipped, since
+    those are newer. The Parquet file is removed once its rows are back.
+    """
+    restored = {}
+    conn = load.get_connection()
+    try:
+        with conn.cursor() as cursor:
+            ensure_manifest(cursor)
+            for table, columns in TABLES.items():
+                path = archive_path(table, month, root)
+                if not os.path.exists(path):
+                    continue
+                partitions.ensure_partitions(cursor, table, [month])
+                cursor.execute(f"CREATE TEMP TABLE restore_rows (LIKE {table})")
+                with tempfile.TemporaryDirectory() as tmp:
+                    csv_path = os.path.join(tmp, "rows.csv")
+                    con = duckdb_module().connect()
+                    try:
+                        con.execute(f"COPY (SELECT {', '.join(columns)} FROM read_parquet('{path}')) "
+                                    f"TO '{csv_path}' (FORMAT csv, HEADER false)")
+                        expected = con.execute(f"SELECT count(*) FROM read_parquet('{path}')").fetchone()[0]
+                    finally:
+                        con.close()
+                    with open(csv_path, "rb") as f:
+                        cursor.copy_expert(f"COPY restore_rows ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", f)
+                if cursor.rowcount != expected:
+                    raise RuntimeError(f"read {cursor.rowcount} rows back from {path}, expected {expected}")
+                cursor.execute(f"""
+                    INSERT INTO {table} ({', '.join(columns)})
+                    SELECT {', '.join(columns)} FROM restore_rows r
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM {table} t WHERE t.message_id = r.message_id AND t.channel = r.channel
+                    )
+                """)
+                restored[table] = cursor.rowcount
+                cursor.execute("DROP TABLE restore_rows")
+                cursor.execute("DELETE FROM raw.archived_partitions WHERE table_name = %s AND month = %s",
+                               (table, month))
+        conn.commit()
+    finally:
+        conn.close()
+    # Only once Postgres has the rows
+    for table in restored:
+        os.remove(archive_path(table, month, root))
+    return restored
+
+
+# === Querying the archive ===
+def connect(root=ARCHIVE_ROOT):
+    """In-memory DuckDB connection with a view per archived table (see ``VIEWS``).
+
+    Each view has the table's columns plus ``month`` ('YYYY-MM'); filtering
+    on it skips whole files.
+    """
+    con = duckdb_module().connect()
+    for table, view in VIEWS.items():
+        directory = os.path.join(root, table.split(".")[1])
+        if any(name.startswith("month=") for name in (os.listdir(directory) if os.path.isdir(directory) else [])):
+            con.execute(f"""
+                CREATE VIEW {view} AS
+                SELECT * FROM read_parquet('{directory}/*/data.parquet', hive_partitioning = true,
+                                           hive_types = {{'month': VARCHAR}})
+            """)
+        else:
+            # Nothing archived yet: an empty view with the same columns
+            columns = ", ".join(f"NULL::{kind} AS {name}" for name, kind in TABLES[table].items())
+            con.execute(f"CREATE VIEW {view} AS SELECT {columns}, NULL::VARCHAR AS month WHERE false")
+    return con
+
+
+def query_messages(channel=None, start_date=None, end_date=None, limit=100, root=ARCHIVE_ROOT):
+    """Archived messages, newest first, shaped like the API's Message (``date`` is the day posted)."""
+    filters, params = [], []
+    if channel is not None:
+        filters.append("channel = ?")
+        params.append(channel)
+    if start_date is not None:
+        filters.extend(["month >= ?", "date >= ?"])
+        params.extend([f"{start_date:%Y-%m}", start_date])
+    if end_date is not None:
+        # end_date is inclusive, like the activity endpoints
+        filters.extend(["month <= ?", "date < ? + INTERVAL 1 DAY"])
+        params.extend([f"{end_date:%Y-%m}", end_date])
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    # In-memory and cheap to open; a fresh connection also sees newly archived months
+    con = connect(root)
+    try:
+        rows = con.execute(f"""
+            SELECT message_id, CAST(date AS DATE), text, file_path, channel
+            FROM archived_messages
+            {where}
+            ORDER BY date DESC, channel, message_id
+            LIMIT ?
+        """, params + [limit]).fetchall()
+    finally:
+        con.close()
+    return [dict(zip(("message_id", "date", "text", "file_path", "channel"), row)) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hot-months", type=int, default=HOT_MONTHS,
+                        help="months, the current one included, kept in Postgres")
+    parser.add_argument("--restore", metavar="YYYY-MM", help="copy an archived month back into Postgres")
+    parser.add_argument("--list", action="store_true", help="show archived row counts per table and month")
+    args = parser.parse_args()
+
+    if args.restore:
+        month = datetime.strptime(args.restore, "%Y-%m").date()
+        for table, rows in restore_month(month).items():
+            print(f"♻️ Restored {rows} rows into {table}")
+    elif args.list:
+        con = connect()
+        for table, view in VIEWS.items():
+            for month, rows in con.execute(
+                    f"SELECT month, count(*) FROM {view} GROUP BY month ORDER BY month").fetchall():
+                print(f"📦 {table} {month}: {rows} rows")
+    else:
+        archived = archive_cold_partitions(args.hot_months)
+        for table, rows in archived.items():
+            print(f"✅ Archived {rows} rows of {table}")
+
+
+if __name__ == "__main__":
+    main()
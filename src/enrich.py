@@ -1,105 +1,581 @@
 import os
+import io
 import json
-import pandas as pd
+import fcntl
+import hashlib
+import shutil
+import time
+from collections import OrderedDict, deque
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from PIL import Image
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
-from ultralytics import YOLO
 from urllib.parse import quote_plus
 
+try:
+    from src import metrics, partitions
+except ImportError:  # run as a script, e.g. python src/enrich.py
+    import metrics
+    import partitions
+
 # === Load environment variables ===
 load_dotenv()
 DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = quote_plus(os.getenv("DB_PASSWORD"))  # URL-encode special chars like '@'
+DB_PASSWORD = quote_plus(os.getenv("DB_PASSWORD", ""))  # URL-encode special chars like '@'
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
-# === Connect to PostgreSQL ===
-print("🔧 Connecting to:", f"{DB_USER}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-db_url = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(db_url)
+# === Engine settings ===
+MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "yolov8n.pt")
+BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "16"))
+DECODE_WORKERS = int(os.getenv("ENRICH_DECODE_WORKERS", str(os.cpu_count() or 4)))
+WRITE_WORKERS = int(os.getenv("ENRICH_WRITE_WORKERS", "2"))
+# How many decoded batches may wait ahead of the model
+PREFETCH_BATCHES = int(os.getenv("ENRICH_PREFETCH_BATCHES", "2"))
+# Annotated images are rendered on demand by the API; set to true to also write them eagerly
+RENDER_OUTPUTS = os.getenv("ENRICH_RENDER_OUTPUTS", "false").lower() in ("1", "true", "yes")
+OUTPUT_ROOT = "data/yolo_outputs"
+# Streaming: rows fetched per server-side cursor round trip, and images per committed write
+READ_CHUNK_SIZE = int(os.getenv("ENRICH_READ_CHUNK_SIZE", "1000"))
+COMMIT_EVERY = int(os.getenv("ENRICH_COMMIT_EVERY", "256"))
+# Image hashes whose detections are remembered in memory for reposts within a run
+HASH_CACHE_SIZE = int(os.getenv("ENRICH_HASH_CACHE_SIZE", "100000"))
+
+# === Inference backend ===
+# torch runs the weights as they are; onnx and openvino run a copy exported once into
+# MODEL_CACHE_DIR, INT8-quantized when ENRICH_INT8 is set
+BACKENDS = ("torch", "onnx", "openvino")
+BACKEND = os.getenv("ENRICH_BACKEND", "torch")
+INT8 = os.getenv("ENRICH_INT8", "false").lower() in ("1", "true", "yes")
+IMAGE_SIZE = int(os.getenv("ENRICH_IMAGE_SIZE", "640"))
+MODEL_CACHE_DIR = os.getenv("ENRICH_MODEL_CACHE_DIR", "models")
 
-# === Query messages with images ===
+# === Prefilter (runs on the decode pool) ===
+# Images with a side shorter than this are recorded as enriched without running the model
+MIN_IMAGE_SIDE = int(os.getenv("ENRICH_MIN_IMAGE_SIDE", "32"))
+# Images with at most this many distinct colours are treated as graphics, not photos (0 disables)
+MAX_GRAPHIC_COLORS = int(os.getenv("ENRICH_MAX_GRAPHIC_COLORS", "0"))
+
+# === Query messages with images not yet enriched by this model ===
+# A message is (re)processed when it is new, its file_path changed, or the model changed.
 query = """
-    SELECT message_id, file_path, channel
-    FROM raw.telegram_messages
-    WHERE file_path ILIKE '%.jpg' OR file_path ILIKE '%.png'
+    SELECT m.message_id, m.file_path, m.channel, m.media_hash AS image_hash, m.date AS message_date
+    FROM raw.telegram_messages m
+    LEFT JOIN raw.enriched_images e
+        ON e.message_id = m.message_id AND e.channel = m.channel
+    WHERE (m.file_path ILIKE '%.jpg' OR m.file_path ILIKE '%.png')
+      AND (e.message_id IS NULL
+           OR e.model_version <> :model_version
+           OR e.file_path IS DISTINCT FROM m.file_path)
+      AND (CAST(:channels AS TEXT[]) IS NULL OR m.channel = ANY(:channels))
 """
 
-try:
+
+@lru_cache(maxsize=None)
+def get_engine():
+    print("🔧 Connecting to:", f"{DB_USER}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+    db_url = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    return create_engine(db_url)
+
+
+# Partitioned by month of the message the image belongs to, like raw.telegram_messages
+DETECTIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS raw.image_detections (
+        message_id BIGINT,
+        channel TEXT,
+        message_date TIMESTAMP,
+        class TEXT,
+        confidence DOUBLE PRECISION,
+        image_hash TEXT,
+        model_version TEXT,
+        -- Box corners in pixels, so the API can render annotations without the model
+        x1 DOUBLE PRECISION,
+        y1 DOUBLE PRECISION,
+        x2 DOUBLE PRECISION,
+        y2 DOUBLE PRECISION
+    ) PARTITION BY RANGE (message_date);
+    CREATE INDEX IF NOT EXISTS image_detections_message_idx ON raw.image_detections (message_id, channel);
+"""
+
+
+def ensure_tables(engine):
+    with engine.begin() as conn:
+        # Per-channel enrichment runs in parallel; only one of them creates the tables
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('raw.image_detections'))"))
+        conn.execute(text("CREATE SCHEMA IF NOT EXISTS raw"))
+        cursor = conn.connection.cursor()
+        if partitions.is_partitioned(cursor, "raw.image_detections") is False:
+            # Older runs created the table through to_sql without these columns
+            for column, column_type in (("image_hash", "TEXT"), ("model_version", "TEXT"),
+                                        ("x1", "DOUBLE PRECISION"), ("y1", "DOUBLE PRECISION"),
+                                        ("x2", "DOUBLE PRECISION"), ("y2", "DOUBLE PRECISION")):
+                conn.execute(text(
+                    f"ALTER TABLE raw.image_detections ADD COLUMN IF NOT EXISTS {column} {column_type}"
+                ))
+            # Detections of the old heap take the date of their message
+            partitions.convert_to_partitioned(
+                cursor, "raw.image_detections", DETECTIONS_TABLE_SQL,
+                """
+                SELECT DISTINCT date_trunc('month', m.date)
+                FROM {old} d
+                JOIN raw.telegram_messages m ON m.message_id = d.message_id AND m.channel = d.channel
+                """,
+                """
+                INSERT INTO raw.image_detections
+                    (message_id, channel, message_date, class, confidence, image_hash, model_version,
+                     x1, y1, x2, y2)
+                SELECT d.message_id, d.channel, m.date, d.class, d.confidence, d.image_hash,
+                       d.model_version, d.x1, d.y1, d.x2, d.y2
+                FROM {old} d
+                LEFT JOIN raw.telegram_messages m ON m.message_id = d.message_id AND m.channel = d.channel
+                """,
+            )
+        else:
+            conn.execute(text(DETECTIONS_TABLE_SQL))
+            conn.execute(text("CREATE TABLE IF NOT EXISTS raw.image_detections_undated "
+                              "PARTITION OF raw.image_detections DEFAULT"))
+        # Which message images have been enriched, from which file, by which model
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS raw.enriched_images (
+                message_id BIGINT,
+                channel TEXT,
+                file_path TEXT,
+                image_hash TEXT,
+                model_version TEXT,
+                enriched_at TIMESTAMP DEFAULT now(),
+                PRIMARY KEY (message_id, channel)
+            )
+        """))
+        # dbt's incremental fct_image_detections reads rows enriched since its last run
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS enriched_images_enriched_at_idx
+            ON raw.enriched_images (enriched_at)
+        """))
+        # Detections per unique image content, shared by reposts across channels
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS raw.image_enrichment_cache (
+                image_hash TEXT,
+                model_version TEXT,
+                detections JSONB,
+                created_at TIMESTAMP DEFAULT now(),
+                PRIMARY KEY (image_hash, model_version)
+            )
+        """))
+
+
+def get_model_version(model_path=MODEL_PATH, backend=BACKEND, int8=INT8, imgsz=IMAGE_SIZE):
+    """Identify the model by file name and weights digest, so retrained weights re-run enrichment.
+
+    The backend, precision and input size are part of the version too, since
+    they change the detections. Versions without them name detections made
+    before images were downscaled to IMAGE_SIZE at decode time, so those
+    images are enriched again.
+    """
+    if not os.path.exists(model_path):
+        version = os.path.basename(model_path)
+    else:
+        digest = hashlib.sha256()
+        with open(model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        version = f"{os.path.basename(model_path)}:{digest.hexdigest()[:12]}"
+    return f"{version}+{backend}{'-int8' if int8 else ''}@{imgsz}"
+
+
+def iter_image_messages(engine, model_version, channels=None, chunk_size=READ_CHUNK_SIZE):
+    """Stream image messages still to enrich through a server-side cursor, ``chunk_size`` rows at a time."""
     with engine.connect() as conn:
-        messages = pd.read_sql(text(query), conn)
-    print(f"✅ Loaded {len(messages)} image messages")
-except Exception as e:
-    print("❌ DB connection/query failed")
-    raise e
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(text(query), {
+            "model_version": model_version,
+            "channels": list(channels) if channels is not None else None,
+        })
+        for row in result:
+            yield dict(row._mapping)
+
+
+def export_path(backend, int8, imgsz, model_path=MODEL_PATH):
+    """Where the export of ``model_path`` for this backend, precision and size is cached."""
+    version = get_model_version(model_path, backend, int8, imgsz)
+    name = version.replace(":", "-").replace("+", "-").replace("@", "-").replace(".", "_")
+    # Ultralytics recognises exports by their .onnx suffix or _openvino_model directory name
+    return os.path.join(MODEL_CACHE_DIR, f"{name}.onnx" if backend == "onnx" else f"{name}_openvino_model")
 
-# === Load YOLO model ===
-model = YOLO("yolov8n.pt")
 
-# === Process each image ===
-results_list = []
+def export_model(backend=BACKEND, int8=INT8, imgsz=IMAGE_SIZE, model_path=MODEL_PATH):
+    """Return the model file for ``backend``, exporting it into MODEL_CACHE_DIR on first use."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown ENRICH_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+    if backend == "torch":
+        if int8:
+            raise ValueError("ENRICH_INT8 needs the onnx or openvino backend")
+        return model_path
 
-for _, row in messages.iterrows():
-    message_id = row["message_id"]
-    image_path = row["file_path"]
-    channel = row["channel"]
+    target = export_path(backend, int8, imgsz, model_path)
+    if os.path.exists(target):
+        return target
 
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    # Per-channel runs start together; one exports while the others wait for its result
+    with open(os.path.join(MODEL_CACHE_DIR, ".export.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(target):
+            return target
+        from ultralytics import YOLO
+        print(f"🔧 Exporting {model_path} for {backend}{' (INT8)' if int8 else ''} at {imgsz}px")
+        # dynamic=True keeps the batch dimension open for batched inference
+        if backend == "openvino":
+            exported = YOLO(model_path).export(format="openvino", imgsz=imgsz, int8=int8, dynamic=True)
+        else:
+            exported = YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=True)
+            if int8:
+                exported = quantize_onnx(exported)
+        shutil.move(exported, target)
+    return target
+
+
+def quantize_onnx(path):
+    """Dynamically quantize an ONNX export to INT8 weights, keeping the metadata Ultralytics reads."""
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = path.replace(".onnx", "-int8.onnx")
+    quantize_dynamic(path, quantized_path, weight_type=QuantType.QUInt8)
+    metadata = {prop.key: prop.value for prop in onnx.load(path).metadata_props}
+    quantized = onnx.load(quantized_path)
+    onnx.helper.set_model_props(quantized, metadata)
+    onnx.save(quantized, quantized_path)
+    os.remove(path)
+    return quantized_path
+
+
+@lru_cache(maxsize=None)
+def load_model(backend=BACKEND, int8=INT8):
+    # Imported and loaded on first use: ultralytics and the weights take seconds to load
+    from ultralytics import YOLO
+    model = YOLO(export_model(backend, int8, IMAGE_SIZE), task="detect")
+    # Exported models have a fixed input size; predict at the size they were exported for
+    model.overrides["imgsz"] = IMAGE_SIZE
+    return model
+
+
+# === Pipeline stages ===
+def prefilter(img):
+    """Return why an opened image is not worth running the detector on, or None."""
+    if min(img.size) < MIN_IMAGE_SIDE:
+        return "too small"
+    if MAX_GRAPHIC_COLORS:
+        thumbnail = img.convert("RGB")
+        thumbnail.thumbnail((64, 64))
+        # getcolors returns None once there are more colours than it was asked to count
+        if thumbnail.getcolors(MAX_GRAPHIC_COLORS) is not None:
+            return "graphic"
+    return None
+
+
+def decode_image(item):
+    """Hash, prefilter and decode one image; runs on the decode pool.
+
+    Images are decoded at about IMAGE_SIZE, which the detector resizes to
+    anyway; ``scale`` maps boxes back to the original pixels. Returns
+    (item with image_hash and scale, RGB image), (item marked ``prefiltered``,
+    None) when the prefilter skips it, or (item, None) when unreadable.
+    """
+    image_path = item["file_path"]
     if not os.path.exists(image_path):
         print(f"⚠️ File not found: {image_path}")
-        continue
-
+        return item, None
     try:
-        results = model(image_path)
+        with open(image_path, "rb") as f:
+            data = f.read()
+        # The scraper's media store already hashed the file; hash legacy files here
+        item = dict(item, image_hash=item.get("image_hash") or hashlib.sha256(data).hexdigest())
+        with Image.open(io.BytesIO(data)) as img:
+            reason = prefilter(img)
+            if reason:
+                return dict(item, prefiltered=reason), None
+            width, height = img.size
+            # JPEGs decode straight to 1/2, 1/4 or 1/8 scale, skipping most of the work
+            img.draft("RGB", (IMAGE_SIZE, IMAGE_SIZE))
+            image = img.convert("RGB")
+        image.thumbnail((IMAGE_SIZE, IMAGE_SIZE))
+        return dict(item, scale=(width / image.width, height / image.height)), image
+    except Exception as e:
+        print(f"❌ Could not decode {image_path}: {e}")
+        return item, None
 
-        # Create output directory
-        output_dir = os.path.join("data/yolo_outputs", channel)
-        os.makedirs(output_dir, exist_ok=True)
 
+def prefetch(items, executor, depth):
+    """Yield ``executor``-decoded items in order, keeping at most ``depth`` in flight."""
+    in_flight = deque()
+    for item in items:
+        in_flight.append(executor.submit(decode_image, item))
+        if len(in_flight) >= depth:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def batched(decoded, batch_size):
+    batch = []
+    for item, image in decoded:
+        if image is None and not item.get("prefiltered"):
+            continue
+        batch.append((item, image))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-        # Plot and save annotated image
-        annotated_img = results[0].plot()
-        output_path = os.path.join(output_dir, f"{channel}_{message_id}.jpg")
-        Image.fromarray(annotated_img).save(output_path)
 
+def extract_boxes(result, names, scale=(1.0, 1.0)):
+    """Reduce a YOLO result to (class_name, confidence, x1, y1, x2, y2) tuples in original image pixels."""
+    sx, sy = scale
+    boxes = []
+    for box in result.boxes:
+        x1, y1, x2, y2 = (float(v) for v in box.xyxy[0])
+        boxes.append((names[int(box.cls[0])], float(box.conf[0]), x1 * sx, y1 * sy, x2 * sx, y2 * sy))
+    return boxes
 
-        # Prepare detection list for this image
-        image_detections = []
 
-        for r in results:
-            for box in r.boxes:
-                cls_id = int(box.cls[0])
-                class_name = model.names[cls_id]
-                confidence = float(box.conf[0])
+def to_detections(item, boxes):
+    detections = []
+    for class_name, confidence, *xyxy in boxes:
+        # Cache entries written before boxes were stored only hold class and confidence
+        x1, y1, x2, y2 = xyxy if len(xyxy) == 4 else (None,) * 4
+        detections.append({
+            "message_id": item["message_id"],
+            "channel": item["channel"],
+            "message_date": item.get("message_date"),
+            "class": class_name,
+            "confidence": confidence,
+            "image_hash": item["image_hash"],
+            "x1": x1, "y1": y1, "x2": x2, "y2": y2
+        })
+    return detections
 
-                detection = {
-                    "message_id": message_id,
-                    "channel": channel,
-                    "class": class_name,
-                    "confidence": confidence
-                }
 
-                results_list.append(detection)
-                image_detections.append(detection)
+def write_outputs(item, result, detections):
+    """Save the annotated image and per-image detections JSON; runs on the writer pool."""
+    channel = item["channel"]
+    message_id = item["message_id"]
+    try:
+        # Create output directory
+        output_dir = os.path.join(OUTPUT_ROOT, channel)
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Plot and save annotated image
+        annotated_img = result.plot()
+        output_path = os.path.join(output_dir, f"{channel}_{message_id}.jpg")
+        # plot() returns BGR; flip to RGB for PIL
+        Image.fromarray(annotated_img[..., ::-1]).save(output_path)
 
         # Save per-image detections to JSON
-        if image_detections:
+        if detections:
             json_output_path = os.path.join(output_dir, f"{channel}_{message_id}_detections.json")
             with open(json_output_path, "w", encoding="utf-8") as f:
-                json.dump(image_detections, f, indent=4)
-
+                json.dump(detections, f, indent=4)
     except Exception as e:
-        print(f"❌ YOLO failed on {image_path}: {e}")
+        print(f"❌ Failed to write outputs for {channel}/{message_id}: {e}")
+
+
+def iter_enrichment(messages, model, batch_size=BATCH_SIZE, lookup_cached=None,
+                    hash_cache_size=HASH_CACHE_SIZE):
+    """Run YOLO over image messages with prefetched decoding and batched inference.
+
+    ``messages`` is an iterable of dicts with message_id, file_path and channel.
+    Images are keyed by content hash: a hash seen earlier in the run, or
+    returned by ``lookup_cached(hashes) -> {hash: boxes}``, reuses those
+    boxes instead of running the model again. Images the prefilter skips are
+    processed with no detections. Annotated images are only written (on a
+    background pool) when ENRICH_RENDER_OUTPUTS is set.
+
+    Yields (detections, processed items, {hash: boxes} newly inferred) per batch.
+    """
+    known = OrderedDict()  # most recent ``hash_cache_size`` hashes only
+    with ThreadPoolExecutor(DECODE_WORKERS, thread_name_prefix="decode") as decoder, \
+            ThreadPoolExecutor(WRITE_WORKERS, thread_name_prefix="write") as writer:
+        decoded = prefetch(messages, decoder, depth=batch_size * PREFETCH_BATCHES)
+        for batch in batched(decoded, batch_size):
+            unknown = {item["image_hash"] for item, image in batch if image is not None} - known.keys()
+            if lookup_cached and unknown:
+                known.update(lookup_cached(unknown))
+
+            # One inference per distinct unseen image, even if reposted within the batch
+            to_infer = {}
+            for item, image in batch:
+                if image is not None and item["image_hash"] not in known:
+                    to_infer.setdefault(item["image_hash"], (item, image))
+
+            detections, processed, fresh = [], [], {}
+            if to_infer:
+                started = time.perf_counter()
+                try:
+                    results = model([image for _, image in to_infer.values()], verbose=False)
+                except Exception as e:
+                    print(f"❌ YOLO failed on batch of {len(to_infer)} images: {e}")
+                    results = []
+                metrics.INFERENCE_SECONDS.observe(time.perf_counter() - started)
+                for (image_hash, (item, _)), result in zip(to_infer.items(), results):
+                    boxes = extract_boxes(result, model.names, item["scale"])
+                    known[image_hash] = fresh[image_hash] = boxes
+                    if RENDER_OUTPUTS:
+                        writer.submit(write_outputs, item, result, to_detections(item, boxes))
+
+            skipped = 0
+            for item, image in batch:
+                if image is None:
+                    processed.append(item)
+                    skipped += 1
+                elif item["image_hash"] in known:
+                    detections.extend(to_detections(item, known[item["image_hash"]]))
+                    processed.append(item)
+            metrics.IMAGES_ENRICHED.labels(source="inferred").inc(len(fresh))
+            metrics.IMAGES_ENRICHED.labels(source="prefiltered").inc(skipped)
+            metrics.IMAGES_ENRICHED.labels(source="cached").inc(len(processed) - len(fresh) - skipped)
+            yield detections, processed, fresh
+
+            while len(known) > hash_cache_size:
+                known.popitem(last=False)
+
+
+def run_enrichment(messages, model, batch_size=BATCH_SIZE, lookup_cached=None):
+    """Collect every batch of ``iter_enrichment``; returns (detections, processed items, fresh)."""
+    results_list, processed, fresh = [], [], {}
+    for batch_detections, batch_processed, batch_fresh in iter_enrichment(
+            messages, model, batch_size, lookup_cached):
+        results_list.extend(batch_detections)
+        processed.extend(batch_processed)
+        fresh.update(batch_fresh)
+    return results_list, processed, fresh
+
 
-# === Save all detections to DB ===
-if results_list:
-    df_results = pd.DataFrame(results_list)
+def lookup_cached(engine, model_version, hashes):
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT image_hash, detections
+            FROM raw.image_enrichment_cache
+            WHERE model_version = :model_version AND image_hash = ANY(:hashes)
+        """), {"model_version": model_version, "hashes": list(hashes)}).all()
+    return {image_hash: [tuple(box) for box in detections] for image_hash, detections in rows}
+
+
+def write_detections(conn, results_list, processed, fresh, model_version):
+    """Replace detections for processed messages and record them as enriched, on ``conn``."""
+    if fresh:
+        conn.execute(text("""
+            INSERT INTO raw.image_enrichment_cache (image_hash, model_version, detections)
+            VALUES (:image_hash, :model_version, CAST(:detections AS JSONB))
+            ON CONFLICT (image_hash, model_version) DO NOTHING
+        """), [
+            {"image_hash": h, "model_version": model_version, "detections": json.dumps(boxes)}
+            for h, boxes in fresh.items()
+        ])
+    keys = [{"message_id": item["message_id"], "channel": item["channel"]} for item in processed]
+    conn.execute(text("""
+        DELETE FROM raw.image_detections
+        WHERE message_id = :message_id AND channel = :channel
+    """), keys)
+    if results_list:
+        partitions.ensure_partitions(conn.connection.cursor(), "raw.image_detections",
+                                     [d["message_date"] for d in results_list])
+        conn.execute(text("""
+            INSERT INTO raw.image_detections
+                (message_id, channel, message_date, class, confidence, image_hash, model_version,
+                 x1, y1, x2, y2)
+            VALUES (:message_id, :channel, :message_date, :class, :confidence, :image_hash, :model_version,
+                    :x1, :y1, :x2, :y2)
+        """), [dict(d, model_version=model_version) for d in results_list])
+    conn.execute(text("""
+        INSERT INTO raw.enriched_images (message_id, channel, file_path, image_hash, model_version)
+        VALUES (:message_id, :channel, :file_path, :image_hash, :model_version)
+        ON CONFLICT (message_id, channel) DO UPDATE
+        SET file_path = EXCLUDED.file_path,
+            image_hash = EXCLUDED.image_hash,
+            model_version = EXCLUDED.model_version,
+            enriched_at = now()
+    """), [
+        {"message_id": item["message_id"], "channel": item["channel"], "file_path": item["file_path"],
+         "image_hash": item["image_hash"], "model_version": model_version}
+        for item in processed
+    ])
+
+
+def save_detections(engine, results_list, processed, fresh, model_version):
+    """Replace detections for processed messages and record them as enriched, in one transaction."""
+    if not processed:
+        print("⚠️ No images processed")
+        return
     try:
-        df_results.to_sql("image_detections", engine, schema="raw", if_exists="replace", index=False)
-        print(f"✅ Saved {len(df_results)} detections to raw.image_detections")
+        with engine.begin() as conn:
+            write_detections(conn, results_list, processed, fresh, model_version)
+        print(f"✅ Saved {len(results_list)} detections for {len(processed)} images to raw.image_detections")
     except Exception as e:
         print("❌ Failed to save detections")
         raise e
-else:
-    print("⚠️ No detections to save")
+
+
+def enrich_images(channels=None, commit_every=COMMIT_EVERY):
+    """Detect objects in new or changed images of ``channels`` (all when None).
+
+    Messages stream from a server-side cursor and detections are committed
+    every ``commit_every`` images, so memory stays flat and a crash only
+    loses the uncommitted batch: committed images are not selected again.
+    Returns counts of images processed and images that needed fresh inference.
+    """
+    with metrics.stage("enrich", channels=",".join(channels or ["all"])):
+        return _enrich_images(channels, commit_every)
+
+
+def _enrich_images(channels, commit_every):
+    engine = get_engine()
+    try:
+        ensure_tables(engine)
+        model_version = get_model_version()
+        messages = iter_image_messages(engine, model_version, channels)
+        first = next(messages, None)
+        if first is None:
+            print("✅ No new or changed images to enrich")
+            return {"images": 0, "inferred": 0}
+        model = load_model()
+
+        results_list, processed, fresh = [], [], {}
+        totals = {"images": 0, "inferred": 0}
+
+        def flush():
+            with metrics.SAVE_SECONDS.time():
+                save_detections(engine, results_list, processed, fresh, model_version)
+            totals["images"] += len(processed)
+            totals["inferred"] += len(fresh)
+            results_list.clear()
+            processed.clear()
+            fresh.clear()
+
+        for batch_detections, batch_processed, batch_fresh in iter_enrichment(
+            chain([first], messages), model,
+            lookup_cached=lambda hashes: lookup_cached(engine, model_version, hashes)
+        ):
+            results_list.extend(batch_detections)
+            processed.extend(batch_processed)
+            fresh.update(batch_fresh)
+            if len(processed) >= commit_every:
+                flush()
+        if processed:
+            flush()
+        print(f"✅ Enriched {totals['images']} images; ran inference on {totals['inferred']} "
+              f"unique images, reused cached detections for the rest")
+        return totals
+    finally:
+        # Returns pooled connections; the cached engine reconnects on next use
+        engine.dispose()
+
+
+def main():
+    enrich_images()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# src/enrich_queue.py
+"""Enrichment work queue in Postgres, drained by any number of workers.
+
+Image messages that need enrichment are queued in raw.enrichment_queue.
+Workers on any machine claim small batches with ``FOR UPDATE SKIP LOCKED``:
+a claim leases its rows under a fresh token until ``visible_at``, after
+which another worker may take them over. Results are committed in the same
+transaction that marks the rows done, and only for rows the worker's token
+still holds, so every image's detections are written exactly once even
+when a slow worker loses its lease. Failed images are retried with backoff
+and moved to ``dead`` after ENRICH_QUEUE_MAX_ATTEMPTS.
+
+    python src/enrich_queue.py                # enqueue, then drain until empty
+    python src/enrich_queue.py --forever      # keep polling for new work
+    python src/enrich_queue.py --stats
+    python src/enrich_queue.py --requeue-dead
+"""
+
+import argparse
+import os
+import socket
+import time
+import uuid
+
+from sqlalchemy import text
+
+try:
+    from src import enrich, metrics
+except ImportError:  # run as a script, e.g. python src/enrich_queue.py
+    import enrich
+    import metrics
+
+# === Queue settings ===
+CLAIM_SIZE = int(os.getenv("ENRICH_QUEUE_CLAIM_SIZE", "64"))
+# A lease must outlast one claimed batch; expired leases are taken over by other workers
+LEASE_SECONDS = float(os.getenv("ENRICH_QUEUE_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("ENRICH_QUEUE_MAX_ATTEMPTS", "5"))
+# Retry n waits RETRY_SECONDS * 2^(n-1), at most an hour
+RETRY_SECONDS = float(os.getenv("ENRICH_QUEUE_RETRY_SECONDS", "30"))
+POLL_SECONDS = float(os.getenv("ENRICH_QUEUE_POLL_SECONDS", "10"))
+
+STATUSES = ("pending", "leased", "done", "dead")
+
+
+def ensure_queue(engine):
+    enrich.ensure_tables(engine)
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('raw.enrichment_queue'))"))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS raw.enrichment_queue (
+                message_id BIGINT,
+                channel TEXT,
+                file_path TEXT,
+                image_hash TEXT,
+                message_date TIMESTAMP,
+                model_version TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                visible_at TIMESTAMP NOT NULL DEFAULT now(),
+                lease_owner TEXT,
+                lease_token TEXT,
+                last_error TEXT,
+                enqueued_at TIMESTAMP DEFAULT now(),
+                updated_at TIMESTAMP DEFAULT now(),
+                PRIMARY KEY (message_id, channel)
+            )
+        """))
+        # Queues created before detections were partitioned by message date
+        conn.execute(text("ALTER TABLE raw.enrichment_queue ADD COLUMN IF NOT EXISTS message_date TIMESTAMP"))
+        # Claims only scan rows that can still be handed out
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS enrichment_queue_ready_idx
+            ON raw.enrichment_queue (visible_at)
+            WHERE status IN ('pending', 'leased')
+        """))
+
+
+def enqueue(engine, model_version, channels=None):
+    """Queue image messages not yet enriched by ``model_version``; returns rows queued or re-queued.
+
+    Done rows come back when their file or the model changed. Dead rows stay
+    dead unless their file or the model changed; see ``requeue_dead``.
+    """
+    with engine.begin() as conn:
+        # Workers starting together would otherwise deadlock upserting the same rows
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('raw.enrichment_queue'))"))
+        result = conn.execute(text(f"""
+            INSERT INTO raw.enrichment_queue AS q (message_id, channel, file_path, image_hash, message_date,
+                                                 model_version)
+            SELECT message_id, channel, file_path, image_hash, message_date, :model_version
+            FROM ({enrich.query}) todo
+            ON CONFLICT (message_id, channel) DO UPDATE
+            SET file_path = EXCLUDED.file_path,
+                image_hash = EXCLUDED.image_hash,
+                message_date = EXCLUDED.message_date,
+                model_version = EXCLUDED.model_version,
+                status = 'pending',
+                attempts = 0,
+                visible_at = now(),
+                lease_owner = NULL,
+                lease_token = NULL,
+                last_error = NULL,
+                enqueued_at = now(),
+                updated_at = now()
+            WHERE q.status = 'done'
+               OR (q.file_path, q.model_version) IS DISTINCT FROM (EXCLUDED.file_path, EXCLUDED.model_version)
+        """), {"model_version": model_version, "channels": list(channels) if channels is not None else None})
+        return result.rowcount
+
+
+def claim(engine, owner, model_version, channels=None, limit=CLAIM_SIZE,
+          lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+    """Lease up to ``limit`` ready rows; returns (lease token, claimed items)."""
+    token = uuid.uuid4().hex
+    params = {
+        "owner": owner, "token": token, "model_version": model_version, "limit": limit,
+        "lease_seconds": lease_seconds, "max_attempts": max_attempts,
+        "channels": list(channels) if channels is not None else None,
+    }
+    with engine.begin() as conn:
+        # Leases that expired on their last attempt belonged to workers that died on them
+        dead = conn.execute(text("""
+            UPDATE raw.enrichment_queue
+            SET status = 'dead', lease_token = NULL, updated_at = now(),
+                last_error = COALESCE(last_error, 'lease expired on the last attempt')
+            WHERE status IN ('pending', 'leased') AND visible_at <= now() AND attempts >= :max_attempts
+        """), params).rowcount
+        rows = conn.execute(text("""
+            WITH ready AS (
+                SELECT message_id, channel
+                FROM raw.enrichment_queue
+                WHERE status IN ('pending', 'leased')
+                  AND visible_at <= now()
+                  AND model_version = :model_version
+                  AND (CAST(:channels AS TEXT[]) IS NULL OR channel = ANY(:channels))
+                ORDER BY visible_at
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE raw.enrichment_queue q
+            SET status = 'leased',
+                attempts = q.attempts + 1,
+                visible_at = now() + make_interval(secs => :lease_seconds),
+                lease_owner = :owner,
+                lease_token = :token,
+                updated_at = now()
+            FROM ready
+            WHERE q.message_id = ready.message_id AND q.channel = ready.channel
+            RETURNING q.message_id, q.channel, q.file_path, q.image_hash, q.message_date, q.attempts
+        """), params).mappings().all()
+    if dead:
+        metrics.QUEUE_ITEMS.labels(outcome="dead").inc(dead)
+    metrics.QUEUE_ITEMS.labels(outcome="claimed").inc(len(rows))
+    return token, [dict(row) for row in rows]
+
+
+def _keys(items):
+    return {
+        "message_ids": [item["message_id"] for item in items],
+        "channels": [item["channel"] for item in items],
+    }
+
+
+def complete(engine, token, results_list, processed, fresh, model_version):
+    """Write results for the processed items this lease still holds; returns how many were written."""
+    with engine.begin() as conn:
+        owned = conn.execute(text("""
+            UPDATE raw.enrichment_queue
+            SET status = 'done', lease_token = NULL, last_error = NULL, updated_at = now()
+            WHERE lease_token = :token AND status = 'leased'
+              AND (message_id, channel) IN (
+                  SELECT * FROM unnest(CAST(:message_ids AS BIGINT[]), CAST(:channels AS TEXT[])))
+            RETURNING message_id, channel
+        """), dict(_keys(processed), token=token)).all()
+        owned = {tuple(row) for row in owned}
+        # Rows another worker has since taken over are left for that worker to write
+        processed = [item for item in processed if (item["message_id"], item["channel"]) in owned]
+        results_list = [d for d in results_list if (d["message_id"], d["channel"]) in owned]
+        if processed:
+            enrich.write_detections(conn, results_list, processed, fresh, model_version)
+    metrics.QUEUE_ITEMS.labels(outcome="done").inc(len(processed))
+    return len(processed)
+
+
+def fail(engine, token, items, error, max_attempts=MAX_ATTEMPTS, retry_seconds=RETRY_SECONDS):
+    """Release failed items for a later retry, or to ``dead`` once out of attempts; returns (retried, dead)."""
+    if not items:
+        return 0, 0
+    with engine.begin() as conn:
+        statuses = conn.execute(text("""
+            UPDATE raw.enrichment_queue
+            SET status = CASE WHEN attempts >= :max_attempts THEN 'dead' ELSE 'pending' END,
+                visible_at = now() + make_interval(secs => LEAST(:retry_seconds * power(2, attempts - 1), 3600)),
+                lease_token = NULL,
+                last_error = :error,
+                updated_at = now()
+            WHERE lease_token = :token AND status = 'leased'
+              AND (message_id, channel) IN (
+                  SELECT * FROM unnest(CAST(:message_ids AS BIGINT[]), CAST(:channels AS TEXT[])))
+            RETURNING status
+        """), dict(_keys(items), token=token, error=error, max_attempts=max_attempts,
+                   retry_seconds=retry_seconds)).scalars().all()
+    dead = statuses.count("dead")
+    metrics.QUEUE_ITEMS.labels(outcome="retried").inc(len(statuses) - dead)
+    metrics.QUEUE_ITEMS.labels(outcome="dead").inc(dead)
+    return len(statuses) - dead, dead
+
+
+def requeue_dead(engine, channels=None):
+    """Give dead items a fresh set of attempts, e.g. after fixing what killed them."""
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            UPDATE raw.enrichment_queue
+            SET status = 'pending', attempts = 0, visible_at = now(), last_error = NULL, updated_at = now()
+            WHERE status = 'dead' AND (CAST(:channels AS TEXT[]) IS NULL OR channel = ANY(:channels))
+        """), {"channels": list(channels) if channels is not None else None}).rowcount
+
+
+def queue_depths(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT status, count(*) FROM raw.enrichment_queue GROUP BY status")).all()
+    depths = dict.fromkeys(STATUSES, 0) | dict(rows)
+    for status, count in depths.items():
+        metrics.QUEUE_DEPTH.labels(status=status).set(count)
+    return depths
+
+
+def process_batch(engine, token, items, model, model_version):
+    """Enrich one claimed batch and settle every item in it; returns (done, retried, dead)."""
+    missing = [item for item in items if not os.path.exists(item["file_path"])]
+    present = [item for item in items if os.path.exists(item["file_path"])]
+    results_list, processed, fresh = [], [], {}
+    try:
+        results_list, processed, fresh = enrich.run_enrichment(
+            present, model,
+            lookup_cached=lambda hashes: enrich.lookup_cached(engine, model_version, hashes)
+        )
+    except Exception as e:
+        print(f"❌ Enrichment failed for a batch of {len(present)} images: {e}")
+        retried, dead = fail(engine, token, items, f"batch failed: {e}")
+        return 0, retried, dead
+
+    done = complete(engine, token, results_list, processed, fresh, model_version)
+    finished = {(item["message_id"], item["channel"]) for item in processed}
+    unreadable = [item for item in present if (item["message_id"], item["channel"]) not in finished]
+    retried, dead = fail(engine, token, missing, "file not found")
+    more_retried, more_dead = fail(engine, token, unreadable, "image could not be decoded or inferred")
+    return done, retried + more_retried, dead + more_dead
+
+
+def run_worker(channels=None, forever=False, claim_size=CLAIM_SIZE, worker_id=None, fill=True):
+    """Claim and enrich batches until the queue is empty (or forever); returns item counts."""
+    with metrics.stage("enrich", channels=",".join(channels or ["all"])):
+        return _run_worker(channels, forever, claim_size, worker_id, fill)
+
+
+def _run_worker(channels, forever, claim_size, worker_id, fill):
+    engine = enrich.get_engine()
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    totals = {"claimed": 0, "done": 0, "retried": 0, "dead": 0}
+    try:
+        ensure_queue(engine)
+        model_version = enrich.get_model_version()
+        if fill:
+            print(f"📥 Queued {enqueue(engine, model_version, channels)} images for enrichment")
+        model = None
+        while True:
+            token, items = claim(engine, worker_id, model_version, channels, claim_size)
+            if not items:
+                if not forever:
+                    break
+                time.sleep(POLL_SECONDS)
+                if fill:
+                    enqueue(engine, model_version, channels)
+                continue
+            # Loaded on the first claim, so idle workers never pay for the model
+            model = model or enrich.load_model()
+            done, retried, dead = process_batch(engine, token, items, model, model_version)
+            totals["claimed"] += len(items)
+            totals["done"] += done
+            totals["retried"] += retried
+            totals["dead"] += dead
+        depths = queue_depths(engine)
+        print(f"✅ Worker {worker_id}: {totals['done']} images enriched, {totals['retried']} to retry, "
+              f"{totals['dead']} dead; queue: {depths}")
+        return totals
+    finally:
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drain the enrichment work queue.")
+    parser.add_argument("--channels", help="comma-separated channels to work on (default: all)")
+    parser.add_argument("--forever", action="store_true", help="keep polling once the queue is empty")
+    parser.add_argument("--no-enqueue", action="store_true", help="only drain, leave queueing to other workers")
+    parser.add_argument("--stats", action="store_true", help="print queue depth by status and exit")
+    parser.add_argument("--requeue-dead", action="store_true", help="retry dead items and exit")
+    args = parser.parse_args()
+    channels = args.channels.split(",") if args.channels else None
+
+    if args.stats or args.requeue_dead:
+        engine = enrich.get_engine()
+        ensure_queue(engine)
+        if args.requeue_dead:
+            print(f"🔁 Re-queued {requeue_dead(engine, channels)} dead items")
+        print(queue_depths(engine))
+        return
+    run_worker(channels, forever=args.forever, fill=not args.no_enqueue)
+
+
+if __name__ == "__main__":
+    main()
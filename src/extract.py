@@ -0,0 +1,400 @@
+# src/extract.py
+"""Product, drug-name and price extraction from message text.
+
+    python src/extract.py                     # extract new or changed messages
+    python src/extract.py --channels a,b
+
+Messages are streamed from raw.telegram_messages in batches of
+``EXTRACT_BATCH_SIZE``. Each batch is case-folded and joined into one
+buffer, and two passes run over that buffer: an Aho-Corasick automaton
+built once from the product dictionary (``EXTRACT_DICTIONARY``), and one
+compiled price pattern. Both are linear in the text, whatever the number
+of dictionary terms. Match offsets are mapped back to their messages by
+bisection. Mentions go to raw.message_products, one row per message and
+product, with the first price that follows the product before the next
+product. Each message is recorded in raw.extracted_messages with the
+dictionary version, so a message is extracted again only when its text
+or the dictionary changes.
+
+pyahocorasick, when installed, replaces the pure-Python automaton.
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import os
+import re
+import time
+from bisect import bisect_right
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+try:
+    from src import load, metrics, partitions
+except ImportError:  # run as a script, e.g. python src/extract.py
+    import load
+    import metrics
+    import partitions
+
+# === Settings ===
+load_dotenv()
+DICTIONARY_PATH = os.getenv(
+    "EXTRACT_DICTIONARY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dictionaries", "products.csv")
+)
+BATCH_SIZE = int(os.getenv("EXTRACT_BATCH_SIZE", "20000"))
+# Part of the dictionary version; bump when matching or price parsing changes
+PARSER_VERSION = "1"
+
+
+# === Multi-pattern matcher ===
+class Automaton:
+    """Aho-Corasick automaton with the part of pyahocorasick's API used here.
+
+    ``iter(text)`` yields (end index, value) for every occurrence of every
+    added word in a single pass over ``text``.
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add_word(self, word, value):
+        state = 0
+        for char in word:
+            following = self.goto[state].get(char)
+            if following is None:
+                following = len(self.goto)
+                self.goto[state][char] = following
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = following
+        self.output[state].append(value)
+
+    def make_automaton(self):
+        # Breadth-first, so a state's failure target is finished before its children need it
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                # Words ending at the failure target also end here
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def iter(self, text):
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for value in output[state]:
+                yield index, value
+
+
+def new_automaton():
+    try:
+        import ahocorasick
+    except ImportError:
+        return Automaton()
+    return ahocorasick.Automaton()
+
+
+def normalize(text):
+    """Case-fold and collapse whitespace, so terms and messages compare the same way."""
+    return " ".join((text or "").casefold().split())
+
+
+def is_ethiopic(char):
+    return "\u1200" <= char <= "\u139f"
+
+
+class ProductIndex:
+    """The compiled dictionary: product -> category and an automaton over every alias."""
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.categories = {}
+        self.automaton = new_automaton()
+        seen = {}
+        for row in rows:
+            product = row["product"].strip()
+            self.categories[product] = row.get("category", "").strip() or None
+            for alias in [product] + (row.get("aliases") or "").split("|"):
+                term = normalize(alias)
+                if not term or seen.get(term, product) != product:
+                    if term:
+                        print(f"⚠️ '{alias}' is listed for both {seen[term]} and {product}; keeping {seen[term]}")
+                    continue
+                if term not in seen:
+                    seen[term] = product
+                    self.automaton.add_word(term, (len(term), term, product))
+        self.terms = len(seen)
+        self.automaton.make_automaton()
+
+    def matches(self, buffer):
+        """Yield (start, end, term, product) for dictionary terms standing as words in ``buffer``."""
+        for end, (length, term, product) in self.automaton.iter(buffer):
+            start = end - length + 1
+            if start > 0 and buffer[start - 1].isalnum():
+                continue
+            after = buffer[end + 1] if end + 1 < len(buffer) else " "
+            # Amharic attaches articles and suffixes to the noun, and "500mg" follows names directly
+            if after.isalpha() and not is_ethiopic(term[-1]):
+                continue
+            yield start, end + 1, term, product
+
+
+def dictionary_version(path=DICTIONARY_PATH):
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    return f"{os.path.basename(path)}:{digest}+p{PARSER_VERSION}"
+
+
+@lru_cache(maxsize=None)
+def load_index(path=DICTIONARY_PATH):
+    """Compile the dictionary once per process."""
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    return ProductIndex(rows, dictionary_version(path))
+
+
+# === Prices ===
+AMOUNT = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?"
+CURRENCIES = {
+    "ETB": ("etb", "birr", "br", "ብር"),
+    "USD": ("usd", "$", "dollars", "dollar", "ዶላር"),
+}
+CURRENCY_OF = {token: code for code, tokens in CURRENCIES.items() for token in tokens}
+_currency = "|".join(re.escape(t) for t in sorted(CURRENCY_OF, key=len, reverse=True))
+# "150 birr", "1,200.50 etb", "2 ሺ ብር", "etb 150", "$5", "price: 250", "ዋጋ፦ 250"
+PRICE_PATTERN = re.compile(
+    rf"(?<!\w)(?:(?P<before>{_currency})\.?\s*(?P<amount_after>{AMOUNT})"
+    rf"|(?P<amount>{AMOUNT})\s*(?P<thousands>k|ሺህ|ሺ)?\s*(?P<after>{_currency})(?![a-z])"
+    rf"|(?:price|ዋጋ)\s*[:፦-]*\s*(?P<amount_label>{AMOUNT})(?:\s*(?P<label_currency>{_currency})(?![a-z]))?)"
+)
+
+
+def parse_price(match):
+    """(price, currency) of a PRICE_PATTERN match."""
+    amount = match.group("amount") or match.group("amount_after") or match.group("amount_label")
+    value = float(amount.replace(",", ""))
+    if match.group("thousands"):
+        value *= 1000
+    token = match.group("before") or match.group("after") or match.group("label_currency")
+    return value, CURRENCY_OF[token] if token else "ETB"
+
+
+# === Extraction ===
+def extract_mentions(messages, index):
+    """Product mentions in a batch of messages.
+
+    ``messages`` are dicts with message_id, channel, date and text. Returns
+    one dict per message and product: product, category, matched_text,
+    price and currency (None when no price follows the mention).
+    """
+    texts = [normalize(m["text"]) for m in messages]
+    # Normalized text has no newlines, so no term or price can span two messages
+    buffer = "\n".join(texts)
+    starts, offset = [], 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text) + 1
+
+    found = [[] for _ in messages]
+    for start, end, term, product in index.matches(buffer):
+        found[bisect_right(starts, start) - 1].append((start, end, term, product))
+    prices = [[] for _ in messages]
+    for match in PRICE_PATTERN.finditer(buffer):
+        prices[bisect_right(starts, match.start()) - 1].append(match)
+
+    rows = []
+    for message, mentions, message_prices in zip(messages, found, prices):
+        if not mentions:
+            continue
+        # Leftmost-longest: "amoxicillin clavulanate" wins over the "amoxicillin" inside it
+        mentions.sort(key=lambda m: (m[0], m[0] - m[1]))
+        kept, covered = [], -1
+        for mention in mentions:
+            if mention[0] >= covered:
+                kept.append(mention)
+                covered = mention[1]
+
+        by_product = {}
+        price_index = 0
+        for position, (start, end, term, product) in enumerate(kept):
+            following = kept[position + 1][0] if position + 1 < len(kept) else len(buffer)
+            while price_index < len(message_prices) and message_prices[price_index].start() < end:
+                price_index += 1
+            price = currency = None
+            if price_index < len(message_prices) and message_prices[price_index].start() < following:
+                price, currency = parse_price(message_prices[price_index])
+            row = by_product.get(product)
+            if row is None:
+                by_product[product] = {
+                    "message_id": message["message_id"],
+                    "channel": message["channel"],
+                    "message_date": message["date"],
+                    "product": product,
+                    "category": index.categories.get(product),
+                    "matched_text": term,
+                    "price": price,
+                    "currency": currency,
+                }
+            elif row["price"] is None and price is not None:
+                row["price"], row["currency"] = price, currency
+        rows.extend(by_product.values())
+    return rows
+
+
+# === Database ===
+PRODUCTS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS raw.message_products (
+        message_id BIGINT,
+        channel TEXT,
+        message_date TIMESTAMP,
+        product TEXT,
+        category TEXT,
+        matched_text TEXT,
+        price NUMERIC(14, 2),
+        currency TEXT
+    ) PARTITION BY RANGE (message_date);
+    CREATE INDEX IF NOT EXISTS message_products_message_idx ON raw.message_products (message_id, channel);
+    CREATE TABLE IF NOT EXISTS raw.message_products_undated PARTITION OF raw.message_products DEFAULT;
+"""
+
+QUERY_COLUMNS = ("message_id", "channel", "date", "text", "loaded_at")
+query = """
+    SELECT m.message_id, m.channel, m.date, m.text, m.loaded_at
+    FROM raw.telegram_messages m
+    LEFT JOIN raw.extracted_messages e
+        ON e.message_id = m.message_id AND e.channel = m.channel
+    WHERE (e.message_id IS NULL
+           OR e.dictionary_version <> %(version)s
+           OR e.loaded_at IS DISTINCT FROM m.loaded_at)
+      AND (CAST(%(channels)s AS TEXT[]) IS NULL OR m.channel = ANY(%(channels)s))
+"""
+
+
+def ensure_tables(cursor):
+    # Per-channel extraction runs in parallel; only one of them creates the tables
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('raw.message_products'));")
+    cursor.execute("CREATE SCHEMA IF NOT EXISTS raw;")
+    # Partitioned by message month like raw.telegram_messages, and archived with it
+    cursor.execute(PRODUCTS_TABLE_SQL)
+    # Which messages have been extracted, with which dictionary, from which version of the text
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS raw.extracted_messages (
+            message_id INTEGER,
+            channel VARCHAR(255),
+            dictionary_version TEXT,
+            loaded_at TIMESTAMP,
+            extracted_at TIMESTAMP DEFAULT now(),
+            PRIMARY KEY (message_id, channel)
+        );
+    """)
+    # dbt's incremental fct_product_mentions reads messages extracted since its last run
+    cursor.execute("CREATE INDEX IF NOT EXISTS extracted_messages_extracted_at_idx "
+                   "ON raw.extracted_messages (extracted_at);")
+
+
+def copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def write_batch(cursor, messages, mentions, version):
+    """Replace the mentions of ``messages`` and record them as extracted, set-based through COPY."""
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS staging_extracted (
+            message_id INTEGER, channel VARCHAR(255), loaded_at TIMESTAMP
+        ) ON COMMIT DELETE ROWS;
+        CREATE TEMP TABLE IF NOT EXISTS staging_products (LIKE raw.message_products) ON COMMIT DELETE ROWS;
+    """)
+    copy_rows(cursor, "staging_extracted", ("message_id", "channel", "loaded_at"),
+              ((m["message_id"], m["channel"], m["loaded_at"]) for m in messages))
+    columns = ("message_id", "channel", "message_date", "product", "category", "matched_text", "price", "currency")
+    copy_rows(cursor, "staging_products", columns, ([row[c] for c in columns] for row in mentions))
+    partitions.ensure_partitions(cursor, "raw.message_products", [row["message_date"] for row in mentions])
+    cursor.execute("""
+        DELETE FROM raw.message_products p
+        USING staging_extracted s
+        WHERE p.message_id = s.message_id AND p.channel = s.channel;
+    """)
+    cursor.execute(f"INSERT INTO raw.message_products SELECT {', '.join(columns)} FROM staging_products;")
+    cursor.execute("""
+        INSERT INTO raw.extracted_messages (message_id, channel, dictionary_version, loaded_at, extracted_at)
+        SELECT message_id, channel, %s, loaded_at, now() FROM staging_extracted
+        ON CONFLICT (message_id, channel) DO UPDATE
+        SET dictionary_version = EXCLUDED.dictionary_version,
+            loaded_at = EXCLUDED.loaded_at,
+            extracted_at = EXCLUDED.extracted_at;
+    """, (version,))
+
+
+def extract_messages(channels=None, batch_size=BATCH_SIZE, index=None):
+    """Extract every new or changed message; returns (messages, mentions, priced mentions)."""
+    index = index or load_index()
+    reader, writer = load.get_connection(), load.get_connection()
+    totals = [0, 0, 0]
+    try:
+        with writer.cursor() as cursor:
+            ensure_tables(cursor)
+        writer.commit()
+        # Named cursor: rows stream from the server a batch at a time
+        with reader.cursor(name="extract_messages") as source, writer.cursor() as cursor:
+            source.itersize = batch_size
+            source.execute(query, {"version": index.version,
+                                   "channels": list(channels) if channels is not None else None})
+            while True:
+                batch = [dict(zip(QUERY_COLUMNS, row)) for row in source.fetchmany(batch_size)]
+                if not batch:
+                    break
+                started = time.perf_counter()
+                mentions = extract_mentions(batch, index)
+                write_batch(cursor, batch, mentions, index.version)
+                writer.commit()
+                priced = sum(row["price"] is not None for row in mentions)
+                metrics.MESSAGES_EXTRACTED.inc(len(batch))
+                metrics.PRODUCT_MENTIONS.inc(len(mentions))
+                metrics.EXTRACT_BATCH_SECONDS.observe(time.perf_counter() - started)
+                totals[0] += len(batch)
+                totals[1] += len(mentions)
+                totals[2] += priced
+    finally:
+        reader.close()
+        writer.close()
+    return tuple(totals)
+
+
+def run_extraction(channels=None):
+    """Extract ``channels`` (all channels when None) and return the counts."""
+    with metrics.stage("extract", channels=",".join(channels or ["all"])):
+        messages, mentions, priced = extract_messages(channels)
+    return {"messages": messages, "mentions": mentions, "priced": priced}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", help="comma-separated channels (default: all)")
+    args = parser.parse_args()
+    index = load_index()
+    print(f"📖 {index.terms} terms for {len(index.categories)} products ({index.version})")
+    stats = run_extraction(args.channels.split(",") if args.channels else None)
+
+    # === Final Report ===
+    print(f"✅ Extracted {stats['messages']} messages")
+    print(f"✅ Found {stats['mentions']} product mentions, {stats['priced']} with a price")
+
+
+if __name__ == "__main__":
+    main()
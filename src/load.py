@@ -1,9 +1,19 @@
 import os
+import io
+import csv
+import gzip
 import json
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 import psycopg2
 from dotenv import load_dotenv
 
+try:
+    from src import metrics, partitions
+except ImportError:  # run as a script, e.g. python src/load.py
+    import metrics
+    import partitions
+
 # === Load environment variables ===
 load_dotenv()
 db_host = os.getenv('DB_HOST', 'localhost')
@@ -11,104 +21,355 @@ db_port = os.getenv('DB_PORT', '5432')
 db_name = os.getenv('DB_NAME', 'telegram_data')
 db_user = os.getenv('DB_USER', 'postgres')
 db_password = os.getenv('DB_PASSWORD')
+batch_size = int(os.getenv('LOAD_BATCH_SIZE', '50000'))
+
+# === Streaming readers for raw message files ===
+def file_channel(path):
+    """Channel a raw file belongs to, taken from its path."""
+    if path.endswith('.json'):
+        # Legacy layout: {date}/{channel}/{message_id}.json
+        return os.path.basename(os.path.dirname(path))
+    # Current layout: {date}/{channel}.jsonl[.gz]
+    return os.path.basename(path).split('.')[0]
+
+
+def iter_raw_files(raw_dir, channels=None):
+    """Yield raw message files: daily JSONL (optionally gzipped) and legacy per-message JSON.
+
+    Files come oldest day first, so a message saved more than once is read last in
+    its newest version. When ``channels`` is given, only files belonging to those
+    channels are yielded.
+    """
+    for root, dirs, files in os.walk(raw_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(('.jsonl', '.jsonl.gz', '.json')):
+                path = os.path.join(root, file)
+                if channels is None or file_channel(path) in channels:
+                    yield path
+
+
+def iter_jsonl_messages(path):
+    """Stream message dicts from a JSONL file one line at a time, skipping malformed lines."""
+    if path.endswith('.gz'):
+        f = gzip.open(path, 'rt', encoding='utf-8')
+    else:
+        f = open(path, 'r', encoding='utf-8', buffering=1 << 20)
+    with f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️ Skipped malformed line {line_no} in {path}")
+
+
+def iter_file_messages(path):
+    """Yield (channel_name, message) pairs from one raw file."""
+    channel_name = file_channel(path)
+    if path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        # Handle both single message (dict) and list of messages
+        messages = [data] if isinstance(data, dict) else data if isinstance(data, list) else []
+        if not messages:
+            raise ValueError("not a valid JSON object or list")
+    else:
+        messages = iter_jsonl_messages(path)
+
+    for msg in messages:
+        if not isinstance(msg, dict):
+            print(f"⚠️ Skipped non-dict message in {path}")
+            continue
+        yield channel_name, msg
+
+
+# === Row conversion ===
+def parse_message(channel_name, msg, media_root="data/raw/media"):
+    """Turn a raw message dict into a (message_id, date, text, channel, file_path, media_hash) row, or None.
+
+    The date is returned as a naive UTC datetime.
+    """
+    msg_id = msg.get('id')
+    msg_text = msg.get('message') or msg.get('text')
+    msg_date = msg.get('date')
+
+    # Convert date
+    if msg_date:
+        try:
+            msg_date = datetime.fromisoformat(msg_date)
+        except Exception:
+            try:
+                msg_date = datetime.strptime(msg_date, "%Y-%m-%dT%H:%M:%S")
+            except Exception:
+                return None
+    else:
+        return None
+    if msg_date.tzinfo is not None:
+        # raw.telegram_messages.date is a naive UTC TIMESTAMP; converting here rather than
+        # in Postgres keeps partition routing independent of the session TimeZone
+        msg_date = msg_date.astimezone(timezone.utc).replace(tzinfo=None)
+
+    # Get file_path from JSON, or guess it
+    file_path_field = msg.get('file_path')
+    if not file_path_field:
+        guessed_path = os.path.join(media_root, channel_name, f"{channel_name}_{msg_id}.jpg")
+        if os.path.exists(guessed_path):
+            file_path_field = guessed_path
+
+    return msg_id, msg_date, msg_text, channel_name, file_path_field, msg.get('media_hash')
+
+
+def rows_to_csv(rows):
+    """Render rows as CSV for COPY; None becomes an unquoted empty field, i.e. NULL."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for msg_id, msg_date, msg_text, channel_name, file_path_field, media_hash in rows:
+        if msg_text:
+            # PostgreSQL text cannot hold NUL bytes
+            msg_text = msg_text.replace('\x00', '')
+        writer.writerow((msg_id, msg_date.isoformat(), msg_text, channel_name, file_path_field, media_hash))
+    buffer.seek(0)
+    return buffer
+
+
+# === Database helpers ===
+def get_connection():
+    return psycopg2.connect(
+        host=db_host,
+        port=db_port,
+        dbname=db_name,
+        user=db_user,
+        password=db_password
+    )
+
 
-# === Connect to PostgreSQL ===
-conn = psycopg2.connect(
-    host=db_host,
-    port=db_port,
-    dbname=db_name,
-    user=db_user,
-    password=db_password
-)
-cursor = conn.cursor()
-
-# === Drop table with CASCADE to remove dbt views too ===
-cursor.execute("DROP TABLE IF EXISTS raw.telegram_messages CASCADE;")
-conn.commit()
-
-# === Create schema and table ===
-cursor.execute("CREATE SCHEMA IF NOT EXISTS raw;")
-cursor.execute("""
-    CREATE TABLE raw.telegram_messages (
-        id SERIAL PRIMARY KEY,
+# Partitioned by month of the message date, so date-bounded scans skip whole months
+# and cold months can be detached and archived (see archive.py). A unique constraint
+# on a partitioned table must include the partition key, hence the date in it;
+# copy_and_merge keeps (message_id, channel) unique by replacing a row whose date changed.
+MESSAGES_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS raw.telegram_messages (
+        id SERIAL,
         message_id INTEGER,
         date TIMESTAMP,
         text TEXT,
         channel VARCHAR(255),
         file_path VARCHAR(255),
-        CONSTRAINT unique_message_channel UNIQUE (message_id, channel)
-    );
-""")
-conn.commit()
-
-# === Load JSON files ===
-raw_dir = "data/raw/telegram_messages"
-media_root = "data/raw/media"
-loaded_count = 0
-skipped_files = 0
-
-for root, _, files in os.walk(raw_dir):
-    for file in files:
-        if file.endswith('.json'):
-            file_path = os.path.join(root, file)
-            channel_name = os.path.basename(root)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-
-                # Handle both single message (dict) and list of messages
-                messages = [data] if isinstance(data, dict) else data if isinstance(data, list) else []
-                if not messages:
-                    print(f"⚠️ Skipped {file_path} – not a valid JSON object or list")
-                    skipped_files += 1
+        -- When a row was last inserted or changed; incremental dbt models pick up rows newer than their last run
+        loaded_at TIMESTAMP DEFAULT now(),
+        -- sha256 of the stored media, written by the scraper's content-addressed media store
+        media_hash TEXT,
+        CONSTRAINT unique_message_channel UNIQUE (message_id, channel, date)
+    ) PARTITION BY RANGE (date);
+    CREATE INDEX IF NOT EXISTS telegram_messages_loaded_at_idx ON raw.telegram_messages (loaded_at);
+"""
+
+
+def ensure_tables(cursor):
+    # Tables are created once and kept, so dbt views built on them survive every load.
+    # Parallel per-channel loaders serialize here until the caller commits.
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('raw.telegram_messages'));")
+    cursor.execute("CREATE SCHEMA IF NOT EXISTS raw;")
+    if partitions.is_partitioned(cursor, "raw.telegram_messages") is False:
+        # Bring the older heap forward first, so the migrations below see the current columns
+        cursor.execute("ALTER TABLE raw.telegram_messages ADD COLUMN IF NOT EXISTS loaded_at TIMESTAMP DEFAULT now();")
+        cursor.execute("ALTER TABLE raw.telegram_messages ADD COLUMN IF NOT EXISTS media_hash TEXT;")
+        partitions.convert_to_partitioned(
+            cursor, "raw.telegram_messages", MESSAGES_TABLE_SQL,
+            "SELECT DISTINCT date_trunc('month', date) FROM {old} WHERE date IS NOT NULL",
+            """
+            INSERT INTO raw.telegram_messages (id, message_id, date, text, channel, file_path, loaded_at, media_hash)
+            SELECT id, message_id, date, text, channel, file_path, loaded_at, media_hash FROM {old}
+            """,
+        )
+        cursor.execute("""
+            SELECT setval(pg_get_serial_sequence('raw.telegram_messages', 'id'),
+                          COALESCE((SELECT max(id) FROM raw.telegram_messages), 0) + 1, false);
+        """)
+    else:
+        cursor.execute(MESSAGES_TABLE_SQL)
+        cursor.execute("CREATE TABLE IF NOT EXISTS raw.telegram_messages_undated "
+                       "PARTITION OF raw.telegram_messages DEFAULT;")
+    # Manifest of ingested files; a file is reloaded only when its size or mtime changes
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS raw.loaded_files (
+            file_path TEXT PRIMARY KEY,
+            file_size BIGINT,
+            file_mtime DOUBLE PRECISION,
+            row_count INTEGER,
+            loaded_at TIMESTAMP DEFAULT now()
+        );
+    """)
+
+
+def fetch_loaded_files(cursor):
+    cursor.execute("SELECT file_path, file_size, file_mtime FROM raw.loaded_files;")
+    return {path: (size, mtime) for path, size, mtime in cursor.fetchall()}
+
+
+def copy_and_merge(cursor, rows):
+    """COPY rows into a staging table and upsert them into raw.telegram_messages."""
+    # ordinal numbers rows in COPY order, i.e. the order they were read in
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS staging_telegram_messages (
+            ordinal BIGSERIAL,
+            message_id INTEGER,
+            date TIMESTAMP,
+            text TEXT,
+            channel VARCHAR(255),
+            file_path VARCHAR(255),
+            media_hash TEXT
+        ) ON COMMIT DELETE ROWS;
+    """)
+    cursor.copy_expert(
+        "COPY staging_telegram_messages (message_id, date, text, channel, file_path, media_hash) "
+        "FROM STDIN WITH (FORMAT csv)",
+        rows_to_csv(rows)
+    )
+    partitions.ensure_partitions(cursor, "raw.telegram_messages", [row[1] for row in rows])
+    # DISTINCT ON keeps one row per key, since ON CONFLICT DO UPDATE cannot touch a row twice;
+    # of several versions of a message in one batch, the one read last wins. The unique
+    # constraint includes the date, so a stored version with another date would not
+    # conflict: it is deleted here and its media carried over to the incoming version.
+    cursor.execute("""
+        WITH latest AS (
+            SELECT DISTINCT ON (message_id, channel) message_id, date, text, channel, file_path, media_hash
+            FROM staging_telegram_messages
+            ORDER BY message_id, channel, ordinal DESC
+        ), moved AS (
+            DELETE FROM raw.telegram_messages t
+            USING latest s
+            WHERE t.message_id = s.message_id AND t.channel = s.channel AND t.date <> s.date
+            RETURNING t.message_id, t.channel, t.file_path, t.media_hash
+        ), previous AS (
+            SELECT message_id, channel, max(file_path) AS file_path, max(media_hash) AS media_hash
+            FROM moved
+            GROUP BY message_id, channel
+        )
+        INSERT INTO raw.telegram_messages AS t (message_id, date, text, channel, file_path, media_hash)
+        SELECT s.message_id, s.date, s.text, s.channel,
+               COALESCE(s.file_path, p.file_path), COALESCE(s.media_hash, p.media_hash)
+        FROM latest s
+        LEFT JOIN previous p ON p.message_id = s.message_id AND p.channel = s.channel
+        ON CONFLICT ON CONSTRAINT unique_message_channel DO UPDATE
+        SET date = EXCLUDED.date,
+            text = EXCLUDED.text,
+            file_path = COALESCE(EXCLUDED.file_path, t.file_path),
+            media_hash = COALESCE(EXCLUDED.media_hash, t.media_hash),
+            loaded_at = now()
+        WHERE (t.date, t.text, t.file_path, t.media_hash)
+            IS DISTINCT FROM (EXCLUDED.date, EXCLUDED.text, COALESCE(EXCLUDED.file_path, t.file_path),
+                              COALESCE(EXCLUDED.media_hash, t.media_hash));
+    """)
+    return cursor.rowcount
+
+
+def record_loaded_files(cursor, files):
+    for path, size, mtime, row_count in files:
+        cursor.execute("""
+            INSERT INTO raw.loaded_files (file_path, file_size, file_mtime, row_count, loaded_at)
+            VALUES (%s, %s, %s, %s, now())
+            ON CONFLICT (file_path) DO UPDATE
+            SET file_size = EXCLUDED.file_size,
+                file_mtime = EXCLUDED.file_mtime,
+                row_count = EXCLUDED.row_count,
+                loaded_at = EXCLUDED.loaded_at;
+        """, (path, size, mtime, row_count))
+
+
+# === Load raw message files ===
+def load_messages(conn, raw_dir="data/raw/telegram_messages", media_root="data/raw/media",
+                  batch_size=batch_size, channels=None):
+    """Bulk-load new or changed raw files into raw.telegram_messages.
+
+    Rows are streamed through COPY in batches of ``batch_size``; each batch
+    commits together with the manifest entries of the files it completed.
+    ``channels`` restricts the load to those channels' files, so loaders for
+    disjoint channels can run side by side.
+    Returns (rows_read, rows_merged, files_loaded, skipped_files).
+    """
+    cursor = conn.cursor()
+    ensure_tables(cursor)
+    conn.commit()
+    seen = fetch_loaded_files(cursor)
+    started = time.perf_counter()
+
+    rows = []
+    completed_files = []
+    rows_read = rows_merged = files_loaded = skipped_files = 0
+
+    def flush():
+        nonlocal rows_merged, files_loaded
+        with metrics.LOAD_BATCH_SECONDS.time():
+            if rows:
+                merged = copy_and_merge(cursor, rows)
+                rows_merged += merged
+                metrics.ROWS_LOADED.inc(merged)
+            record_loaded_files(cursor, completed_files)
+            conn.commit()
+        files_loaded += len(completed_files)
+        rows.clear()
+        completed_files.clear()
+
+    for file_path in iter_raw_files(raw_dir, channels):
+        stat = os.stat(file_path)
+        if seen.get(file_path) == (stat.st_size, stat.st_mtime):
+            continue
+
+        file_rows = 0
+        try:
+            for channel_name, msg in iter_file_messages(file_path):
+                row = parse_message(channel_name, msg, media_root)
+                if row is None:
                     continue
+                rows.append(row)
+                file_rows += 1
+                if len(rows) >= batch_size:
+                    flush()
+        except Exception as e:
+            print(f"⚠️ Skipped {file_path} due to error: {e}")
+            skipped_files += 1
+            continue
+
+        rows_read += file_rows
+        completed_files.append((file_path, stat.st_size, stat.st_mtime, file_rows))
+
+    flush()
+    cursor.close()
+    elapsed = time.perf_counter() - started
+    if rows_read and elapsed:
+        metrics.LOAD_ROWS_PER_SECOND.set(rows_read / elapsed)
+    return rows_read, rows_merged, files_loaded, skipped_files
+
+
+def run_load(channels=None):
+    """Load raw files for ``channels`` (all channels when None) and return the load counts."""
+    with metrics.stage('load', channels=','.join(channels or ['all'])):
+        conn = get_connection()
+        try:
+            rows_read, rows_merged, files_loaded, skipped_files = load_messages(conn, channels=channels)
+        finally:
+            conn.close()
+    return {
+        'rows_read': rows_read,
+        'rows_merged': rows_merged,
+        'files_loaded': files_loaded,
+        'skipped_files': skipped_files,
+    }
+
+
+def main(channels=None):
+    stats = run_load(channels)
+
+    # === Final Report ===
+    print(f"✅ Read {stats['rows_read']} messages from {stats['files_loaded']} new or changed files")
+    print(f"✅ Inserted or updated {stats['rows_merged']} rows in raw.telegram_messages")
+    print(f"⚠️ Skipped {stats['skipped_files']} files")
+
 
-                for msg in messages:
-                    if not isinstance(msg, dict):
-                        print(f"⚠️ Skipped non-dict message in {file_path}")
-                        continue
-
-                    msg_id = msg.get('id')
-                    msg_text = msg.get('message') or msg.get('text')
-                    msg_date = msg.get('date')
-
-                    # Convert date
-                    if msg_date:
-                        try:
-                            msg_date = datetime.fromisoformat(msg_date)
-                        except Exception:
-                            try:
-                                msg_date = datetime.strptime(msg_date, "%Y-%m-%dT%H:%M:%S")
-                            except Exception:
-                                continue
-                    else:
-                        continue
-
-                    # Get file_path from JSON, or guess it
-                    file_path_field = msg.get('file_path')
-                    if not file_path_field:
-                        guessed_path = os.path.join(media_root, channel_name, f"{channel_name}_{msg_id}.jpg")
-                        if os.path.exists(guessed_path):
-                            file_path_field = guessed_path
-
-                    # Insert into DB
-                    cursor.execute("""
-                        INSERT INTO raw.telegram_messages (message_id, date, text, channel, file_path)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT ON CONSTRAINT unique_message_channel DO NOTHING;
-                    """, (msg_id, msg_date, msg_text, channel_name, file_path_field))
-                    loaded_count += 1
-
-            except Exception as e:
-                print(f"⚠️ Skipped {file_path} due to error: {e}")
-                skipped_files += 1
-
-conn.commit()
-
-# === Final Report ===
-print(f"✅ Inserted {loaded_count} messages into raw.telegram_messages")
-print(f"⚠️ Skipped {skipped_files} files")
-
-# === Close connection ===
-cursor.close()
-conn.close()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# src/metrics.py
+"""Shared instrumentation for the pipeline stages and the API.
+
+Metrics use the optional ``prometheus_client`` package; without it every
+metric is a no-op, so instrumented code runs unchanged. The API serves them
+on /metrics, and pipeline stages push them to a Pushgateway when
+METRICS_PUSHGATEWAY_URL is set.
+
+Profiling is opt-in per stage: PROFILE_STAGES=load,enrich (or "all") writes
+a cProfile dump, or a py-spy flame graph with PROFILE_MODE=py-spy, to
+PROFILE_DIR for every run of those stages.
+"""
+
+import cProfile
+import functools
+import os
+import shutil
+import signal
+import subprocess
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+PUSHGATEWAY_URL = os.getenv("METRICS_PUSHGATEWAY_URL")
+PUSH_JOB = os.getenv("METRICS_PUSH_JOB", "telegram_pipeline")
+PROFILE_STAGES = {s.strip() for s in os.getenv("PROFILE_STAGES", "").split(",") if s.strip()}
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")  # cprofile | py-spy
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+
+
+class _NullMetric:
+    """Accepts every metric call and records nothing."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, amount):
+        pass
+
+    def set(self, value):
+        pass
+
+    def time(self):
+        return nullcontext()
+
+
+if prometheus_client is not None:
+    REGISTRY = prometheus_client.CollectorRegistry()
+    prometheus_client.ProcessCollector(registry=REGISTRY)
+    prometheus_client.PlatformCollector(registry=REGISTRY)
+else:
+    REGISTRY = None
+
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    if prometheus_client is None:
+        return _NullMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labelnames, registry=REGISTRY, **kwargs)
+
+
+# === Scrape ===
+MESSAGES_SCRAPED = _metric("Counter", "scrape_messages_total", "Messages scraped", ["channel"])
+DOWNLOAD_BYTES = _metric("Counter", "scrape_download_bytes_total", "Media bytes downloaded from Telegram")
+DOWNLOAD_SECONDS = _metric("Histogram", "scrape_download_seconds", "Latency of one media download",
+                           buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+MEDIA_FILES = _metric("Counter", "scrape_media_total", "Media files by outcome", ["result"])
+
+# === Listener ===
+LIVE_QUEUE_DEPTH = _metric("Gauge", "live_queue_depth", "Messages buffered by the listener")
+LIVE_FLUSH_SECONDS = _metric("Histogram", "live_flush_seconds", "Time to merge one live micro-batch")
+LIVE_LAG_SECONDS = _metric("Histogram", "live_lag_seconds", "Seconds from a message being posted to it being merged",
+                           buckets=(0.5, 1, 2, 5, 10, 30, 60, 300, 3600))
+
+# === Load ===
+ROWS_LOADED = _metric("Counter", "load_rows_total", "Rows merged into raw.telegram_messages")
+LOAD_BATCH_SECONDS = _metric("Histogram", "load_batch_seconds", "Time to COPY and merge one batch")
+LOAD_ROWS_PER_SECOND = _metric("Gauge", "load_rows_per_second", "Rows read per second in the last load")
+
+# === Enrich ===
+INFERENCE_SECONDS = _metric("Histogram", "enrich_inference_seconds", "Model time per inference batch",
+                            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+IMAGES_ENRICHED = _metric("Counter", "enrich_images_total", "Images enriched by detection source", ["source"])
+SAVE_SECONDS = _metric("Histogram", "enrich_save_seconds", "Time to commit one chunk of detections")
+QUEUE_ITEMS = _metric("Counter", "enrich_queue_items_total", "Enrichment queue items by outcome", ["outcome"])
+QUEUE_DEPTH = _metric("Gauge", "enrich_queue_depth", "Enrichment queue items by status", ["status"])
+
+# === Extract ===
+MESSAGES_EXTRACTED = _metric("Counter", "extract_messages_total", "Messages scanned for product mentions")
+PRODUCT_MENTIONS = _metric("Counter", "extract_product_mentions_total", "Product mentions found")
+EXTRACT_BATCH_SECONDS = _metric("Histogram", "extract_batch_seconds", "Time to extract and write one batch")
+
+# === API ===
+DB_QUERY_SECONDS = _metric("Histogram", "api_db_query_seconds", "Latency of API database queries", ["function"],
+                           buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+# === Stages ===
+STAGE_SECONDS = _metric("Gauge", "pipeline_stage_seconds", "Duration of the last run of a stage", ["stage"])
+STAGE_LAST_SUCCESS = _metric("Gauge", "pipeline_stage_last_success_timestamp",
+                             "Unix time a stage last finished without error", ["stage"])
+
+
+def timed_query(func):
+    """Record the latency of an async crud function under its name."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.labels(function=func.__name__).observe(time.perf_counter() - started)
+    return wrapper
+
+
+def exposition():
+    """Return (body, content type) for a /metrics response."""
+    if prometheus_client is None:
+        return b"# prometheus_client is not installed\n", "text/plain; charset=utf-8"
+    return prometheus_client.generate_latest(REGISTRY), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def serve(port):
+    """Serve /metrics from a background thread, for long-running processes that are never pushed."""
+    if prometheus_client is not None:
+        prometheus_client.start_http_server(port, registry=REGISTRY)
+
+
+def push(stage, **grouping):
+    """Push this process's metrics to the Pushgateway, if one is configured."""
+    if prometheus_client is None or not PUSHGATEWAY_URL:
+        return
+    try:
+        prometheus_client.push_to_gateway(
+            PUSHGATEWAY_URL, job=PUSH_JOB, registry=REGISTRY, grouping_key=dict(grouping, stage=stage)
+        )
+    except OSError as e:
+        print(f"⚠️ Could not push metrics for {stage}: {e}")
+
+
+@contextmanager
+def profiled(stage):
+    """Profile the enclosed block when PROFILE_STAGES selects ``stage``."""
+    if stage not in PROFILE_STAGES and "all" not in PROFILE_STAGES:
+        yield
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{stage}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}")
+
+    if PROFILE_MODE == "py-spy":
+        if shutil.which("py-spy") is None:
+            print("⚠️ PROFILE_MODE=py-spy but py-spy is not on PATH; not profiling")
+            yield
+            return
+        sampler = subprocess.Popen(["py-spy", "record", "--pid", str(os.getpid()), "--rate", "100",
+                                    "--output", f"{base}.svg"])
+        try:
+            yield
+        finally:
+            # py-spy writes the flame graph when interrupted
+            sampler.send_signal(signal.SIGINT)
+            sampler.wait()
+            print(f"📈 Profile written to {base}.svg")
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f"{base}.prof")
+        print(f"📈 Profile written to {base}.prof (view with `python -m pstats` or snakeviz)")
+
+
+@contextmanager
+def stage(name, **grouping):
+    """Time a pipeline stage, profile it when opted in, and push metrics when it ends."""
+    with profiled(name):
+        started = time.perf_counter()
+        try:
+            yield
+            STAGE_LAST_SUCCESS.labels(stage=name).set(time.time())
+        finally:
+            STAGE_SECONDS.labels(stage=name).set(time.perf_counter() - started)
+            push(name, **grouping)
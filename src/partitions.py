@@ -0,0 +1,102 @@
+# src/partitions.py
+"""Monthly range partitions for the raw tables.
+
+Each partitioned table has one partition per calendar month, named
+``{table}_pYYYY_MM``, plus ``{table}_undated`` as the default partition for
+rows without a date. Monthly partitions are created just before rows for
+that month are written. Every helper takes a DB-API cursor, so psycopg2
+(load.py) and SQLAlchemy connections (enrich.py) share them.
+"""
+
+from datetime import date, datetime
+
+
+def month_of(value):
+    """First day of the month ``value`` falls in."""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def partition_month(name):
+    """Month of a partition named by ``partition_name``, or None for the default partition."""
+    try:
+        return datetime.strptime(name.rsplit("_p", 1)[1], "%Y_%m").date()
+    except (IndexError, ValueError):
+        return None
+
+
+def is_partitioned(cursor, table):
+    """True or False for an existing table, None if it does not exist yet."""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return None if row is None else row[0] == "p"
+
+
+def ensure_partitions(cursor, table, months):
+    """Create the monthly partitions of ``table`` that ``months`` need and that are missing."""
+    for month in sorted({month_of(m) for m in months if m is not None}):
+        name = partition_name(table, month)
+        cursor.execute("SELECT to_regclass(%s)", (name,))
+        if cursor.fetchone()[0] is not None:
+            continue
+        # Held until the caller commits, so concurrent writers create each partition once
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (table,))
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            (month, add_months(month, 1)),
+        )
+
+
+def list_partitions(cursor, table):
+    """Return [(partition name, month)] of ``table``'s monthly partitions, oldest first."""
+    schema = table.split(".")[0]
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table,))
+    partitions = [(f"{schema}.{name}", partition_month(name)) for (name,) in cursor.fetchall()]
+    return sorted((p for p in partitions if p[1] is not None), key=lambda p: p[1])
+
+
+def convert_to_partitioned(cursor, table, create_sql, months_sql, copy_sql):
+    """Replace the unpartitioned ``table`` with a partitioned one and move its rows over.
+
+    ``create_sql`` creates the new, empty partitioned table and its indexes;
+    ``months_sql`` selects the months the rows of ``{old}`` fall in and
+    ``copy_sql`` inserts them from ``{old}``. The caller holds the table's
+    advisory lock and commits, so the swap is atomic.
+    """
+    schema, name = table.split(".")
+    old = f"{schema}.{name}_unpartitioned"
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {name}_unpartitioned")
+    # Index and constraint names are schema-wide; free them for the new table
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = %s AND tablename = %s",
+                   (schema, f"{name}_unpartitioned"))
+    for (index,) in cursor.fetchall():
+        cursor.execute(f'ALTER INDEX {schema}."{index}" RENAME TO "{index}_unpartitioned"')
+
+    cursor.execute(create_sql)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_undated PARTITION OF {table} DEFAULT")
+    cursor.execute(months_sql.format(old=old))
+    ensure_partitions(cursor, table, [row[0] for row in cursor.fetchall()])
+    cursor.execute(copy_sql.format(old=old))
+    moved = cursor.rowcount
+    # Views built on the old table (the dbt staging models) followed the rename; drop them
+    # with it, the next dbt run recreates them on the partitioned table
+    cursor.execute("SELECT count(DISTINCT ev_class) FROM pg_rewrite r JOIN pg_depend d ON d.objid = r.oid "
+                   "WHERE d.refobjid = to_regclass(%s) AND r.ev_class <> d.refobjid", (old,))
+    dependent_views = cursor.fetchone()[0]
+    cursor.execute(f"DROP TABLE {old} CASCADE")
+    print(f"🗂️ Converted {table} to monthly partitions ({moved} rows moved)")
+    if dependent_views:
+        print(f"⚠️ Dropped {dependent_views} dependent views; run dbt to rebuild them")
@@ -1,83 +1,764 @@
+import argparse
 import asyncio
+import fcntl
+import gzip
+import hashlib
 import json
 import logging
 import os
-from datetime import datetime
-from telethon import TelegramClient, events
+import sqlite3
+import time
+from datetime import datetime, timezone
+import psycopg2
+from telethon import TelegramClient, events, errors, utils
 from dotenv import load_dotenv
 
+try:
+    from src import load, metrics
+except ImportError:  # run as a script, e.g. python src/scrape.py
+    import load
+    import metrics
+
 # Load environment variables
 load_dotenv()
 api_id = os.getenv('TELEGRAM_API_ID')
 api_hash = os.getenv('TELEGRAM_API_HASH')
 phone = os.getenv('TELEGRAM_PHONE')
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler('scrape.log'), logging.StreamHandler()]
-)
+# Concurrency settings (set SCRAPE_CHANNEL_CONCURRENCY=1 for the old sequential behaviour)
+channel_concurrency = int(os.getenv('SCRAPE_CHANNEL_CONCURRENCY', '4'))
+media_workers = int(os.getenv('SCRAPE_MEDIA_WORKERS', '8'))
+flood_wait_retries = int(os.getenv('SCRAPE_FLOOD_WAIT_RETRIES', '3'))
+
+# Message output: one append-only JSONL file per channel per day, optionally gzipped
+messages_root = 'data/raw/telegram_messages'
+compress_output = os.getenv('SCRAPE_JSONL_COMPRESS', 'false').lower() in ('1', 'true', 'yes')
+
+# Content-addressed media store: each distinct image is kept once under {media_root}/blobs
+media_root = os.getenv('SCRAPE_MEDIA_ROOT', 'data/raw/media')
+
+# Incremental scraping: first run fetches the newest messages, later runs only what is newer
+checkpoint_path = os.getenv('SCRAPE_CHECKPOINT_PATH', 'data/raw/checkpoints.json')
+initial_limit = int(os.getenv('SCRAPE_INITIAL_LIMIT', '100'))
+# History backfill: number of older chunks to fetch per channel per run (0 disables it)
+backfill_chunks = int(os.getenv('SCRAPE_BACKFILL_CHUNKS', '0'))
+backfill_chunk_size = int(os.getenv('SCRAPE_BACKFILL_CHUNK_SIZE', '500'))
+
+# Listener mode: new messages are buffered (at most live_queue_size) and merged into
+# Postgres once live_batch_size are waiting or the oldest has waited live_flush_seconds
+live_batch_size = int(os.getenv('LIVE_BATCH_SIZE', '200'))
+live_flush_seconds = float(os.getenv('LIVE_FLUSH_SECONDS', '2'))
+live_queue_size = int(os.getenv('LIVE_QUEUE_SIZE', '2000'))
+live_retry_max_seconds = float(os.getenv('LIVE_RETRY_MAX_SECONDS', '60'))
+live_metrics_port = int(os.getenv('LIVE_METRICS_PORT', '0'))
+
+# Telethon session file (without the .session suffix)
+session_name = os.getenv('TELEGRAM_SESSION', 'session_name')
+
 logger = logging.getLogger(__name__)
 
-# Initialize Telegram client
-client = TelegramClient('session_name', api_id, api_hash)
+# Telegram client, created on first use by get_client() so importing this module stays cheap
+client = None
 
-# List of channels to scrape
-channels = [
+# List of channels to scrape (override with a comma-separated SCRAPE_CHANNELS)
+channels = [c.strip() for c in os.getenv('SCRAPE_CHANNELS', '').split(',') if c.strip()] or [
     'CheMed123',  # Replace with actual username if known
     'lobelia4cosmetics',
     'tikvahpharma'
 ]
 # Additional channels can be added from https://et.tgstat.com/medicine
 
-async def scrape_channel(channel):
+# Monotonic timestamp until which every request must wait after a FloodWaitError.
+# Shared by all channels and download workers so one flood wait pauses the whole run.
+_flood_resume_at = 0.0
+
+
+def configure_logging():
+    """Log to scrape.log and the console; called by the entry points, not on import."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.FileHandler('scrape.log'), logging.StreamHandler()]
+    )
+
+
+def get_client(session=None, **kwargs):
+    """Return the shared Telegram client, creating it on first use."""
+    global client
+    if client is None:
+        client = TelegramClient(session or session_name, api_id, api_hash, **kwargs)
+    return client
+
+
+def session_for(channel):
+    """Copy the base session for one channel's scraper.
+
+    Parallel scrapers in separate processes would otherwise contend on a
+    single SQLite session file; each copy reuses the same authorization.
+    Copies are taken one at a time through SQLite's backup API, so a copy is
+    never torn by another scraper or by a listener writing the base session.
+    """
+    base = f"{session_name}.session"
+    if not os.path.exists(base):
+        return session_name
+    os.makedirs('sessions', exist_ok=True)
+    path = os.path.join('sessions', channel)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(os.path.join('sessions', '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        source, target = sqlite3.connect(base), sqlite3.connect(tmp_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        os.replace(tmp_path, f"{path}.session")
+    return path
+
+
+class CheckpointStore:
+    """Per-channel scrape state persisted as a small JSON file.
+
+    Each channel maps to ``last_id`` (newest message scraped), ``oldest_id``
+    (how far back history has been fetched) and ``backfill_done``.
+    """
+
+    def __init__(self, path=checkpoint_path):
+        self.path = path
+        self._state = self._read()
+
+    def _locked(self):
+        # Serializes read-modify-write across processes scraping different channels
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        lock = open(f"{self.path}.lock", 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get(self, channel):
+        return dict(self._state.get(channel, {}))
+
+    def update(self, channel, **fields):
+        with self._locked():
+            # Re-read so updates made by other processes since we loaded are kept
+            self._state = self._read()
+            self._state.setdefault(channel, {}).update(fields)
+            self._write()
+
+    def _write(self):
+        # Write to a temp file and rename so a crash never leaves a truncated checkpoint
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class MediaStore:
+    """Content-addressed image store with an index of Telegram media already stored.
+
+    Blobs live at ``{root}/blobs/{sha[:2]}/{sha}{ext}``. A SQLite index maps
+    Telegram media ids to blob hashes, so forwards and reposts of known media
+    are never downloaded again; re-uploads of the same image are downloaded
+    but still stored only once.
+    """
+
+    def __init__(self, root=media_root):
+        self.root = root
+        self.incoming_dir = os.path.join(root, 'incoming')
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        # WAL and a busy timeout let per-channel scraper processes share the index
+        self._db = sqlite3.connect(os.path.join(root, 'index.sqlite'), timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS media (media_id TEXT PRIMARY KEY, sha256 TEXT NOT NULL, path TEXT NOT NULL)'
+        )
+
+    def lookup(self, media_id):
+        """Return (sha256, path) of stored media, or None if it must be downloaded."""
+        row = self._db.execute('SELECT sha256, path FROM media WHERE media_id = ?', (media_id,)).fetchone()
+        if row is None or not os.path.exists(row[1]):
+            return None
+        return row[0], row[1]
+
+    def blob_path(self, sha, ext):
+        return os.path.join(self.root, 'blobs', sha[:2], f"{sha}{ext}")
+
+    def add(self, media_id, downloaded, sha, ext):
+        """Move a downloaded file into the store; returns (path, whether the content was new)."""
+        path = self.blob_path(sha, ext)
+        is_new = not os.path.exists(path)
+        if is_new:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(downloaded, path)
+        else:
+            os.remove(downloaded)
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO media VALUES (?, ?, ?)', (media_id, sha, path))
+        return path, is_new
+
+    def close(self):
+        self._db.close()
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Image documents worth downloading: the formats enrichment reads (see enrich.query).
+# Stickers, GIF thumbnails and other images would take up storage without ever being enriched.
+IMAGE_DOCUMENT_TYPES = {'image/jpeg': '.jpg', 'image/png': '.png'}
+
+
+def media_info(message):
+    """Return (media_id, extension) for photos and JPEG/PNG documents, None for other media."""
+    if message.photo:
+        return f"photo:{message.photo.id}", '.jpg'
+    document = message.document
+    mime_type = getattr(document, 'mime_type', None) or ''
+    if document and mime_type in IMAGE_DOCUMENT_TYPES:
+        return f"document:{document.id}", IMAGE_DOCUMENT_TYPES[mime_type]
+    return None
+
+
+class JsonlSink:
+    """Append-only JSONL writer with one rolling file per channel per day.
+
+    Files live at ``{root}/{YYYY-MM-DD}/{channel}.jsonl`` (``.jsonl.gz`` when
+    compressed) and stay open for the whole run, so each message costs a
+    buffered write instead of an open/write/close of its own file.
+    """
+
+    def __init__(self, root=messages_root, compress=compress_output):
+        self.root = root
+        self.compress = compress
+        self._files = {}  # channel -> (date_str, file handle)
+
+    def write(self, record):
+        channel = record['channel']
+        date_str = datetime.now().strftime('%Y-%m-%d')
+        current = self._files.get(channel)
+        if current is None or current[0] != date_str:
+            if current is not None:
+                current[1].close()
+            current = (date_str, self._open(channel, date_str))
+            self._files[channel] = current
+        current[1].write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _open(self, channel, date_str):
+        directory = os.path.join(self.root, date_str)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{channel}.jsonl")
+        if self.compress:
+            # Appending creates a new gzip member per run; gzip readers handle that transparently
+            return gzip.open(f"{path}.gz", 'at', encoding='utf-8')
+        return open(path, 'a', encoding='utf-8', buffering=1 << 20)
+
+    def flush(self, channel=None):
+        for name, (_, handle) in self._files.items():
+            if channel is None or name == channel:
+                handle.flush()
+
+    def close(self):
+        for _, handle in self._files.values():
+            handle.close()
+        self._files.clear()
+
+
+async def call_with_flood_wait(func, *args, **kwargs):
+    """Await a Telegram API call, sleeping and retrying when Telegram asks us to back off."""
+    global _flood_resume_at
+    for attempt in range(flood_wait_retries + 1):
+        delay = _flood_resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            return await func(*args, **kwargs)
+        except errors.FloodWaitError as e:
+            if attempt == flood_wait_retries:
+                raise
+            _flood_resume_at = max(_flood_resume_at, time.monotonic() + e.seconds + 1)
+            logger.warning(f"Flood wait of {e.seconds}s requested, backing off (attempt {attempt + 1})")
+
+
+def message_record(message, channel, media_path, media_hash=None):
+    return {
+        'id': message.id,
+        'date': str(message.date),
+        'text': message.text if message.text else None,
+        'channel': channel,
+        'file_path': media_path,
+        'media_hash': media_hash
+    }
+
+
+def save_message(message, channel, sink, media_path, media_hash=None):
+    sink.write(message_record(message, channel, media_path, media_hash))
+
+
+async def fetch_media(message, channel, media_store, stats):
+    """Store a message's image in ``media_store``; returns (path, sha256), or (None, None) if nothing was downloaded."""
+    media_id, ext = media_info(message)
+    known = media_store.lookup(media_id)
+    if known:
+        stats['media_skipped'] += 1
+        metrics.MEDIA_FILES.labels(result='known_id').inc()
+        return known[1], known[0]
+
+    target = os.path.join(media_store.incoming_dir, f"{channel}_{message.id}{ext}")
+    with metrics.DOWNLOAD_SECONDS.time():
+        downloaded = await call_with_flood_wait(get_client().download_media, message, file=target)
+    if not downloaded:
+        return None, None
+    size = os.path.getsize(downloaded)
+    stats['bytes'] += size
+    metrics.DOWNLOAD_BYTES.inc(size)
+    media_hash = await asyncio.to_thread(hash_file, downloaded)
+    media_path, is_new = media_store.add(media_id, downloaded, media_hash, ext)
+    stats['media'] += 1
+    if not is_new:
+        stats['media_skipped'] += 1
+    metrics.MEDIA_FILES.labels(result='stored' if is_new else 'duplicate_content').inc()
+    logger.debug(f"Saved image {message.id} from {channel}")
+    return media_path, media_hash
+
+
+async def download_and_save(message, channel, sink, media_store, download_slots, stats):
+    # The slot was acquired by the producer; release it once this download is done
+    media_path = media_hash = None
+    try:
+        media_path, media_hash = await fetch_media(message, channel, media_store, stats)
+    except Exception as e:
+        # The message is still worth having without its image, and the checkpoint moves past it
+        logger.error(f"Error downloading media for {channel}/{message.id}: {str(e)}")
+    finally:
+        download_slots.release()
+    save_message(message, channel, sink, media_path, media_hash)
+
+
+async def save_messages(messages, channel, sink, media_store, download_slots, stats):
+    """Save every message yielded by ``messages``; returns the (newest, oldest) ids seen."""
+    newest_id = oldest_id = None
+    pending = set()
+    try:
+        async for message in messages:
+            stats['messages'] += 1
+            metrics.MESSAGES_SCRAPED.labels(channel=channel).inc()
+            newest_id = message.id if newest_id is None else max(newest_id, message.id)
+            oldest_id = message.id if oldest_id is None else min(oldest_id, message.id)
+
+            # Hand image downloads to the bounded pool; blocks when every slot is busy
+            if media_info(message):
+                await download_slots.acquire()
+                task = asyncio.create_task(
+                    download_and_save(message, channel, sink, media_store, download_slots, stats)
+                )
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            else:
+                save_message(message, channel, sink, None)
+    finally:
+        # Let in-flight downloads finish so their messages are still saved
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        # Messages must be on disk before a checkpoint can move past them
+        sink.flush(channel)
+    return newest_id, oldest_id
+
+
+async def scrape_channel(channel, download_slots=None, checkpoints=None, sink=None, media_store=None):
+    """Scrape messages newer than the channel's checkpoint, then backfill older history.
+
+    Image downloads overlap through ``download_slots`` and land in
+    ``media_store``. Returns a dict with per-channel throughput figures.
+    """
+    if download_slots is None:
+        download_slots = asyncio.Semaphore(media_workers)
+    if checkpoints is None:
+        checkpoints = CheckpointStore()
+    owns_sink = sink is None
+    if owns_sink:
+        sink = JsonlSink()
+    owns_store = media_store is None
+    if owns_store:
+        media_store = MediaStore()
+    stats = {'channel': channel, 'messages': 0, 'media': 0, 'media_skipped': 0, 'bytes': 0, 'seconds': 0.0}
+    started = time.perf_counter()
+    client = get_client()
     try:
         logger.info(f"Starting scrape for channel: {channel}")
-        target_channel = await client.get_entity(channel)
-        date_str = datetime.now().strftime('%Y-%m-%d')
-        messages_dir = f"data/raw/telegram_messages/{date_str}/{channel}"
-        media_dir = f"data/raw/media/{date_str}/{channel}"
-
-        os.makedirs(messages_dir, exist_ok=True)
-        os.makedirs(media_dir, exist_ok=True)
-
-        async for message in client.iter_messages(target_channel, limit=100):
-            media_path = None
-
-            # Download image if present
-            if message.photo or message.document:
-                downloaded = await client.download_media(message, file=media_dir)
-                if downloaded:
-                    media_path = f"{media_dir}/{channel}_{message.id}.jpg"
-                    os.rename(downloaded, media_path)
-                    logger.info(f"Saved image {message.id} from {channel}")
-
-            # Construct message data with image path
-            message_data = {
-                'id': message.id,
-                'date': str(message.date),
-                'text': message.text if message.text else None,
-                'channel': channel,
-                'file_path': media_path  # This is new
-            }
-
-            # Save JSON message with file_path
-            json_path = f"{messages_dir}/{message.id}.json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(message_data, f, ensure_ascii=False, indent=4)
-            logger.info(f"Saved message {message.id} from {channel}")
+        target_channel = await call_with_flood_wait(client.get_entity, channel)
+
+        # === Forward sync: only messages newer than the high-water mark ===
+        state = checkpoints.get(channel)
+        last_id = state.get('last_id', 0)
+        if last_id:
+            messages = client.iter_messages(target_channel, min_id=last_id)
+        else:
+            messages = client.iter_messages(target_channel, limit=initial_limit)
+        newest_id, oldest_id = await save_messages(
+            messages, channel, sink, media_store, download_slots, stats
+        )
+        if newest_id is not None:
+            checkpoints.update(channel, last_id=max(newest_id, last_id))
+        if oldest_id is not None and not state.get('oldest_id'):
+            checkpoints.update(channel, oldest_id=oldest_id)
+
+        # === Backfill: walk older history in chunks, checkpointing after each one ===
+        for _ in range(backfill_chunks):
+            state = checkpoints.get(channel)
+            if state.get('backfill_done') or not state.get('oldest_id'):
+                break
+            fetched_before = stats['messages']
+            messages = client.iter_messages(
+                target_channel, offset_id=state['oldest_id'], limit=backfill_chunk_size
+            )
+            _, oldest_id = await save_messages(
+                messages, channel, sink, media_store, download_slots, stats
+            )
+            if oldest_id is not None:
+                checkpoints.update(channel, oldest_id=oldest_id)
+            if stats['messages'] - fetched_before < backfill_chunk_size:
+                checkpoints.update(channel, backfill_done=True)
+                logger.info(f"Backfill complete for {channel}")
 
     except Exception as e:
         logger.error(f"Error scraping {channel}: {str(e)}")
+    finally:
+        if owns_sink:
+            sink.close()
+        if owns_store:
+            media_store.close()
 
+    stats['seconds'] = time.perf_counter() - started
+    rate = stats['messages'] / stats['seconds'] if stats['seconds'] else 0.0
+    logger.info(
+        f"Finished {channel}: {stats['messages']} messages, {stats['media']} media downloaded "
+        f"({stats['bytes'] / 1e6:.1f} MB), {stats['media_skipped']} duplicates reused "
+        f"in {stats['seconds']:.1f}s ({rate:.1f} msg/s)"
+    )
+    return stats
 
-async def main():
+
+async def scrape_channels(channel_list, checkpoints=None):
+    """Scrape channels in parallel, at most ``channel_concurrency`` at a time."""
+    channel_slots = asyncio.Semaphore(channel_concurrency)
+    download_slots = asyncio.Semaphore(media_workers)
+    if checkpoints is None:
+        checkpoints = CheckpointStore()
+    sink = JsonlSink()
+    media_store = MediaStore()
+
+    async def run(channel):
+        async with channel_slots:
+            return await scrape_channel(channel, download_slots, checkpoints, sink, media_store)
+
+    try:
+        return await asyncio.gather(*(run(channel) for channel in channel_list))
+    finally:
+        sink.close()
+        media_store.close()
+
+
+async def main(channel_list=None, session=None):
+    client = get_client(session)
     await client.start(phone)
-    for channel in channels:
-        await scrape_channel(channel)
-    await client.disconnect()
-    logger.info("Scraping completed")
+    started = time.perf_counter()
+    try:
+        results = await scrape_channels(channel_list or channels)
+    finally:
+        await client.disconnect()
+    elapsed = time.perf_counter() - started
+    total = sum(r['messages'] for r in results)
+    logger.info(f"Scraping completed: {total} messages from {len(results)} channels in {elapsed:.1f}s")
+    return results
+
+
+class LiveIngestor:
+    """Micro-batches live messages into raw.telegram_messages.
+
+    ``put`` waits while the buffer is full, so a slow database holds back
+    update handling instead of growing memory. Each message's image download
+    starts as soon as it is taken off the buffer; a batch is merged once it
+    holds ``batch_size`` messages or its first message has waited
+    ``flush_seconds``. Merged messages are also appended to the JSONL files
+    and move existing checkpoints forward, so batch scrapes skip them.
+    Checkpoints of channels passed to ``hold_checkpoints`` stay put until
+    ``release_checkpoints``, so live messages cannot move them past older
+    catch-up messages that are not merged yet.
+    """
+
+    def __init__(self, batch_size=live_batch_size, flush_seconds=live_flush_seconds,
+                 queue_size=live_queue_size, sink=None, media_store=None, checkpoints=None):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.sink = sink or JsonlSink()
+        self.media_store = media_store or MediaStore()
+        self.checkpoints = checkpoints or CheckpointStore()
+        self.download_slots = asyncio.Semaphore(media_workers)
+        self.stats = {'messages': 0, 'merged': 0, 'rejected': 0, 'batches': 0,
+                      'media': 0, 'media_skipped': 0, 'bytes': 0}
+        self._held = {}  # channel -> newest id merged while its checkpoint is held
+        self._conn = None
+        self.consumer = None
+
+    async def __aenter__(self):
+        self.consumer = asyncio.create_task(self._consume())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        try:
+            if not self.consumer.done():
+                # None tells the consumer to merge what it holds and stop
+                await self.queue.put(None)
+            await self.consumer
+        finally:
+            self.close()
+
+    async def put(self, channel, message):
+        await self.queue.put((channel, message))
+        metrics.MESSAGES_SCRAPED.labels(channel=channel).inc()
+        metrics.LIVE_QUEUE_DEPTH.set(self.queue.qsize())
+
+    def hold_checkpoints(self, channels):
+        for channel in channels:
+            self._held.setdefault(channel, 0)
+
+    async def release_checkpoints(self):
+        """Merge everything put so far, then apply the checkpoint moves held back meanwhile."""
+        merged = asyncio.Event()
+        await self.queue.put(merged)
+        waiter = asyncio.ensure_future(merged.wait())
+        await asyncio.wait({waiter, self.consumer}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if not merged.is_set():
+            # The consumer failed; leave the checkpoints where they were
+            return
+        held, self._held = self._held, {}
+        for channel, newest_id in held.items():
+            self._advance_checkpoint(channel, newest_id)
+
+    def _advance_checkpoint(self, channel, newest_id):
+        # Channels never batch-scraped keep no checkpoint, so their first batch run still fetches history
+        last_id = self.checkpoints.get(channel).get('last_id')
+        if last_id and newest_id > last_id:
+            self.checkpoints.update(channel, last_id=newest_id)
+
+    async def _consume(self):
+        batch, deadline = [], None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = ()
+            metrics.LIVE_QUEUE_DEPTH.set(self.queue.qsize())
+            if item is None:
+                break
+            if isinstance(item, asyncio.Event):
+                # A release_checkpoints barrier: merge what was put before it
+                if batch:
+                    await self.flush(batch)
+                    batch, deadline = [], None
+                item.set()
+                continue
+            if item:
+                batch.append(asyncio.create_task(self._record(*item)))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_seconds
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                await self.flush(batch)
+                batch, deadline = [], None
+        if batch:
+            await self.flush(batch)
+
+    async def _record(self, channel, message):
+        media_path = media_hash = None
+        if media_info(message):
+            try:
+                async with self.download_slots:
+                    media_path, media_hash = await fetch_media(message, channel, self.media_store, self.stats)
+            except Exception as e:
+                # The message is still worth having without its image
+                logger.error(f"Error downloading media for {channel}/{message.id}: {str(e)}")
+        return message_record(message, channel, media_path, media_hash)
+
+    async def flush(self, batch):
+        """Merge a batch of pending records, retrying until the database accepts it.
+
+        A batch the database rejects outright is merged one message at a time;
+        messages that still fail are logged and left to the batch loader, which
+        reads them back from the JSONL files.
+        """
+        records = await asyncio.gather(*batch)
+        parsed = [(record, load.parse_message(record['channel'], record)) for record in records]
+        parsed = [(record, row) for record, row in parsed if row]
+        rows = [row for _, row in parsed]
+        started = time.perf_counter()
+        try:
+            merged = await self._merge_with_retry(rows)
+        except psycopg2.Error as e:
+            logger.error(f"Could not merge {len(rows)} live messages, merging them one by one: {str(e)}")
+            merged = 0
+            for row in rows:
+                try:
+                    merged += await self._merge_with_retry([row])
+                except psycopg2.Error as e:
+                    self.stats['rejected'] += 1
+                    logger.error(f"Rejected live message {row[3]}/{row[0]}, "
+                                 f"leaving it to the batch loader: {str(e)}")
+        metrics.LIVE_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        metrics.ROWS_LOADED.inc(merged)
+
+        newest = {}
+        now = time.time()
+        for record, row in parsed:
+            self.sink.write(record)
+            newest[record['channel']] = max(newest.get(record['channel'], 0), record['id'])
+            sent_at = row[1].replace(tzinfo=timezone.utc).timestamp()
+            metrics.LIVE_LAG_SECONDS.observe(max(0.0, now - sent_at))
+        self.sink.flush()
+        for channel, newest_id in newest.items():
+            if channel in self._held:
+                self._held[channel] = max(self._held[channel], newest_id)
+            else:
+                self._advance_checkpoint(channel, newest_id)
+
+        self.stats['messages'] += len(records)
+        self.stats['merged'] += merged
+        self.stats['batches'] += 1
+        logger.debug(f"Merged {len(rows)} live messages ({merged} new or changed) "
+                     f"in {time.perf_counter() - started:.2f}s")
+
+    async def _merge_with_retry(self, rows):
+        """Merge ``rows``, backing off while the database is unreachable; other errors propagate."""
+        delay = 1.0
+        while True:
+            try:
+                return await asyncio.to_thread(self.merge_rows, rows)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # Nothing is taken off the buffer meanwhile, so producers wait
+                logger.error(f"Could not merge {len(rows)} live messages, retrying in {delay:.0f}s: {str(e)}")
+                self._reset_connection()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, live_retry_max_seconds)
+
+    def merge_rows(self, rows):
+        """COPY and upsert rows on the listener's own connection; returns rows merged."""
+        if self._conn is None:
+            self._conn = load.get_connection()
+            with self._conn.cursor() as cursor:
+                load.ensure_tables(cursor)
+            self._conn.commit()
+        try:
+            with self._conn.cursor() as cursor:
+                merged = load.copy_and_merge(cursor, rows) if rows else 0
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        return merged
+
+    def _reset_connection(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+            self._conn = None
+
+    def close(self):
+        self._reset_connection()
+        self.sink.close()
+        self.media_store.close()
+
+
+async def catch_up(ingestor, entities):
+    """Feed messages posted since each channel's checkpoint, e.g. while the listener was down."""
+    for channel, entity in entities.items():
+        last_id = ingestor.checkpoints.get(channel).get('last_id')
+        if not last_id:
+            continue
+        async for message in get_client().iter_messages(entity, min_id=last_id, reverse=True):
+            await ingestor.put(channel, message)
+
+
+async def listen(channel_list=None, session=None):
+    """Stream new messages from ``channel_list`` into Postgres until the client disconnects."""
+    # Sequential updates make a full buffer pause update handling rather than pile up handler tasks
+    client = get_client(session, sequential_updates=True)
+    await client.start(phone)
+    try:
+        entities = {}
+        for channel in channel_list or channels:
+            entities[channel] = await call_with_flood_wait(client.get_entity, channel)
+        names = {utils.get_peer_id(entity): channel for channel, entity in entities.items()}
+
+        async with LiveIngestor() as ingestor:
+            async def on_new_message(event):
+                await ingestor.put(names[event.chat_id], event.message)
+
+            # Live messages arrive while catch-up is still feeding older ones; until those are
+            # merged, a checkpoint moved past them would lose them if the listener died
+            ingestor.hold_checkpoints(entities)
+            client.add_event_handler(on_new_message, events.NewMessage(chats=list(entities.values())))
+            logger.info(f"Listening for new messages in {len(entities)} channels")
+            await catch_up(ingestor, entities)
+            await ingestor.release_checkpoints()
+            disconnected = asyncio.ensure_future(client.run_until_disconnected())
+            try:
+                # Stop on disconnect, or if the consumer fails so producers are not left waiting
+                await asyncio.wait({disconnected, ingestor.consumer}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                client.remove_event_handler(on_new_message)
+                disconnected.cancel()
+        logger.info(f"Listener stopped after {ingestor.stats['messages']} messages "
+                    f"in {ingestor.stats['batches']} batches ({ingestor.stats['rejected']} rejected)")
+    finally:
+        await client.disconnect()
+
+
+def run_listener(channel_list=None, session=None):
+    """Run ``listen`` until interrupted; in-flight messages are merged before exiting."""
+    global client
+    if live_metrics_port:
+        metrics.serve(live_metrics_port)
+    try:
+        asyncio.run(listen(channel_list, session))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client = None
+
+
+def run_scrape(channel_list=None, session=None):
+    """Scrape ``channel_list`` (default: all channels) to completion; returns per-channel stats."""
+    global client
+    try:
+        with metrics.stage('scrape', channels=','.join(channel_list or channels)):
+            return asyncio.run(main(channel_list, session))
+    finally:
+        # A client is tied to the event loop it ran on, so the next run needs a fresh one
+        client = None
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape Telegram channels into data/raw.")
+    parser.add_argument('--listen', action='store_true',
+                        help="stay connected and stream new messages into raw.telegram_messages")
+    args = parser.parse_args()
+    configure_logging()
+    if args.listen:
+        run_listener()
+    else:
+        run_scrape()
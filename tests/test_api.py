@@ -25,3 +25,32 @@ def test_top_products_status():
 def test_channel_activity_status():
     response = client.get("/api/channels/lobelia4cosmetics/activity")
     assert response.status_code == 200
+
+def test_search_cursor_round_trip():
+    from src.api.crud import decode_cursor, encode_cursor
+    cursor = encode_cursor(0.0607927, 42, "tikvahpharma")
+    assert decode_cursor(cursor) == (0.0607927, 42, "tikvahpharma")
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def test_prefix_tsquery_handles_mixed_script():
+    from src.api.crud import _prefix_tsquery
+    assert _prefix_tsquery("Paracetamol ፓራሲታሞል 500mg!") == "paracetamol:* & ፓራሲታሞል:* & 500mg:*"
+    assert _prefix_tsquery("%%") is None
+
+@pytest.mark.asyncio
+async def test_search_ranks_only_a_capped_candidate_set(monkeypatch):
+    from unittest.mock import AsyncMock, MagicMock
+    from src.api import crud
+    monkeypatch.setattr(crud, "SEARCH_MAX_RESULTS", 50)
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=MagicMock(**{"mappings.return_value.all.return_value": []}))
+
+    messages, next_cursor = await crud.search_messages(db, "paracetamol", limit=10)
+
+    statement, params = db.execute.await_args.args
+    sql = str(statement)
+    assert messages == [] and next_cursor is None
+    assert params["depth"] == 50 and params["limit"] == 11
+    # The cap applies to the matching rows, before anything is ranked
+    assert sql.index("LIMIT :depth") < sql.index("ts_rank_cd")
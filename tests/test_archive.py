@@ -0,0 +1,59 @@
+# tests/test_archive.py
+import os
+import sys
+from datetime import date, datetime
+
+import pytest
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+import src.archive as archive
+
+
+def write_csv(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+
+def test_cutoff_keeps_the_current_month_and_the_hot_months_before_it():
+    assert archive.cutoff_month(datetime(2025, 3, 15), hot_months=3) == date(2025, 1, 1)
+    assert archive.cutoff_month(datetime(2025, 3, 15), hot_months=1) == date(2025, 3, 1)
+
+
+def test_rearchived_month_replaces_messages_and_keeps_the_rest(tmp_path):
+    pytest.importorskip("duckdb")
+    path = archive.archive_path("raw.telegram_messages", date(2024, 2, 1), str(tmp_path / "archive"))
+    first = write_csv(tmp_path / "first.csv", [
+        '1,10,2024-02-01 08:00:00,old text,chan,,2024-02-02 00:00:00,',
+        '2,11,2024-02-03 09:30:00.25,"quoted ""text""\nover two lines",chan,a.jpg,2024-02-04 00:00:00,abc',
+        '3,12,2024-02-05 00:00:00,"",chan,,2024-02-06 00:00:00,',
+    ])
+    late = write_csv(tmp_path / "late.csv", [
+        '7,10,2024-02-01 08:00:00,edited,chan,,2024-05-01 00:00:00,',
+        '8,13,2024-02-28 23:59:59,late arrival,other,,2024-05-01 00:00:00,',
+    ])
+
+    assert archive.write_parquet("raw.telegram_messages", first, path) == 3
+    assert archive.write_parquet("raw.telegram_messages", late, path) == 4
+
+    messages = archive.query_messages(root=str(tmp_path / "archive"))
+    assert [(m["message_id"], m["text"]) for m in messages] == [
+        (13, "late arrival"), (12, ""), (11, 'quoted "text"\nover two lines'), (10, "edited"),
+    ]
+    assert messages[2]["date"] == date(2024, 2, 3)
+    assert messages[2]["file_path"] == "a.jpg" and messages[0]["file_path"] is None
+
+    only_chan = archive.query_messages("chan", date(2024, 2, 3), date(2024, 2, 5), root=str(tmp_path / "archive"))
+    assert [m["message_id"] for m in only_chan] == [12, 11]
+    assert archive.query_messages(start_date=date(2024, 3, 1), root=str(tmp_path / "archive")) == []
+
+
+def test_archive_views_exist_before_anything_is_archived(tmp_path):
+    pytest.importorskip("duckdb")
+    con = archive.connect(str(tmp_path))
+
+    assert con.execute("SELECT count(*) FROM archived_messages").fetchone() == (0,)
+    assert con.execute("SELECT count(*) FROM archived_detections").fetchone() == (0,)
@@ -0,0 +1,47 @@
+# tests/test_benchmarks.py
+import os
+import sys
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+from benchmarks import run
+
+TINY = dict(run.SCALES["small"], channels=2, messages_per_channel=40, images=6)
+
+
+def test_scrape_and_enrich_benchmarks_run_without_a_database(tmp_path):
+    scrape = run.bench_scrape(TINY, str(tmp_path))
+    assert scrape["messages"] == 80 and scrape["messages_per_s"] > 0
+    # Reposted photos are served from the media store instead of downloaded again
+    assert scrape["media_reused"] > 0
+
+    enrich = run.bench_enrich(TINY, str(tmp_path), duplicate_ratio=0.5)
+    assert enrich["images"] == 6 and enrich["inferred"] == 3 and enrich["images_per_s"] > 0
+
+
+def test_compare_flags_throughput_and_latency_regressions():
+    baseline = {"load": {"messages_per_s": 1000.0}, "api": {"search": {"p99_ms": 10.0, "rps": 500.0}}}
+    current = {"load": {"messages_per_s": 800.0}, "api": {"search": {"p99_ms": 10.5, "rps": 520.0}}}
+
+    assert run.compare(current, baseline, tolerance=0.15) == ["load.messages_per_s: 1000.0 -> 800.0"]
+    assert run.compare(current, baseline, tolerance=0.25) == []
+
+
+def test_backend_accuracy_delta_against_the_baseline():
+    from benchmarks import backends
+
+    baseline = {"a": [("pill", 0.9, 0, 0, 10, 10), ("bottle", 0.8, 20, 20, 30, 30)], "b": []}
+    candidate = {"a": [("pill", 0.85, 1, 1, 10, 10), ("bottle", 0.7, 50, 50, 60, 60)], "b": []}
+
+    delta = backends.accuracy_delta(baseline, candidate)
+    assert delta["recall"] == 0.5 and delta["precision"] == 0.5
+    assert delta["mean_iou"] == 0.81 and delta["confidence_delta"] == -0.05
+    assert delta["images_changed"] == 1
+
+    results = {"torch": {"images_per_s": 10.0}, "onnx": {"images_per_s": 20.0, "recall": 0.99, "precision": 1.0},
+               "openvino-int8": {"images_per_s": 40.0, "recall": 0.8, "precision": 0.9}}
+    assert backends.recommend(results, min_recall=0.95, min_precision=0.95) == "onnx"
+    assert backends.parse_mode("openvino-int8") == ("openvino", True)
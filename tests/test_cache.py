@@ -0,0 +1,53 @@
+# tests/test_cache.py
+import os
+import sys
+import asyncio
+
+import pytest
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+from src.api.cache import MemoryBackend, ResponseCache
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_evicts_lru_and_expired():
+    backend = MemoryBackend(max_entries=2)
+    await backend.set("a", 1, ttl=60)
+    await backend.set("b", 2, ttl=60)
+    await backend.get("a")
+    await backend.set("c", 3, ttl=60)
+    assert await backend.get("b") is None
+    assert await backend.get("a") == 1
+
+    await backend.set("old", 4, ttl=-1)
+    assert await backend.get("old") is None
+
+
+@pytest.mark.asyncio
+async def test_response_cache_loads_once_and_invalidates_on_new_generation():
+    cache = ResponseCache(MemoryBackend(), ttl=60, generation_check_seconds=0)
+    generation = {"value": 1}
+    calls = []
+
+    async def load_generation():
+        return generation["value"]
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return [{"channel": "chan", "total": len(calls)}]
+
+    cache.generation_loader = load_generation
+    first = await asyncio.gather(*(cache.get_or_load("top", loader, limit=5) for _ in range(3)))
+    assert len(calls) == 1
+    assert first[0] == first[1] == first[2] == [{"channel": "chan", "total": 1}]
+
+    assert await cache.get_or_load("top", loader, limit=6) != first[0]
+    assert len(calls) == 2
+
+    generation["value"] = 2
+    assert await cache.get_or_load("top", loader, limit=5) == [{"channel": "chan", "total": 3}]
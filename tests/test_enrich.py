@@ -0,0 +1,166 @@
+# tests/test_enrich.py
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+import src.enrich as enrich
+
+
+class FakeModel:
+    """Stands in for YOLO: one 'pill' box per image, records batch sizes."""
+    names = {0: "pill"}
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, images, verbose=False):
+        self.batch_sizes.append(len(images))
+        box = SimpleNamespace(cls=[0], conf=[0.9], xyxy=[[1.0, 1.0, 3.0, 3.0]])
+        return [SimpleNamespace(boxes=[box], plot=lambda: np.zeros((4, 4, 3), dtype=np.uint8))
+                for _ in images]
+
+
+def make_messages(tmp_path, count):
+    messages = []
+    for i in range(count):
+        path = tmp_path / f"img_{i}.jpg"
+        Image.new("RGB", (64, 64), color=(i * 50, 100, 200)).save(path)
+        messages.append({"message_id": i, "file_path": str(path), "channel": "chan"})
+    return messages
+
+
+def test_run_enrichment_batches_images(tmp_path, monkeypatch):
+    monkeypatch.setattr(enrich, "OUTPUT_ROOT", str(tmp_path / "out"))
+    monkeypatch.setattr(enrich, "RENDER_OUTPUTS", True)
+    messages = make_messages(tmp_path, 5)
+    messages.append({"message_id": 99, "file_path": str(tmp_path / "missing.jpg"), "channel": "chan"})
+    model = FakeModel()
+
+    detections, processed, fresh = enrich.run_enrichment(messages, model, batch_size=2)
+
+    assert model.batch_sizes == [2, 2, 1]
+    assert len(processed) == 5 and len(fresh) == 5
+    assert [d["message_id"] for d in detections] == [0, 1, 2, 3, 4]
+    assert all(d["class"] == "pill" and d["x2"] == 3.0 for d in detections)
+    assert os.path.exists(tmp_path / "out" / "chan" / "chan_4.jpg")
+
+
+def test_run_enrichment_reuses_detections_for_duplicate_images(tmp_path, monkeypatch):
+    monkeypatch.setattr(enrich, "OUTPUT_ROOT", str(tmp_path / "out"))
+    original, cached = make_messages(tmp_path, 2)
+    repost = dict(original, message_id=10, channel="other")
+    model = FakeModel()
+    cached_hash = enrich.decode_image(cached)[0]["image_hash"]
+
+    detections, processed, fresh = enrich.run_enrichment(
+        [original, repost, cached], model, batch_size=8,
+        lookup_cached=lambda hashes: {h: [("bottle", 0.5)] for h in hashes if h == cached_hash}
+    )
+
+    # Only the original is inferred; the repost shares its hash, the other image is cached
+    assert model.batch_sizes == [1]
+    assert list(fresh) == [processed[0]["image_hash"]]
+    assert [(d["message_id"], d["channel"], d["class"]) for d in detections] == [
+        (0, "chan", "pill"), (10, "other", "pill"), (1, "chan", "bottle")
+    ]
+    # Detections-only by default: nothing is rendered to disk
+    assert not os.path.exists(tmp_path / "out")
+
+
+def test_enrich_images_commits_in_periodic_batches(tmp_path, monkeypatch):
+    messages = make_messages(tmp_path, 5)
+    saved = []
+    monkeypatch.setattr(enrich, "get_engine", lambda: SimpleNamespace(dispose=lambda: None))
+    monkeypatch.setattr(enrich, "ensure_tables", lambda engine: None)
+    monkeypatch.setattr(enrich, "get_model_version", lambda: "test")
+    monkeypatch.setattr(enrich, "iter_image_messages", lambda engine, version, channels: iter(messages))
+    monkeypatch.setattr(enrich, "load_model", FakeModel)
+    monkeypatch.setattr(enrich, "lookup_cached", lambda engine, version, hashes: {})
+    iter_enrichment = enrich.iter_enrichment
+    monkeypatch.setattr(enrich, "iter_enrichment", lambda *a, **kw: iter_enrichment(*a, batch_size=1, **kw))
+    monkeypatch.setattr(
+        enrich, "save_detections",
+        lambda engine, results, processed, fresh, version: saved.append([i["message_id"] for i in processed])
+    )
+
+    totals = enrich.enrich_images(commit_every=2)
+
+    # Every committed chunk is durable on its own; the tail is flushed at the end
+    assert saved == [[0, 1], [2, 3], [4]]
+    assert totals == {"images": 5, "inferred": 5}
+
+
+def test_prefilter_skips_tiny_images_and_records_them_without_detections(tmp_path):
+    tiny = tmp_path / "tiny.png"
+    Image.new("RGB", (16, 16)).save(tiny)
+    messages = make_messages(tmp_path, 1) + [{"message_id": 7, "file_path": str(tiny), "channel": "chan"}]
+    model = FakeModel()
+
+    detections, processed, fresh = enrich.run_enrichment(messages, model)
+
+    assert model.batch_sizes == [1]
+    assert [(i["message_id"], i.get("prefiltered")) for i in processed] == [(0, None), (7, "too small")]
+    assert [d["message_id"] for d in detections] == [0]
+
+
+def test_prefilter_can_skip_flat_graphics(tmp_path, monkeypatch):
+    monkeypatch.setattr(enrich, "MAX_GRAPHIC_COLORS", 16)
+    graphic = tmp_path / "banner.png"
+    Image.new("RGB", (200, 100), color=(255, 255, 255)).save(graphic)
+    photo = tmp_path / "photo.png"
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (100, 200, 3), dtype=np.uint8)).save(photo)
+
+    assert enrich.decode_image({"file_path": str(graphic)})[0]["prefiltered"] == "graphic"
+    assert enrich.decode_image({"file_path": str(photo)})[1] is not None
+
+
+def test_large_images_are_downsized_and_boxes_mapped_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(enrich, "IMAGE_SIZE", 320)
+    path = tmp_path / "large.jpg"
+    Image.new("RGB", (1280, 960), color=(10, 120, 200)).save(path)
+    message = {"message_id": 1, "file_path": str(path), "channel": "chan"}
+
+    item, image = enrich.decode_image(message)
+    assert image.size == (320, 240)
+    assert item["scale"] == (4.0, 4.0)
+
+    detections, _, _ = enrich.run_enrichment([message], FakeModel())
+    assert [(d["x1"], d["y1"], d["x2"], d["y2"]) for d in detections] == [(4.0, 4.0, 12.0, 12.0)]
+
+
+def test_model_version_names_the_inference_mode(tmp_path):
+    weights = tmp_path / "yolov8n.pt"
+    weights.write_bytes(b"weights")
+
+    default = enrich.get_model_version(str(weights), "torch", False, 640)
+    assert default.startswith("yolov8n.pt:") and default.endswith("+torch@640")
+    baseline = default[:-len("+torch@640")]
+    assert "+" not in baseline  # the form used before decode-time downscaling, so those images re-run
+    assert enrich.get_model_version(str(weights), "openvino", True, 640) == f"{baseline}+openvino-int8@640"
+    assert enrich.get_model_version(str(weights), "torch", False, 416) == f"{baseline}+torch@416"
+
+
+def test_export_model_reuses_the_cached_export(tmp_path, monkeypatch):
+    monkeypatch.setattr(enrich, "MODEL_CACHE_DIR", str(tmp_path / "models"))
+    weights = tmp_path / "yolov8n.pt"
+    weights.write_bytes(b"weights")
+    cached = enrich.export_path("onnx", False, 640, str(weights))
+    assert cached.startswith(str(tmp_path / "models")) and cached.endswith("-onnx-640.onnx")
+    os.makedirs(os.path.dirname(cached))
+    with open(cached, "wb") as f:
+        f.write(b"onnx")
+
+    # ultralytics is not imported when the export already exists
+    assert enrich.export_model("onnx", False, 640, str(weights)) == cached
+    assert enrich.export_model("torch", False, 640, str(weights)) == str(weights)
+    with pytest.raises(ValueError):
+        enrich.export_model("torch", True, 640, str(weights))
@@ -0,0 +1,69 @@
+# tests/test_enrich_queue.py
+import os
+import sys
+from types import SimpleNamespace
+
+from PIL import Image
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+import src.enrich as enrich
+import src.enrich_queue as enrich_queue
+from benchmarks.synthetic import ConstantTimeModel
+
+
+def make_items(tmp_path, count):
+    items = []
+    for i in range(count):
+        path = tmp_path / f"img_{i}.jpg"
+        Image.new("RGB", (64, 64), color=(i * 50, 100, 200)).save(path)
+        items.append({"message_id": i, "file_path": str(path), "channel": "chan"})
+    return items
+
+
+def test_process_batch_completes_enriched_items_and_fails_the_rest(tmp_path, monkeypatch):
+    items = make_items(tmp_path, 2)
+    items.append({"message_id": 5, "file_path": str(tmp_path / "gone.jpg"), "channel": "chan"})
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not a jpeg")
+    items.append({"message_id": 6, "file_path": str(broken), "channel": "chan"})
+    completed, failed = [], []
+    monkeypatch.setattr(enrich, "lookup_cached", lambda engine, version, hashes: {})
+    monkeypatch.setattr(
+        enrich_queue, "complete",
+        lambda engine, token, results, processed, fresh, version: completed.append(
+            (token, [i["message_id"] for i in processed], len(results))) or len(processed)
+    )
+    monkeypatch.setattr(
+        enrich_queue, "fail",
+        lambda engine, token, failed_items, error: failed.append(
+            ([i["message_id"] for i in failed_items], error)) or (len(failed_items), 0)
+    )
+
+    assert enrich_queue.process_batch(None, "t1", items, ConstantTimeModel(), "v1") == (2, 2, 0)
+    assert completed == [("t1", [0, 1], 2)]
+    assert failed == [([5], "file not found"), ([6], "image could not be decoded or inferred")]
+
+
+def test_worker_drains_claims_until_the_queue_is_empty(monkeypatch):
+    batches = [[{"message_id": 1}], [{"message_id": 2}, {"message_id": 3}], []]
+    processed, models = [], []
+    monkeypatch.setattr(enrich, "get_engine", lambda: SimpleNamespace(dispose=lambda: None))
+    monkeypatch.setattr(enrich, "get_model_version", lambda: "v1")
+    monkeypatch.setattr(enrich, "load_model", lambda: models.append(1) or "model")
+    monkeypatch.setattr(enrich_queue, "ensure_queue", lambda engine: None)
+    monkeypatch.setattr(enrich_queue, "enqueue", lambda engine, version, channels: 3)
+    monkeypatch.setattr(enrich_queue, "queue_depths", lambda engine: {})
+    monkeypatch.setattr(enrich_queue, "claim",
+                        lambda engine, owner, version, channels, limit: ("token", batches.pop(0)))
+    monkeypatch.setattr(enrich_queue, "process_batch",
+                        lambda engine, token, items, model, version: processed.append(len(items)) or (len(items), 0, 0))
+
+    totals = enrich_queue.run_worker(["chan"], worker_id="w1")
+
+    assert processed == [1, 2]
+    assert models == [1]  # loaded once, on the first claim
+    assert totals == {"claimed": 3, "done": 3, "retried": 0, "dead": 0}
@@ -0,0 +1,90 @@
+# tests/test_export.py
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+from datetime import date, datetime
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+from src.api import crud
+from src.api.export import csv_chunks, ndjson_chunks
+
+ROWS = [
+    {"message_id": 1, "channel": "a", "message_date": datetime(2025, 7, 15, 8), "message_text": 'say "hi"\nnow'},
+    {"message_id": 2, "channel": "a", "message_date": date(2025, 7, 16), "message_text": None},
+]
+
+
+async def as_pages(*pages):
+    for page in pages:
+        yield page
+
+
+async def collect(chunks):
+    return b"".join([chunk async for chunk in chunks]).decode("utf-8")
+
+
+def test_ndjson_chunks_write_one_object_per_line():
+    chunks = asyncio.run(collect(ndjson_chunks(as_pages(ROWS[:1], ROWS[1:]), chunk_bytes=1)))
+
+    assert [json.loads(line) for line in chunks.splitlines()] == [
+        dict(ROWS[0], message_date="2025-07-15T08:00:00"),
+        dict(ROWS[1], message_date="2025-07-16"),
+    ]
+
+
+def test_csv_chunks_write_header_and_quoted_rows():
+    columns = ["message_id", "channel", "message_date", "message_text"]
+    body = asyncio.run(collect(csv_chunks(as_pages(ROWS), columns)))
+
+    assert list(csv.reader(io.StringIO(body))) == [
+        columns,
+        ["1", "a", "2025-07-15T08:00:00", 'say "hi"\nnow'],
+        ["2", "a", "2025-07-16", ""],
+    ]
+
+
+class FakeStream:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def __aiter__(self):
+        async def rows():
+            for row in self.rows:
+                yield row
+        return rows()
+
+
+class FakeSession:
+    """Serves a sorted table through keyset pages, recording each page's parameters."""
+
+    def __init__(self, table):
+        self.table = table
+        self.calls = []
+
+    async def stream(self, sql, params):
+        self.calls.append(params)
+        after = (params.get("after_channel"), params.get("after_id"))
+        rows = [r for r in self.table if params.get("after_channel") is None or (r["channel"], r["message_id"]) > after]
+        return FakeStream(rows[:params["page_size"]])
+
+
+def test_export_messages_walks_keyset_pages_until_empty():
+    table = [{"channel": c, "message_id": i} for c in ("a", "b") for i in (1, 2, 3)]
+    db = FakeSession(table)
+
+    async def run():
+        return [page async for page in crud.export_messages(db, page_size=4)]
+
+    pages = asyncio.run(run())
+    assert [len(page) for page in pages] == [4, 2]
+    assert [(c.get("after_channel"), c.get("after_id")) for c in db.calls] == [(None, None), ("b", 1), ("b", 3)]
@@ -0,0 +1,73 @@
+# tests/test_extract.py
+import os
+import random
+import sys
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+import src.extract as extract
+
+
+def make_index():
+    return extract.ProductIndex([
+        {"product": "Paracetamol", "category": "analgesic", "aliases": "panadol|ፓራሲታሞል"},
+        {"product": "Amoxicillin", "category": "antibiotic", "aliases": ""},
+        {"product": "Amoxicillin-Clavulanate", "category": "antibiotic", "aliases": "amoxicillin clavulanate"},
+        {"product": "Face Mask", "category": "hygiene", "aliases": "face masks|ማስክ"},
+    ], "test")
+
+
+def message(message_id, text):
+    return {"message_id": message_id, "channel": "chan", "date": None, "text": text}
+
+
+def test_automaton_finds_every_occurrence_like_a_naive_scan():
+    terms = ["he", "she", "his", "hers", "a", "aab", "ab"]
+    automaton = extract.Automaton()
+    for term in terms:
+        automaton.add_word(term, term)
+    automaton.make_automaton()
+    rng = random.Random(0)
+    for _ in range(200):
+        text = "".join(rng.choice("ahersb ") for _ in range(30))
+        expected = sorted((i + len(t) - 1, t) for t in terms for i in range(len(text)) if text.startswith(t, i))
+        assert sorted(automaton.iter(text)) == expected
+
+
+def test_mentions_take_the_longest_whole_word_match_and_the_price_after_it():
+    messages = [
+        message(1, "AMOXICILLIN  Clavulanate 1,250.50 ETB\nParacetamol500mg - 50 birr, amoxicillin 2k br"),
+        message(2, "ፓራሲታሞል በ 2 ሺ ብር አለ፤ ማስክ ዋጋ፦ 30"),
+        message(3, "panadolx and paracetamology, face masks $4; panadol"),
+        message(4, None),
+        message(5, "Price 90 birr before any product: amoxicillin"),
+    ]
+
+    rows = extract.extract_mentions(messages, make_index())
+
+    assert [(r["message_id"], r["product"], r["matched_text"], r["price"], r["currency"]) for r in rows] == [
+        (1, "Amoxicillin-Clavulanate", "amoxicillin clavulanate", 1250.5, "ETB"),
+        (1, "Paracetamol", "paracetamol", 50.0, "ETB"),
+        (1, "Amoxicillin", "amoxicillin", 2000.0, "ETB"),
+        (2, "Paracetamol", "ፓራሲታሞል", 2000.0, "ETB"),
+        (2, "Face Mask", "ማስክ", 30.0, "ETB"),
+        (3, "Face Mask", "face masks", 4.0, "USD"),
+        (3, "Paracetamol", "panadol", None, None),
+        (5, "Amoxicillin", "amoxicillin", None, None),
+    ]
+    assert rows[0]["category"] == "antibiotic"
+
+
+def test_dictionary_version_follows_the_file(tmp_path):
+    path = tmp_path / "products.csv"
+    path.write_text("product,category,aliases\nParacetamol,analgesic,panadol\n", encoding="utf-8")
+    index = extract.load_index(str(path))
+
+    assert index.terms == 2
+    assert index.version == extract.dictionary_version(str(path))
+
+    path.write_text("product,category,aliases\nParacetamol,analgesic,panadol|acetaminophen\n", encoding="utf-8")
+    assert extract.dictionary_version(str(path)) != index.version
@@ -0,0 +1,77 @@
+# tests/test_load.py
+import os
+import sys
+import csv
+import gzip
+import json
+from datetime import datetime
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+from src.load import iter_file_messages, iter_raw_files, parse_message, rows_to_csv
+
+
+def test_iter_file_messages_reads_jsonl_and_gzip(tmp_path):
+    records = [{"id": 1, "text": "a"}, {"id": 2, "text": "b"}]
+    plain = tmp_path / "chan.jsonl"
+    plain.write_text("\n".join(json.dumps(r) for r in records) + "\nnot json\n", encoding="utf-8")
+    packed = tmp_path / "chan.jsonl.gz"
+    with gzip.open(packed, "wt", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r) + "\n" for r in records))
+
+    for path in (plain, packed):
+        assert list(iter_file_messages(str(path))) == [("chan", records[0]), ("chan", records[1])]
+
+
+def test_iter_file_messages_reads_legacy_json(tmp_path):
+    legacy = tmp_path / "chan" / "7.json"
+    legacy.parent.mkdir()
+    legacy.write_text(json.dumps({"id": 7, "text": "old"}), encoding="utf-8")
+
+    assert list(iter_file_messages(str(legacy))) == [("chan", {"id": 7, "text": "old"})]
+
+
+def test_iter_raw_files_filters_by_channel(tmp_path):
+    day = tmp_path / "2025-07-15"
+    (day / "legacy_chan").mkdir(parents=True)
+    for path in (day / "a.jsonl", day / "b.jsonl.gz", day / "legacy_chan" / "1.json"):
+        path.write_text("", encoding="utf-8")
+
+    assert len(list(iter_raw_files(str(tmp_path)))) == 3
+    assert [os.path.basename(p) for p in iter_raw_files(str(tmp_path), {"b", "legacy_chan"})] == ["b.jsonl.gz", "1.json"]
+
+
+def test_iter_raw_files_yields_older_days_first(tmp_path):
+    for day in ("2025-07-16", "2025-07-15", "2025-07-17"):
+        (tmp_path / day).mkdir()
+        (tmp_path / day / "chan.jsonl").write_text("", encoding="utf-8")
+
+    days = [os.path.basename(os.path.dirname(p)) for p in iter_raw_files(str(tmp_path))]
+    assert days == ["2025-07-15", "2025-07-16", "2025-07-17"]
+
+
+def test_parse_message_and_csv_round_trip(tmp_path):
+    row = parse_message("chan", {"id": 3, "date": "2025-07-15 08:00:00+00:00", "text": 'say "hi"\nnow'},
+                        media_root=str(tmp_path))
+    assert row[0] == 3 and row[3] == "chan" and row[4] is None and row[5] is None
+    assert parse_message("chan", {"id": 4, "date": "not a date"}) is None
+    stored = parse_message("chan", {"id": 5, "date": "2025-07-15 08:00:00+00:00",
+                                    "file_path": "blobs/ab/abc.jpg", "media_hash": "abc"})
+    assert stored[4:] == ("blobs/ab/abc.jpg", "abc")
+
+    parsed = list(csv.reader(rows_to_csv([row, stored])))
+    assert parsed == [["3", "2025-07-15T08:00:00", 'say "hi"\nnow', "chan", "", ""],
+                      ["5", "2025-07-15T08:00:00", "", "chan", "blobs/ab/abc.jpg", "abc"]]
+
+
+def test_parse_message_normalizes_dates_to_naive_utc():
+    # Both instants are in July in UTC, whatever the writer's or the session's zone
+    in_addis = parse_message("chan", {"id": 1, "date": "2025-08-01T02:30:00+03:00"})
+    in_utc = parse_message("chan", {"id": 2, "date": "2025-07-31 23:30:00+00:00"})
+    legacy = parse_message("chan", {"id": 3, "date": "2025-07-31T23:30:00"})
+
+    assert in_addis[1] == in_utc[1] == legacy[1] == datetime(2025, 7, 31, 23, 30)
+    assert in_addis[1].tzinfo is None
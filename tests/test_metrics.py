@@ -0,0 +1,64 @@
+# tests/test_metrics.py
+import asyncio
+import os
+import sys
+
+import pytest
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+from src import metrics
+
+
+def test_null_metric_accepts_every_call():
+    metric = metrics._NullMetric()
+    metric.labels(stage="x").inc()
+    metric.observe(1.0)
+    metric.set(2)
+    with metric.time():
+        pass
+
+
+def test_timed_query_records_latency_per_function():
+    pytest.importorskip("prometheus_client")
+
+    @metrics.timed_query
+    async def get_things():
+        return "things"
+
+    assert asyncio.run(get_things()) == "things"
+    count = metrics.REGISTRY.get_sample_value("api_db_query_seconds_count", {"function": "get_things"})
+    assert count == 1
+    body, content_type = metrics.exposition()
+    assert b'api_db_query_seconds_bucket{function="get_things"' in body
+    assert content_type.startswith("text/plain")
+
+
+def test_stage_profiles_when_opted_in_and_pushes(tmp_path, monkeypatch):
+    pushed = []
+    monkeypatch.setattr(metrics, "PROFILE_STAGES", {"load"})
+    monkeypatch.setattr(metrics, "PROFILE_MODE", "cprofile")
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "push", lambda stage, **grouping: pushed.append((stage, grouping)))
+
+    with metrics.stage("load", channels="a"):
+        sum(range(1000))
+    with metrics.stage("enrich"):
+        pass
+
+    assert [p.suffix for p in tmp_path.iterdir()] == [".prof"]
+    assert pushed == [("load", {"channels": "a"}), ("enrich", {})]
+
+
+def test_stage_pushes_even_when_the_stage_fails(monkeypatch):
+    pushed = []
+    monkeypatch.setattr(metrics, "push", lambda stage, **grouping: pushed.append(stage))
+
+    with pytest.raises(RuntimeError):
+        with metrics.stage("scrape"):
+            raise RuntimeError("boom")
+
+    assert pushed == ["scrape"]
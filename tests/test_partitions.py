@@ -0,0 +1,50 @@
+# tests/test_partitions.py
+import os
+import sys
+from datetime import date, datetime
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+from src.partitions import add_months, ensure_partitions, month_of, partition_month, partition_name
+
+
+class RecordingCursor:
+    def __init__(self, existing=()):
+        self.existing = set(existing)
+        self.statements = []
+        self.result = None
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+        if sql.startswith("SELECT to_regclass"):
+            self.result = (params[0] if params[0] in self.existing else None,)
+
+    def fetchone(self):
+        return self.result
+
+
+def test_partition_names_round_trip_across_year_boundaries():
+    month = month_of(datetime(2024, 12, 31, 23, 59))
+
+    assert month == date(2024, 12, 1)
+    assert add_months(month, 1) == date(2025, 1, 1)
+    assert add_months(month, -12) == date(2023, 12, 1)
+    assert partition_name("raw.telegram_messages", month) == "raw.telegram_messages_p2024_12"
+    assert partition_month("raw.telegram_messages_p2024_12") == month
+    assert partition_month("telegram_messages_undated") is None
+
+
+def test_ensure_partitions_creates_each_missing_month_once():
+    cursor = RecordingCursor(existing={"raw.t_p2024_02"})
+
+    ensure_partitions(cursor, "raw.t", [datetime(2024, 1, 5), datetime(2024, 1, 20),
+                                        datetime(2024, 2, 1), None, datetime(2024, 3, 31)])
+
+    created = [(sql.split()[5], params) for sql, params in cursor.statements if sql.startswith("CREATE")]
+    assert created == [
+        ("raw.t_p2024_01", (date(2024, 1, 1), date(2024, 2, 1))),
+        ("raw.t_p2024_03", (date(2024, 3, 1), date(2024, 4, 1))),
+    ]
@@ -0,0 +1,20 @@
+# tests/test_pipeline.py
+import os
+import re
+import sys
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+from pipeline import mapping_key
+
+
+def test_mapping_keys_are_valid_and_distinct_for_similar_channel_names():
+    channels = ["a.b", "a_b", "a-b", "@lobelia4cosmetics", "tikvahpharma"]
+    keys = [mapping_key(channel) for channel in channels]
+
+    assert all(re.fullmatch(r"[A-Za-z0-9_]+", key) for key in keys)
+    assert len(set(keys)) == len(channels)
+    assert mapping_key("a.b") == mapping_key("a.b")
@@ -0,0 +1,40 @@
+# tests/test_render.py
+import os
+import sys
+
+from PIL import Image
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+from src.api.render import RenderCache, cache_key, draw_detections
+
+DETECTION = {"class_name": "pill", "confidence": 0.9, "x1": 1.0, "y1": 1.0, "x2": 6.0, "y2": 6.0}
+
+
+def test_cache_key_changes_with_detections():
+    moved = dict(DETECTION, x2=7.0)
+    assert cache_key("chan", 1, [DETECTION]) == cache_key("chan", 1, [dict(DETECTION)])
+    assert cache_key("chan", 1, [DETECTION]) != cache_key("chan", 1, [moved])
+
+
+def test_render_cache_evicts_least_recently_used(tmp_path):
+    source = tmp_path / "source.jpg"
+    Image.new("RGB", (64, 64), color=(10, 120, 200)).save(source)
+    image = draw_detections(str(source), [DETECTION, dict(DETECTION, x1=None)])
+
+    probe = RenderCache(root=str(tmp_path / "probe"))
+    entry_size = os.path.getsize(probe.put("probe", image))
+
+    # Room for one entry but not two
+    cache = RenderCache(root=str(tmp_path / "cache"), max_bytes=int(entry_size * 1.5))
+    first = cache.put("a", image)
+    assert cache.get("a") == first
+    os.utime(first, (1, 1))
+
+    second = cache.put("b", image)
+    assert cache.get("a") is None
+    assert cache.get("b") == second
+    assert cache.get("missing") is None
@@ -1,7 +1,11 @@
+import asyncio
 import os
+import gzip
+import hashlib
 import json
 import pytest
-from unittest.mock import Mock, patch
+from datetime import datetime
+from unittest.mock import AsyncMock, Mock, patch
 from src.scrape import scrape_channel, client  # Adjust import based on your module structure
 
 # Mock data for testing
@@ -12,7 +16,14 @@ MOCK_MESSAGE_DATA = {
     "text": "Test message",
     "channel": MOCK_CHANNEL
 }
-MOCK_MEDIA_PATH = "mock_image.jpg"
+MOCK_MEDIA_BYTES = b"\xff\xd8"
+MOCK_MEDIA_HASH = hashlib.sha256(MOCK_MEDIA_BYTES).hexdigest()
+
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
 
 @pytest.fixture
 def mock_client():
@@ -20,55 +31,322 @@ def mock_client():
     mock_client = Mock()
     mock_entity = Mock()
     mock_entity.id = 123
-    mock_client.get_entity.return_value = mock_entity
+    mock_client.get_entity = AsyncMock(return_value=mock_entity)
 
-    async def mock_iter_messages(entity, limit):
+    async def mock_iter_messages(entity, **kwargs):
         yield Mock(id=MOCK_MESSAGE_DATA["id"], date=MOCK_MESSAGE_DATA["date"], text=MOCK_MESSAGE_DATA["text"],
-                   channel=MOCK_CHANNEL, photo=True, download_media=Mock(return_value=MOCK_MEDIA_PATH))
+                   channel=MOCK_CHANNEL, photo=Mock(id=555))
     mock_client.iter_messages = Mock(side_effect=mock_iter_messages)
 
+    async def mock_download_media(message, file):
+        with open(file, 'wb') as f:
+            f.write(MOCK_MEDIA_BYTES)
+        return file
+    mock_client.download_media = AsyncMock(side_effect=mock_download_media)
+
     return mock_client
 
 @pytest.mark.asyncio
-async def test_scrape_channel_creates_json_file(mock_client, tmp_path):
+async def test_scrape_channel_writes_jsonl(mock_client, tmp_path):
     # Set up temporary directory for testing
     os.chdir(tmp_path)
-    date_str = "2025-07-15"
-    messages_dir = f"data/raw/telegram_messages/{date_str}/{MOCK_CHANNEL}"
-    media_dir = f"data/raw/media/{date_str}/{MOCK_CHANNEL}"
+    date_str = datetime.now().strftime('%Y-%m-%d')
 
     # Patch the client and run the function
     with patch('src.scrape.client', new=mock_client):
         await scrape_channel(MOCK_CHANNEL)
 
-    # Verify JSON file is created
-    json_file = os.path.join(messages_dir, f"{MOCK_MESSAGE_DATA['id']}.json")
-    assert os.path.exists(json_file)
-    with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    assert data == MOCK_MESSAGE_DATA
+    # Verify the message is appended to the channel's daily JSONL file
+    jsonl_file = f"data/raw/telegram_messages/{date_str}/{MOCK_CHANNEL}.jsonl"
+    assert os.path.exists(jsonl_file)
+    media_file = f"data/raw/media/blobs/{MOCK_MEDIA_HASH[:2]}/{MOCK_MEDIA_HASH}.jpg"
+    assert read_jsonl(jsonl_file) == [dict(MOCK_MESSAGE_DATA, file_path=media_file, media_hash=MOCK_MEDIA_HASH)]
 
-    # Verify media file is created
-    media_file = os.path.join(media_dir, f"{MOCK_CHANNEL}_{MOCK_MESSAGE_DATA['id']}.jpg")
+    # Verify media is stored under its content hash
     assert os.path.exists(media_file)
 
 @pytest.mark.asyncio
 async def test_scrape_channel_no_media(mock_client, tmp_path):
     # Modify mock to exclude media
-    mock_client.iter_messages = Mock(side_effect=lambda entity, limit: [Mock(id=2, date="2025-07-15 08:01:00+00:00",
-                                                                           text="No media message", channel=MOCK_CHANNEL)])
+    async def mock_iter_messages(entity, **kwargs):
+        yield Mock(id=2, date="2025-07-15 08:01:00+00:00", text="No media message",
+                   channel=MOCK_CHANNEL, photo=None, document=None)
+    mock_client.iter_messages = Mock(side_effect=mock_iter_messages)
+
+    os.chdir(tmp_path)
+    date_str = datetime.now().strftime('%Y-%m-%d')
+
+    with patch('src.scrape.client', new=mock_client):
+        await scrape_channel(MOCK_CHANNEL)
+
+    records = read_jsonl(f"data/raw/telegram_messages/{date_str}/{MOCK_CHANNEL}.jsonl")
+    assert len(records) == 1
+    assert records[0]["id"] == 2
+    assert records[0]["text"] == "No media message"
+    assert records[0]["file_path"] is None
+    mock_client.download_media.assert_not_called()
 
+
+@pytest.mark.asyncio
+async def test_scrape_channel_stores_duplicate_media_once(mock_client, tmp_path):
+    async def mock_iter_messages(entity, **kwargs):
+        # A forward of a known photo, a re-upload of the same bytes, and a PDF
+        for message_id, photo_id in ((1, 555), (2, 555), (3, 777)):
+            yield Mock(id=message_id, date="2025-07-15 08:00:00+00:00", text=None, photo=Mock(id=photo_id))
+        yield Mock(id=4, date="2025-07-15 08:00:00+00:00", text=None, photo=None,
+                   document=Mock(id=9, mime_type="application/pdf"))
+    mock_client.iter_messages = Mock(side_effect=mock_iter_messages)
+    os.chdir(tmp_path)
+
+    # One download slot keeps the downloads in message order
+    with patch('src.scrape.client', new=mock_client):
+        stats = await scrape_channel(MOCK_CHANNEL, download_slots=asyncio.Semaphore(1))
+
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    records = read_jsonl(f"data/raw/telegram_messages/{date_str}/{MOCK_CHANNEL}.jsonl")
+    assert mock_client.download_media.await_count == 2
+    assert stats['media'] == 2 and stats['media_skipped'] == 2
+    assert {r["media_hash"] for r in records if r["id"] != 4} == {MOCK_MEDIA_HASH}
+    assert [r["file_path"] for r in records if r["id"] == 4] == [None]
+    assert len(os.listdir(f"data/raw/media/blobs/{MOCK_MEDIA_HASH[:2]}")) == 1
+    assert os.listdir("data/raw/media/incoming") == []
+
+
+@pytest.mark.asyncio
+async def test_scrape_channel_downloads_only_images_enrichment_reads(mock_client, tmp_path):
+    async def mock_iter_messages(entity, **kwargs):
+        for message_id, mime_type in ((1, "image/png"), (2, "image/webp"), (3, "image/gif")):
+            yield Mock(id=message_id, date="2025-07-15 08:00:00+00:00", text=None, photo=None,
+                       document=Mock(id=message_id, mime_type=mime_type))
+    mock_client.iter_messages = Mock(side_effect=mock_iter_messages)
     os.chdir(tmp_path)
-    date_str = "2025-07-15"
-    messages_dir = f"data/raw/telegram_messages/{date_str}/{MOCK_CHANNEL}"
 
     with patch('src.scrape.client', new=mock_client):
         await scrape_channel(MOCK_CHANNEL)
 
-    json_file = os.path.join(messages_dir, "2.json")
-    assert os.path.exists(json_file)
-    with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    assert data["id"] == 2
-    assert data["text"] == "No media message"
-    assert not os.path.exists(f"data/raw/media/{date_str}/{MOCK_CHANNEL}/2.jpg")
\ No newline at end of file
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    records = read_jsonl(f"data/raw/telegram_messages/{date_str}/{MOCK_CHANNEL}.jsonl")
+    assert mock_client.download_media.await_count == 1
+    assert {r["id"]: r["file_path"] for r in records} == {
+        1: f"data/raw/media/blobs/{MOCK_MEDIA_HASH[:2]}/{MOCK_MEDIA_HASH}.png", 2: None, 3: None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_scrape_channel_keeps_message_when_media_download_fails(mock_client, tmp_path):
+    mock_client.download_media = AsyncMock(side_effect=ConnectionError("connection reset"))
+    os.chdir(tmp_path)
+
+    with patch('src.scrape.client', new=mock_client):
+        await scrape_channel(MOCK_CHANNEL)
+
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    records = read_jsonl(f"data/raw/telegram_messages/{date_str}/{MOCK_CHANNEL}.jsonl")
+    assert records == [dict(MOCK_MESSAGE_DATA, file_path=None, media_hash=None)]
+
+
+def test_jsonl_sink_appends_compressed_runs(tmp_path):
+    from src.scrape import JsonlSink
+
+    for message_id in (1, 2):
+        sink = JsonlSink(root=str(tmp_path), compress=True)
+        sink.write({"id": message_id, "channel": MOCK_CHANNEL})
+        sink.close()
+
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    with gzip.open(tmp_path / date_str / f"{MOCK_CHANNEL}.jsonl.gz", 'rt', encoding='utf-8') as f:
+        assert [json.loads(line)["id"] for line in f] == [1, 2]
+
+@pytest.mark.asyncio
+async def test_call_with_flood_wait_retries_after_backoff(monkeypatch):
+    from telethon import errors
+    import src.scrape as scrape
+
+    monkeypatch.setattr(scrape, "_flood_resume_at", 0.0)
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(scrape.asyncio, "sleep", fake_sleep)
+
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise errors.FloodWaitError(request=None, capture=2)
+        return "ok"
+
+    assert await scrape.call_with_flood_wait(flaky) == "ok"
+    assert len(calls) == 2
+    assert slept and slept[0] > 0
+
+
+def test_checkpoint_store_persists_across_instances(tmp_path):
+    from src.scrape import CheckpointStore
+
+    path = tmp_path / "state" / "checkpoints.json"
+    store = CheckpointStore(str(path))
+    assert store.get("chan") == {}
+
+    store.update("chan", last_id=42, oldest_id=7)
+    store.update("chan", backfill_done=True)
+
+    reloaded = CheckpointStore(str(path))
+    assert reloaded.get("chan") == {"last_id": 42, "oldest_id": 7, "backfill_done": True}
+
+
+def test_checkpoint_store_keeps_updates_from_other_writers(tmp_path):
+    from src.scrape import CheckpointStore
+
+    path = str(tmp_path / "checkpoints.json")
+    first = CheckpointStore(path)
+    second = CheckpointStore(path)  # e.g. another channel's scraper process
+
+    first.update("a", last_id=1)
+    second.update("b", last_id=2)
+
+    assert CheckpointStore(path).get("a") == {"last_id": 1}
+    assert CheckpointStore(path).get("b") == {"last_id": 2}
+
+
+def recording_ingestor(tmp_path, fail_first=0, poison=(), **kwargs):
+    """A LiveIngestor whose merges are recorded instead of sent to Postgres."""
+    import psycopg2
+    from src.scrape import CheckpointStore, JsonlSink, LiveIngestor, MediaStore
+
+    class Ingestor(LiveIngestor):
+        def merge_rows(self, rows):
+            if len(self.failures) < fail_first:
+                self.failures.append(rows)
+                raise psycopg2.OperationalError("database is down")
+            if any(row[0] in poison for row in rows):
+                self.failures.append(rows)
+                raise psycopg2.DataError("value out of range")
+            self.merged.append([row[0] for row in rows])
+            return len(rows)
+
+    ingestor = Ingestor(
+        sink=JsonlSink(root=str(tmp_path / "raw")),
+        media_store=MediaStore(root=str(tmp_path / "media")),
+        checkpoints=CheckpointStore(str(tmp_path / "checkpoints.json")),
+        **kwargs,
+    )
+    ingestor.merged, ingestor.failures = [], []
+    return ingestor
+
+
+def live_message(message_id):
+    return Mock(id=message_id, date="2025-07-15 08:00:00+00:00", text=f"msg {message_id}", photo=None, document=None)
+
+
+@pytest.mark.asyncio
+async def test_live_ingestor_flushes_on_size_and_time(tmp_path):
+    ingestor = recording_ingestor(tmp_path, batch_size=2, flush_seconds=0.05)
+    ingestor.checkpoints.update(MOCK_CHANNEL, last_id=1)
+
+    async with ingestor:
+        for message_id in (2, 3, 4):
+            await ingestor.put(MOCK_CHANNEL, live_message(message_id))
+        await asyncio.sleep(0.2)
+        assert ingestor.merged == [[2, 3], [4]]  # a full batch, then the time threshold
+
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    records = read_jsonl(tmp_path / "raw" / date_str / f"{MOCK_CHANNEL}.jsonl")
+    assert [r["id"] for r in records] == [2, 3, 4]
+    assert ingestor.checkpoints.get(MOCK_CHANNEL) == {"last_id": 4}
+
+
+@pytest.mark.asyncio
+async def test_live_ingestor_applies_backpressure_while_the_database_is_down(tmp_path, monkeypatch):
+    import src.scrape as scrape
+
+    real_sleep = asyncio.sleep
+    monkeypatch.setattr(scrape.asyncio, "sleep", lambda seconds: real_sleep(0.05))
+    ingestor = recording_ingestor(tmp_path, fail_first=2, batch_size=1, queue_size=1)
+
+    async with ingestor:
+        await ingestor.put(MOCK_CHANNEL, live_message(1))  # taken by the consumer, which then retries
+        await ingestor.put(MOCK_CHANNEL, live_message(2))  # fills the buffer
+        blocked = asyncio.create_task(ingestor.put(MOCK_CHANNEL, live_message(3)))
+        await real_sleep(0.02)
+        assert not blocked.done()
+        await blocked
+
+    assert len(ingestor.failures) == 2
+    assert ingestor.merged == [[1], [2], [3]]
+    # Never batch-scraped, so no checkpoint is created for it
+    assert ingestor.checkpoints.get(MOCK_CHANNEL) == {}
+
+
+@pytest.mark.asyncio
+async def test_live_ingestor_isolates_rows_the_database_rejects(tmp_path):
+    ingestor = recording_ingestor(tmp_path, poison={2}, batch_size=3, flush_seconds=0.05)
+    ingestor.checkpoints.update(MOCK_CHANNEL, last_id=1)
+
+    async with ingestor:
+        for message_id in (2, 3, 4):
+            await ingestor.put(MOCK_CHANNEL, live_message(message_id))
+        await asyncio.sleep(0.02)
+        await ingestor.put(MOCK_CHANNEL, live_message(5))  # the listener keeps ingesting
+
+    # The batch fails once, then every row but the bad one is merged on its own
+    assert [[row[0] for row in rows] for rows in ingestor.failures] == [[2, 3, 4], [2]]
+    assert ingestor.merged == [[3], [4], [5]]
+    assert ingestor.stats['rejected'] == 1
+    # The rejected message is still in the JSONL files for the batch loader
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    records = read_jsonl(tmp_path / "raw" / date_str / f"{MOCK_CHANNEL}.jsonl")
+    assert [r["id"] for r in records] == [2, 3, 4, 5]
+    assert ingestor.checkpoints.get(MOCK_CHANNEL) == {"last_id": 5}
+
+
+def test_session_for_gives_each_channel_a_consistent_copy(tmp_path, monkeypatch):
+    import sqlite3
+    from concurrent.futures import ThreadPoolExecutor
+    import src.scrape as scrape
+
+    monkeypatch.chdir(tmp_path)
+    base = sqlite3.connect("base.session")
+    base.execute("CREATE TABLE sessions (dc_id INTEGER, auth_key BLOB)")
+    base.execute("INSERT INTO sessions VALUES (2, x'00ff')")
+    base.commit()
+    monkeypatch.setattr(scrape, "session_name", "base")
+
+    channels = ["a.b", "a_b", "c", "d"]
+    with ThreadPoolExecutor(len(channels)) as pool:
+        paths = list(pool.map(scrape.session_for, channels))
+
+    assert len(set(paths)) == len(channels)
+    for path in paths:
+        with sqlite3.connect(f"{path}.session") as copy:
+            assert copy.execute("SELECT dc_id, auth_key FROM sessions").fetchall() == [(2, b"\x00\xff")]
+    assert sorted(os.listdir("sessions")) == [".lock"] + sorted(f"{c}.session" for c in channels)
+
+
+@pytest.mark.asyncio
+async def test_live_ingestor_holds_checkpoints_until_catch_up_is_merged(tmp_path):
+    from src.scrape import CheckpointStore
+
+    ingestor = recording_ingestor(tmp_path, batch_size=2, flush_seconds=10)
+    ingestor.checkpoints.update(MOCK_CHANNEL, last_id=500)
+    ingestor.hold_checkpoints([MOCK_CHANNEL])
+
+    async with ingestor:
+        await ingestor.put(MOCK_CHANNEL, live_message(501))   # catch-up
+        await ingestor.put(MOCK_CHANNEL, live_message(1000))  # live, arriving mid catch-up
+        await asyncio.sleep(0.05)
+        assert ingestor.merged == [[501, 1000]]
+        # A listener killed now must catch up from 500 again, or 502..999 would be lost
+        assert CheckpointStore(str(tmp_path / "checkpoints.json")).get(MOCK_CHANNEL) == {"last_id": 500}
+
+        await ingestor.put(MOCK_CHANNEL, live_message(502))   # rest of catch-up
+        await ingestor.release_checkpoints()
+        assert ingestor.merged == [[501, 1000], [502]]
+        assert CheckpointStore(str(tmp_path / "checkpoints.json")).get(MOCK_CHANNEL) == {"last_id": 1000}
+
+        await ingestor.put(MOCK_CHANNEL, live_message(1001))
+        await ingestor.put(MOCK_CHANNEL, live_message(1002))
+        await asyncio.sleep(0.05)
+    assert ingestor.checkpoints.get(MOCK_CHANNEL) == {"last_id": 1002}
@@ -0,0 +1,43 @@
+# tests/test_startup.py
+import os
+import sys
+
+import pytest
+
+# ------------------------------------------------------------------ #
+# Import project modules (add src to path)
+# ------------------------------------------------------------------ #
+sys.path.append(os.path.abspath(os.path.join(__file__, "..", "..")))
+
+from benchmarks.startup import measure
+
+# Import-time budgets in seconds, measured in a fresh interpreter.
+# Roughly 5x what a laptop needs; scale with IMPORT_BUDGET_SCALE on slow runners.
+IMPORT_BUDGETS = {
+    "src.api.main": 2.0,
+    "src.scrape": 1.0,
+    "src.load": 0.5,
+    "src.enrich": 1.0,
+    "src.enrich_queue": 1.0,
+    "src.archive": 0.5,
+    "src.extract": 0.5,
+}
+BUDGET_SCALE = float(os.getenv("IMPORT_BUDGET_SCALE", "1"))
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_BUDGETS))
+def test_import_is_fast_and_side_effect_free(module, tmp_path):
+    # Runs without DB/Telegram settings, so any connection attempt at import would fail
+    seconds = measure(f"import {module}", cwd=str(tmp_path))
+
+    assert seconds < IMPORT_BUDGETS[module] * BUDGET_SCALE, f"{module} took {seconds:.2f}s to import"
+    assert list(tmp_path.iterdir()) == [], "importing must not create files"
+
+
+def test_importing_enrich_does_not_load_heavy_dependencies(tmp_path):
+    # The child exits non-zero, failing measure(), if either module was imported
+    measure(
+        "import sys, src.enrich\n"
+        "assert 'ultralytics' not in sys.modules and 'pandas' not in sys.modules",
+        cwd=str(tmp_path),
+    )